@@ -0,0 +1,67 @@
+"""批量写入基准测试：对比逐个添加ORM对象后一次提交（原导入方式）与按批INSERT、每个文件有自己SAVEPOINT的写入耗时
+
+用法: python benchmarks/bench_bulk_insert.py [发票数]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy.orm import sessionmaker
+
+from corpus import builtin_texts, make_itinerary_text
+from models.database import Base, Invoice, Itinerary, create_sqlite_engine
+from services.invoice_store import insert_invoices, invoice_record
+from services.ocr_processor import OCRProcessor
+
+
+def make_records(count):
+    """与导入时相同的解析结果：每张发票带识别文本，行程单发票带行程明细"""
+    ocr = OCRProcessor(cache=False)
+    texts = list(builtin_texts().values()) + [make_itinerary_text(trips=5)]
+    parsed = [(text, ocr.parse_invoice_info(text), ocr.parse_itinerary_rows(text)) for text in texts]
+    records = []
+    for index in range(count):
+        text, info, rows = parsed[index % len(parsed)]
+        records.append(invoice_record({
+            'invoice_number': f"{info.get('invoice_number')}-{index}", 'pdf_path': f'/invoices/{index}.pdf',
+            'amount': info.get('amount'), 'tax_amount': info.get('tax_amount'), 'invoice_date': info.get('date'),
+            'invoice_type': info.get('type'), 'category': '交通费',
+        }, text, rows))
+    return records
+
+
+def orm_insert(db, records):
+    for record in records:
+        invoice = Invoice(**record['invoice'], recognized_text=record['recognized_text'])
+        db.add(invoice)
+        if record['itinerary_rows']:
+            db.flush()
+            db.add_all(Itinerary(invoice_id=invoice.id, **row) for row in record['itinerary_rows'])
+    db.commit()
+
+
+def bulk_insert(db, records):
+    insert_invoices(db, records)
+    db.commit()
+
+
+def main(count=1000):
+    records = make_records(count)
+    print(f"发票数: {count}，行程明细: {sum(len(record['itinerary_rows']) for record in records)}")
+    for name, write in (('逐个ORM对象', orm_insert), ('批量INSERT', bulk_insert)):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            engine = create_sqlite_engine(os.path.join(tmp_dir, 'bench.db'))
+            Base.metadata.create_all(bind=engine)
+            db = sessionmaker(bind=engine)()
+            start = time.perf_counter()
+            write(db, records)
+            elapsed = time.perf_counter() - start
+            assert db.query(Invoice).count() == count
+            db.close()
+            engine.dispose()
+        print(f"{name:<10}耗时: {elapsed:.2f}s  每张: {elapsed / count * 1e3:.2f}ms")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
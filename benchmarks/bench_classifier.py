@@ -0,0 +1,56 @@
+"""发票分类基准测试：对比逐个关键词 in 判断的旧实现与一次扫描的关键词自动机
+
+用法: python benchmarks/bench_classifier.py [重复次数]
+"""
+import sys
+import timeit
+
+from corpus import load_corpus, make_itinerary_text
+from legacy_ocr import LegacyOCRProcessor
+from services.invoice_classifier import DEFAULT_CLASSIFIER, DEFAULT_KEYWORD_TABLES, InvoiceClassifier
+
+
+def measure(func, text, number):
+    """多轮计时取最快一轮，单位为秒/次"""
+    return min(timeit.repeat(lambda: func(text), number=number, repeat=5)) / number
+
+
+def long_texts():
+    """长的多页行程单文本"""
+    texts = {}
+    for pages in (1, 10, 50):
+        didi = make_itinerary_text(trips=pages * 20)
+        texts[f'滴滴行程单({pages}页)'] = didi
+        # 去掉滴滴字样后，旧实现需要把关键词表逐个扫完
+        texts[f'通用行程单({pages}页)'] = didi.replace('滴滴出行-', '').replace('DIDI TRAVEL - ', '')
+    return texts
+
+
+def main(number=50):
+    legacy = LegacyOCRProcessor()
+    corpus = load_corpus()
+    corpus.update(long_texts())
+
+    # 每个类别追加100个不会命中的关键词，模拟用户配置的大关键词表
+    large_tables = {
+        category: keywords + [f'{category}自定义关键词{index}' for index in range(100)]
+        for category, keywords in DEFAULT_KEYWORD_TABLES.items()
+    }
+    large_classifier = InvoiceClassifier(large_tables)
+
+    print(f"{'文本':<28}{'长度':>8}{'旧实现(us)':>14}{'自动机(us)':>14}{'加速比':>10}{'大词表(us)':>14}")
+    total_legacy = total_engine = 0.0
+    for name, text in corpus.items():
+        assert legacy._classify_invoice(text) == DEFAULT_CLASSIFIER.classify(text), f"结果不一致: {name}"
+        legacy_time = measure(legacy._classify_invoice, text, number)
+        engine_time = measure(DEFAULT_CLASSIFIER.classify, text, number)
+        large_time = measure(large_classifier.classify, text, number)
+        total_legacy += legacy_time
+        total_engine += engine_time
+        print(f"{name[:26]:<28}{len(text):>8}{legacy_time * 1e6:>14.1f}{engine_time * 1e6:>14.1f}"
+              f"{legacy_time / engine_time:>9.1f}x{large_time * 1e6:>14.1f}")
+    print(f"{'合计':<28}{'':>8}{total_legacy * 1e6:>14.1f}{total_engine * 1e6:>14.1f}{total_legacy / total_engine:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
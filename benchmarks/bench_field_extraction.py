@@ -0,0 +1,48 @@
+"""字段提取基准测试：对比逐条 re.search 的旧实现与预编译锚点表的新实现
+
+用法: python benchmarks/bench_field_extraction.py [重复次数]
+"""
+import sys
+import timeit
+
+from corpus import load_corpus
+from legacy_ocr import LegacyOCRProcessor
+from services.field_extractor import FIELD_ANCHOR_SCANNER
+from services.ocr_processor import OCRProcessor
+
+FIELDS = ('_extract_invoice_number', '_extract_amount', '_extract_tax_amount', '_extract_date')
+
+
+def legacy_fields(processor, text):
+    return [getattr(processor, name)(text) for name in FIELDS]
+
+
+def engine_fields(processor, text):
+    anchors = FIELD_ANCHOR_SCANNER.scan(text)
+    return [getattr(processor, name)(text, anchors) for name in FIELDS]
+
+
+def measure(func, text, number):
+    """多轮计时取最快一轮，单位为秒/次"""
+    return min(timeit.repeat(lambda: func(text), number=number, repeat=5)) / number
+
+
+def main(number=200):
+    legacy = LegacyOCRProcessor()
+    engine = OCRProcessor()
+    corpus = load_corpus()
+
+    print(f"{'文本':<28}{'长度':>8}{'旧实现(us)':>14}{'新实现(us)':>14}{'加速比':>10}")
+    total_legacy = total_engine = 0.0
+    for name, text in corpus.items():
+        assert legacy_fields(legacy, text) == engine_fields(engine, text), f"结果不一致: {name}"
+        legacy_time = measure(lambda t: legacy_fields(legacy, t), text, number)
+        engine_time = measure(lambda t: engine_fields(engine, t), text, number)
+        total_legacy += legacy_time
+        total_engine += engine_time
+        print(f"{name[:26]:<28}{len(text):>8}{legacy_time * 1e6:>14.1f}{engine_time * 1e6:>14.1f}{legacy_time / engine_time:>9.1f}x")
+    print(f"{'合计':<28}{'':>8}{total_legacy * 1e6:>14.1f}{total_engine * 1e6:>14.1f}{total_legacy / total_engine:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -0,0 +1,99 @@
+"""发票列表筛选基准测试：10万张发票上按不同筛选条件和排序读取第一页和第20页的耗时
+
+用法: python benchmarks/bench_invoice_filters.py [发票数]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import insert
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from models.database import Invoice, create_sqlite_engine
+from models.migrations import migrate
+from services.invoice_list import SORT_COLUMNS, invoice_filters, list_page
+
+CATEGORIES = ['交通', '餐饮', '办公', '差旅', '娱乐', '其他']
+TYPES = ['滴滴电子发票', '增值税电子普通发票', '增值税专用发票', '铁路电子客票', '航空运输电子客票行程单']
+START = date(2022, 1, 1)
+
+
+def populate(db, rows):
+    rng = random.Random(0)
+    for start in range(0, rows, 10000):
+        batch = []
+        for _ in range(start, min(start + 10000, rows)):
+            amount = round(rng.lognormvariate(4, 1.2), 2)
+            invoice_date = START + timedelta(days=rng.randrange(1460))
+            reimbursed = rng.random() < 0.7
+            batch.append({
+                'invoice_number': str(rng.randrange(10 ** 19, 10 ** 20)),
+                'amount': amount if rng.random() > 0.01 else None,
+                'tax_amount': round(amount * 0.06, 2) if rng.random() < 0.6 else None,
+                'invoice_date': invoice_date if rng.random() > 0.01 else None,
+                'invoice_type': rng.choice(TYPES),
+                'category': rng.choice(CATEGORIES),
+                'is_reimbursed': reimbursed,
+                'due_date': invoice_date + timedelta(days=30) if not reimbursed and rng.random() < 0.5 else None,
+            })
+        db.execute(insert(Invoice), batch)
+    db.commit()
+
+
+def timed_pages(Session, filters, sort, descending, pages=20):
+    """返回 (第一页耗时, 第pages页耗时, 行数)，单位毫秒"""
+    db = Session()
+    timings = []
+    after = None
+    count = 0
+    for _ in range(pages):
+        start = time.perf_counter()
+        rows = list_page(db, filters, sort, descending, after)
+        timings.append((time.perf_counter() - start) * 1000)
+        count += len(rows)
+        if not rows:
+            break
+        after = rows[-1]
+    db.close()
+    return timings[0], timings[-1], count
+
+
+def main(rows=100000):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine = create_sqlite_engine(os.path.join(tmp_dir, 'bench.db'))
+        migrate(engine)
+        Session = sessionmaker(bind=engine)
+        db = Session()
+        populate(db, rows)
+        db.close()
+
+        last_month = date(2025, 11, 1)
+        cases = {
+            '不筛选': {},
+            '未报销': {'reimbursed': False},
+            '未报销交通上月': {'reimbursed': False, 'category': '交通', 'date_from': last_month,
+                         'date_to': last_month + timedelta(days=29)},
+            '金额500-510': {'amount_min': 500, 'amount_max': 510},
+            '专票未报销': {'invoice_type': '增值税专用发票', 'reimbursed': False},
+            '交通本年大额': {'category': '交通', 'date_from': date(2025, 1, 1), 'amount_min': 1000},
+        }
+        print(f"发票数: {rows}（毫秒，第一页 / 第20页 / 20页行数）")
+        worst = 0
+        for name, conditions in cases.items():
+            filters = invoice_filters(**conditions)
+            for sort in SORT_COLUMNS:
+                for descending in (False, True):
+                    first, deep, count = timed_pages(Session, filters, sort, descending)
+                    worst = max(worst, first, deep)
+                    print(f"{name:<10}{sort:<16}{'降序' if descending else '升序'}  {first:6.1f} / {deep:6.1f} / {count}")
+        print(f"最慢: {worst:.1f}ms")
+        engine.dispose()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,80 @@
+"""发票列表内存基准测试：对比只读取第一页列表字段（界面打开时的行为）、查询全部列表字段、加载发票对象、
+以及同时加载全部识别文本（文本内联在发票行时的行为）的内存峰值
+
+用法: python benchmarks/bench_invoice_listing.py [发票数]
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker, selectinload
+
+from corpus import builtin_texts, make_itinerary_text
+from models.database import Invoice, InvoiceText, compress_text, LIST_COLUMNS
+from models.migrations import migrate
+from services.invoice_list import list_page
+
+
+def populate(db, rows):
+    texts = list(builtin_texts().values()) + [make_itinerary_text(trips=40)]
+    contents = [compress_text(text) for text in texts]
+    for start in range(0, rows, 5000):
+        ids = range(start + 1, min(start + 5000, rows) + 1)
+        db.execute(insert(Invoice), [
+            {'id': invoice_id, 'invoice_number': f'N{invoice_id}', 'amount': 10.0, 'invoice_date': date(2025, 1, 1),
+             'invoice_type': '滴滴电子发票', 'category': '交通费'}
+            for invoice_id in ids
+        ])
+        db.execute(insert(InvoiceText), [
+            {'invoice_id': invoice_id, 'content': contents[invoice_id % len(contents)]} for invoice_id in ids
+        ])
+    db.commit()
+    return sum(len(text.encode('utf-8')) for text in texts) / len(texts)
+
+
+def measure(Session, load):
+    """在新会话中执行查询，返回 (内存峰值MB, 耗时秒)"""
+    db = Session()
+    tracemalloc.start()
+    start = time.perf_counter()
+    load(db)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    db.close()
+    return peak / 1024 / 1024, elapsed
+
+
+def load_with_text(db):
+    for invoice in db.query(Invoice).options(selectinload(Invoice.text_record)).all():
+        invoice.recognized_text
+
+
+def main(rows=50000):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}")
+        migrate(engine)
+        Session = sessionmaker(bind=engine)
+        db = Session()
+        average_size = populate(db, rows)
+        db.close()
+
+        print(f"发票数: {rows}，平均识别文本: {average_size / 1024:.1f}KB")
+        loads = (
+            ('列表第一页', list_page),
+            ('列表字段', lambda db: db.query(*LIST_COLUMNS).all()),
+            ('发票对象', lambda db: db.query(Invoice).all()),
+            ('发票对象和识别文本', load_with_text),
+        )
+        for name, load in loads:
+            peak_mb, elapsed = measure(Session, load)
+            print(f"{name:<10}内存峰值: {peak_mb:>8.1f}MB  耗时: {elapsed:.2f}s")
+        engine.dispose()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50000)
@@ -0,0 +1,59 @@
+"""按页提取基准测试：对比提取全部页面后解析与逐页解析、字段确定即停止的耗时
+
+仓库里没有多页行程单PDF，这里用 PyPDF2 把真实发票页复制成多页PDF，
+并把发票中的“旅客运输服务”临时加入行程单关键词，使它像滴滴行程单一样第一页即可确定全部字段。
+
+用法: python benchmarks/bench_lazy_pages.py [重复次数]
+"""
+import os
+import sys
+import tempfile
+import timeit
+
+from PyPDF2 import PdfReader, PdfWriter
+
+from corpus import pdf_paths
+from services.invoice_classifier import DEFAULT_KEYWORD_TABLES
+from services.ocr_processor import OCRProcessor
+
+
+def measure(func, number):
+    """多轮计时取最快一轮，单位为秒/次"""
+    return min(timeit.repeat(func, number=number, repeat=3)) / number
+
+
+def write_multipage_pdf(source_path, page_count, target_path):
+    """把 source_path 的第一页复制 page_count 次写入 target_path"""
+    page = PdfReader(source_path).pages[0]
+    writer = PdfWriter()
+    for _ in range(page_count):
+        writer.add_page(page)
+    with open(target_path, 'wb') as f:
+        writer.write(f)
+
+
+def main(number=3):
+    paths = pdf_paths()
+    if not paths:
+        print("没有找到PDF样本")
+        return
+    ocr = OCRProcessor(
+        keyword_tables={'itinerary': DEFAULT_KEYWORD_TABLES['itinerary'] + ['旅客运输服务']},
+        cache=False
+    )
+
+    print(f"{'页数':>6}{'全部提取(ms)':>16}{'按页提取(ms)':>16}{'加速比':>10}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for page_count in (1, 5, 20, 50):
+            path = os.path.join(tmp_dir, f'{page_count}.pdf')
+            write_multipage_pdf(paths[0], page_count, path)
+            full = ocr.process_invoice(path)
+            lazy = ocr.process_invoice(path, full_text=False)
+            assert full['parsed_info'] == lazy['parsed_info']
+            full_time = measure(lambda: ocr.process_invoice(path), number)
+            lazy_time = measure(lambda: ocr.process_invoice(path, full_text=False), number)
+            print(f"{page_count:>6}{full_time * 1e3:>16.1f}{lazy_time * 1e3:>16.1f}{full_time / lazy_time:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 3)
@@ -0,0 +1,56 @@
+"""批量重新解析基准测试：在临时数据库中生成大量发票行，测量重新解析的吞吐量和峰值内存
+
+用法: python benchmarks/bench_reparse.py [行数] [进程数]
+"""
+import os
+import resource
+import sys
+import tempfile
+import time
+from datetime import date
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from corpus import builtin_texts
+from models.database import Base, Invoice, InvoiceText, compress_text
+from services.invoice_reparser import InvoiceReparser
+
+
+def populate(db, rows):
+    """按语料循环生成发票行，字段全部为过期值，使每行都需要更新"""
+    contents = [compress_text(text) for text in builtin_texts().values()]
+    for start in range(0, rows, 5000):
+        ids = range(start + 1, min(start + 5000, rows) + 1)
+        db.execute(insert(Invoice), [
+            {'id': invoice_id, 'invoice_number': f'B{invoice_id}', 'amount': 0.0,
+             'invoice_date': date(2000, 1, 1), 'invoice_type': '其他票据'}
+            for invoice_id in ids
+        ])
+        db.execute(insert(InvoiceText), [
+            {'invoice_id': invoice_id, 'content': contents[invoice_id % len(contents)]} for invoice_id in ids
+        ])
+    db.commit()
+
+
+def main(rows=50000, workers=None):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}")
+        Base.metadata.create_all(bind=engine)
+        db = sessionmaker(bind=engine)()
+        populate(db, rows)
+
+        reparser = InvoiceReparser(workers=workers)
+        start = time.perf_counter()
+        summary = reparser.run(db=db, report_path=os.path.join(tmp_dir, 'report.csv'))
+        elapsed = time.perf_counter() - start
+        db.close()
+
+    # ru_maxrss 在 Linux 上单位为KB
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"行数: {summary['scanned']}，更新: {summary['changed']}，进程数: {reparser.workers}")
+    print(f"耗时: {elapsed:.2f}s，吞吐量: {summary['scanned'] / elapsed:.0f} 行/秒，主进程峰值内存: {peak_mb:.0f}MB")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50000, int(sys.argv[2]) if len(sys.argv) > 2 else None)
@@ -0,0 +1,93 @@
+"""全文搜索基准测试：对比逐行解压识别文本查找和FTS5索引查询的耗时，并测量为已有发票补建索引的耗时
+
+用法: python benchmarks/bench_search.py [发票数]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date
+
+from sqlalchemy import create_engine, insert, text
+from sqlalchemy.orm import sessionmaker
+
+from corpus import builtin_texts, make_itinerary_text
+from models.database import Invoice, InvoiceText, compress_text, decompress_text
+from models.migrations import migrate
+from services.invoice_search import build_search_index, search_invoices
+
+CITIES = ['北京', '上海', '广州', '深圳', '杭州', '成都', '武汉', '西安', '南京', '苏州']
+MERCHANTS = ['科技', '餐饮管理', '酒店管理', '文化传媒', '信息技术', '商贸', '物业服务', '汽车租赁']
+
+QUERIES = ['住宿', '上海 酒店', '滴滴 出行', '杭州文化传媒', '2531000000000001234', 'CHN']
+
+
+def make_texts(rows):
+    """每张发票的识别文本带有不同的销售方和发票号码，搜索结果的数量接近真实数据"""
+    rng = random.Random(0)
+    templates = list(builtin_texts().values()) + [make_itinerary_text(trips=10)]
+    for invoice_id in range(1, rows + 1):
+        seller = f"{rng.choice(CITIES)}{rng.choice(MERCHANTS)}{invoice_id % 97}号有限公司"
+        yield invoice_id, f"销售方名称：{seller}\n发票号码：{2531000000000000000 + invoice_id}\n" + rng.choice(templates)
+
+
+def populate(db, rows):
+    batch = []
+    for invoice_id, recognized_text in make_texts(rows):
+        batch.append((invoice_id, recognized_text))
+        if len(batch) == 5000 or invoice_id == rows:
+            db.execute(insert(Invoice), [
+                {'id': invoice_id, 'invoice_number': f'N{invoice_id}', 'amount': 10.0, 'invoice_date': date(2025, 1, 1)}
+                for invoice_id, _ in batch
+            ])
+            db.execute(insert(InvoiceText), [
+                {'invoice_id': invoice_id, 'content': compress_text(recognized_text)} for invoice_id, recognized_text in batch
+            ])
+            batch = []
+    db.commit()
+
+
+def scan(db, query):
+    """没有索引时的做法：逐行解压识别文本，查找包含全部搜索词的发票"""
+    terms = query.split()
+    return [
+        invoice_id for invoice_id, content in db.execute(text("SELECT invoice_id, content FROM invoice_texts"))
+        if all(term in decompress_text(content) for term in terms)
+    ]
+
+
+def timed(function, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return result, (time.perf_counter() - start) / repeat
+
+
+def main(rows=100000):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}")
+        migrate(engine)
+        Session = sessionmaker(bind=engine)
+        db = Session()
+        _, elapsed = timed(lambda: populate(db, rows))
+        print(f"发票数: {rows}，写入（触发器同步索引）耗时: {elapsed:.1f}s")
+
+        # 模拟升级前已有的数据：清空索引后补建
+        db.execute(text("DELETE FROM invoice_search"))
+        db.execute(text("UPDATE search_index_state SET next_id = 1, until_id = :rows"), {'rows': rows})
+        db.commit()
+        indexed, elapsed = timed(lambda: build_search_index(db, batch_size=1000))
+        print(f"补建索引: {indexed} 张发票，耗时 {elapsed:.1f}s")
+
+        print(f"{'搜索词':<24}{'命中':>8}{'逐行查找(ms)':>14}{'全文索引(ms)':>14}")
+        for query in QUERIES:
+            matched, scan_time = timed(lambda: scan(db, query))
+            _, search_time = timed(lambda: search_invoices(query, db), repeat=20)
+            print(f"{query:<24}{len(matched):>8}{scan_time * 1e3:>14.1f}{search_time * 1e3:>14.2f}")
+        db.close()
+        engine.dispose()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
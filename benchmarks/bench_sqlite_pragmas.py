@@ -0,0 +1,111 @@
+"""SQLite日志模式基准测试：对比默认的回滚日志（DELETE + synchronous=FULL）和WAL + 调整后的PRAGMA的提交延迟，
+以及提醒线程读取时界面写入被阻塞的情况
+
+用法: python benchmarks/bench_sqlite_pragmas.py [提交次数]
+"""
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+from sqlalchemy import insert
+
+from corpus import ROOT_DIR  # noqa: F401  确保可以导入 models
+from models.database import Base, Invoice, create_sqlite_engine, sqlite_pragmas
+
+MODES = (
+    ('回滚日志', {'journal_mode': 'DELETE', 'synchronous': 'FULL'}),
+    ('WAL', None),
+)
+
+
+def setup(db_path, pragmas, rows=20000):
+    engine = create_sqlite_engine(db_path, pragmas)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        connection.execute(insert(Invoice), [
+            {'invoice_number': f'N{i}', 'amount': 10.0, 'category': '交通费'} for i in range(rows)
+        ])
+    engine.dispose()
+
+
+def connect(db_path, pragmas, timeout):
+    conn = sqlite3.connect(db_path, timeout=timeout, isolation_level=None)
+    for name, value in (pragmas or sqlite_pragmas()).items():
+        conn.execute(f"PRAGMA {name} = {value}")
+    return conn
+
+
+def commit_latency(db_path, pragmas, commits):
+    """每次提交更新一张发票的报销状态，与界面上的单次操作相同，返回各次提交的耗时(ms)"""
+    conn = connect(db_path, pragmas, timeout=5)
+    latencies = []
+    for i in range(commits):
+        start = time.perf_counter()
+        conn.execute("BEGIN")
+        conn.execute("UPDATE invoices SET is_reimbursed = ? WHERE id = ?", (i % 2, i % 1000 + 1))
+        conn.execute("COMMIT")
+        latencies.append((time.perf_counter() - start) * 1e3)
+    conn.close()
+    return latencies
+
+
+def contention(db_path, pragmas, seconds=2.0):
+    """
+    读线程反复在一个事务中读取整张发票表（模拟提醒检查和列表刷新），同时写线程逐条提交更新，
+    写入等待超过100ms视为被阻塞
+    :return: (写入次数, 被阻塞的写入次数, 最长写入耗时ms, 读取次数, 最长读取耗时ms)
+    """
+    stop = time.perf_counter() + seconds
+    read_latencies = []
+
+    def reader():
+        conn = connect(db_path, pragmas, timeout=5)
+        while time.perf_counter() < stop:
+            start = time.perf_counter()
+            conn.execute("BEGIN")
+            conn.execute("SELECT id, invoice_number, amount, category FROM invoices").fetchall()
+            conn.execute("COMMIT")
+            read_latencies.append((time.perf_counter() - start) * 1e3)
+        conn.close()
+
+    thread = threading.Thread(target=reader)
+    thread.start()
+    conn = connect(db_path, pragmas, timeout=0.1)
+    writes = blocked = 0
+    slowest = 0.0
+    while time.perf_counter() < stop:
+        start = time.perf_counter()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("UPDATE invoices SET due_date = date('now') WHERE id = ?", (writes % 1000 + 1,))
+            conn.execute("COMMIT")
+        except sqlite3.OperationalError:
+            blocked += 1
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+        writes += 1
+        slowest = max(slowest, (time.perf_counter() - start) * 1e3)
+    thread.join()
+    conn.close()
+    return writes, blocked, slowest, len(read_latencies), max(read_latencies, default=0.0)
+
+
+def main(commits=500):
+    print(f"{'模式':<10}{'提交均值(ms)':>14}{'提交P95(ms)':>14}{'写入次数':>10}{'被阻塞':>8}{'最长写入(ms)':>14}"
+          f"{'读取次数':>10}{'最长读取(ms)':>14}")
+    for name, pragmas in MODES:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path = os.path.join(tmp_dir, 'bench.db')
+            setup(db_path, pragmas)
+            latencies = sorted(commit_latency(db_path, pragmas, commits))
+            writes, blocked, slowest, reads, slowest_read = contention(db_path, pragmas)
+            print(f"{name:<10}{statistics.mean(latencies):>14.3f}{latencies[int(len(latencies) * 0.95)]:>14.3f}"
+                  f"{writes:>10}{blocked:>8}{slowest:>14.1f}{reads:>10}{slowest_read:>14.1f}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
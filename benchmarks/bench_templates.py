@@ -0,0 +1,49 @@
+"""版式模板基准测试：对比通用规则与按版式模板分派的字段解析耗时，并输出各模板的命中率和耗时报告
+
+用法: python benchmarks/bench_templates.py [重复次数]
+"""
+import sys
+import timeit
+
+from corpus import load_corpus, make_itinerary_text
+from services.invoice_templates import DEFAULT_TEMPLATES, TemplateRegistry
+from services.ocr_processor import OCRProcessor
+
+
+def measure(func, text, number):
+    """多轮计时取最快一轮，单位为秒/次"""
+    return min(timeit.repeat(lambda: func(text), number=number, repeat=5)) / number
+
+
+def main(number=200):
+    corpus = load_corpus()
+    for pages in (10, 50):
+        corpus[f'滴滴行程单({pages}页)'] = make_itinerary_text(trips=pages * 20)
+
+    generic = OCRProcessor(cache=False, templates=False)
+    registry = TemplateRegistry(DEFAULT_TEMPLATES)
+    dispatched = OCRProcessor(cache=False, templates=registry)
+
+    print(f"{'文本':<28}{'模板':<12}{'通用规则(us)':>14}{'模板(us)':>12}{'加速比':>10}")
+    total_generic = total_template = 0.0
+    for name, text in corpus.items():
+        template = registry.match(text)
+        generic_time = measure(generic.parse_invoice_info, text, number)
+        template_time = measure(dispatched.parse_invoice_info, text, number)
+        total_generic += generic_time
+        total_template += template_time
+        print(f"{name[:26]:<28}{template.name if template else '-':<12}{generic_time * 1e6:>14.1f}"
+              f"{template_time * 1e6:>12.1f}{generic_time / template_time:>9.1f}x")
+    print(f"{'合计':<28}{'':<12}{total_generic * 1e6:>14.1f}{total_template * 1e6:>12.1f}"
+          f"{total_generic / total_template:>9.1f}x")
+
+    # 每个文本解析一次，得到与实际导入相同比例的命中统计
+    registry.reset_stats()
+    for text in corpus.values():
+        dispatched.parse_invoice_info(text)
+    print()
+    print(registry.format_report())
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -0,0 +1,62 @@
+"""文本提取后端基准测试：对比各后端提取全部页面的耗时，以及默认后端链与只用 pdfplumber 的处理吞吐量
+
+除 sample 和 invoices 目录下的PDF外，还用 PyPDF2 把第一份PDF复制成多页文件加入语料。
+
+用法: python benchmarks/bench_text_backends.py [重复次数]
+"""
+import os
+import sys
+import tempfile
+import timeit
+
+from bench_lazy_pages import write_multipage_pdf
+from corpus import pdf_paths
+from services.ocr_processor import OCRProcessor
+from services.text_backends import TEXT_BACKENDS
+
+
+def measure(func, number):
+    """多轮计时取最快一轮，单位为秒/次"""
+    return min(timeit.repeat(func, number=number, repeat=3)) / number
+
+
+def main(number=3):
+    paths = pdf_paths()
+    if not paths:
+        print("没有找到PDF样本")
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for page_count in (5, 20):
+            path = os.path.join(tmp_dir, f'复制{page_count}页.pdf')
+            write_multipage_pdf(paths[0], page_count, path)
+            paths.append(path)
+
+        processors = {name: OCRProcessor(cache=False, text_backends=[name]) for name in TEXT_BACKENDS}
+        reference = processors['pdfplumber']
+
+        print(f"{'文件':<32}" + ''.join(f"{name + '(ms)':>16}" for name in TEXT_BACKENDS) + f"{'默认后端':>12}")
+        default = OCRProcessor(cache=False)
+        for path in paths:
+            expected = reference.extract_text(path)[1]
+            cells = []
+            for name, ocr in processors.items():
+                text, invoice_info, _ = ocr.extract_text(path)
+                elapsed = measure(lambda: ocr.extract_text(path), number)
+                # 标注质量检查不合格(x)或字段与 pdfplumber 不一致(!)
+                flag = '' if ocr._text_quality_ok(text, invoice_info) else 'x'
+                flag += '' if invoice_info == expected else '!'
+                cells.append(f"{elapsed * 1e3:>14.1f}{flag:<2}")
+            chosen = default.extract_text(path)
+            assert chosen[1] == expected or chosen[2] == 'pdfplumber', f"结果不一致: {path}"
+            print(f"{os.path.basename(path)[:30]:<32}" + ''.join(cells) + f"{chosen[2]:>12}")
+
+        # 吞吐量：默认后端链（含质量检查和回退）与只用 pdfplumber 处理全部语料
+        plumber_time = measure(lambda: [reference.process_invoice(path) for path in paths], number)
+        default_time = measure(lambda: [default.process_invoice(path) for path in paths], number)
+        print(f"\n只用pdfplumber: {len(paths) / plumber_time:.1f} 个/秒")
+        print(f"默认后端链:     {len(paths) / default_time:.1f} 个/秒 ({plumber_time / default_time:.1f}x)")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 3)
@@ -0,0 +1,144 @@
+import os
+import sys
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+# 滴滴电子发票（取自 invoices/未报销 下的真实发票文本）
+DIDI_INVOICE_TEXT = """电子发票（普通发票）
+发票号码: 25317000001901626709
+旅客运输服务
+开票日期: 2025年08月14日
+购 名称：上海林清轩生物科技股份有限公司 销 名称：上海滴滴畅行科技有限公司
+买 售
+方 方
+信 统一社会信用代码/纳税人识别号：91310117588657256C 信 统一社会信用代码/纳税人识别号：91310114MA1GW61J6U
+息 息
+项目名称 单 价 数 量 金 额 税率/征收率 税 额
+*运输服务*客运服务费 120.50 1 120.50 3% 3.62
+合 计 ¥120.50 ¥3.62
+出行人 有效身份证件号 出行日期 出发地 到达地 等级 交通工具类型
+价税合计（大写） 壹佰贰拾肆圆壹角贰分 （小写）¥124.12
+备
+注
+开票人： 于秋红
+didi"""
+
+TAXI_RECEIPT_TEXT = """上海市出租汽车统一发票
+发票代码：131001920071 发票号码：04823310
+TAXI 沪B-83721
+日期：2025-07-21
+上车 08:42 下车 09:05
+单价 3.50元 里程 11.2公里
+等候 00:03:12
+金额：46.00元"""
+
+VAT_SPECIAL_TEXT = """增值税专用发票
+发票代码：3100231130 发票号码：09316528
+开票日期：2025年06月30日
+购买方 名称：上海林清轩生物科技股份有限公司
+货物或应税劳务、服务名称 规格型号 单位 数量 单价 金额 税率 税额
+*纸制品*A4复印纸 70g 箱 4 188.50 754.00 13% 98.02
+价税合计：852.02元
+税额：98.02元
+销售方 名称：上海晨光办公用品有限公司
+备注 办公用品采购"""
+
+HOTEL_TEXT = """电子发票（普通发票）
+发票号码：24312000000087451265
+开票日期：2025年05月12日
+项目名称 住宿服务*住宿费 单价 458.49 数量 2
+合计金额：916.98元
+增值税 55.02元
+价税合计（小写）¥972.00
+销售方：杭州西湖国宾酒店有限公司"""
+
+RESTAURANT_TEXT = """增值税电子普通发票
+发票号码：05531876
+开票日期：2025年03月08日
+*餐饮服务*餐费
+金额[元] 283.02
+税额[元]: 16.98
+价税合计：300.00
+销售方名称：北京全聚德餐厅"""
+
+UNRECOGNIZED_TEXT = """客户回执
+本页仅供核对使用，不作为报销凭证。
+如有疑问请联系客服 400-000-0000
+感谢您的使用""" * 20
+
+
+def make_itinerary_text(trips=40, trips_per_page=20):
+    """
+    生成滴滴出行行程单文本
+    :param trips: 行程笔数
+    :param trips_per_page: 每页行程数，多页时按页用空行拼接，与 extract_text_from_pdf 的输出一致
+    :return: 行程单文本
+    """
+    total = 0.0
+    rows = []
+    for index in range(1, trips + 1):
+        amount = 18.0 + (index * 7) % 60 + 0.5
+        total += amount
+        rows.append(
+            f"{index} 快车 07-{(index % 28) + 1:02d} {8 + index % 12:02d}:{index % 60:02d} 周{'一二三四五六日'[index % 7]} "
+            f"上海市 陆家嘴金融中心{index}号门 张江高科技园区{index % 9}号楼 {8 + index % 20}.{index % 10} {amount:.2f}"
+        )
+    header = (
+        "滴滴出行-行程单\n"
+        "DIDI TRAVEL - TRIP TABLE\n"
+        "申请日期：2025-08-14\n"
+        "行程起止日期：2025-07-01 至 2025-07-31\n"
+        f"共{trips}笔行程，合计{total:.2f}元\n"
+        "序号 车型 上车时间 城市 起点 终点 里程[公里] 金额[元] 备注"
+    )
+    pages = []
+    for start in range(0, trips, trips_per_page):
+        page_rows = rows[start:start + trips_per_page]
+        page_no = start // trips_per_page + 1
+        page_count = (trips + trips_per_page - 1) // trips_per_page
+        body = '\n'.join(page_rows) + f"\n页码：{page_no}/{page_count}"
+        pages.append(header + '\n' + body if page_no == 1 else body)
+    return '\n\n'.join(pages)
+
+
+def builtin_texts():
+    """内置的代表性票据文本"""
+    return {
+        '滴滴电子发票': DIDI_INVOICE_TEXT,
+        '滴滴行程单(1页)': make_itinerary_text(trips=6),
+        '滴滴行程单(10页)': make_itinerary_text(trips=200),
+        '出租车发票': TAXI_RECEIPT_TEXT,
+        '增值税专用发票': VAT_SPECIAL_TEXT,
+        '住宿发票': HOTEL_TEXT,
+        '餐饮发票': RESTAURANT_TEXT,
+        '无法识别': UNRECOGNIZED_TEXT,
+    }
+
+
+def pdf_paths():
+    """sample 和 invoices 目录下的真实PDF文件"""
+    paths = []
+    for folder in ('sample', 'invoices'):
+        base = os.path.join(ROOT_DIR, folder)
+        for dirpath, _, filenames in os.walk(base):
+            paths.extend(os.path.join(dirpath, name) for name in sorted(filenames) if name.lower().endswith('.pdf'))
+    return paths
+
+
+def load_corpus(include_pdfs=True):
+    """
+    加载基准测试语料
+    :param include_pdfs: 是否提取真实PDF的文本加入语料
+    :return: {名称: 文本}
+    """
+    corpus = builtin_texts()
+    if include_pdfs:
+        from services.ocr_processor import OCRProcessor
+        ocr = OCRProcessor()
+        for path in pdf_paths():
+            text = ocr.extract_text_from_pdf(path)
+            if text:
+                corpus[os.path.basename(path)] = text
+    return corpus
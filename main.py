@@ -2,6 +2,8 @@ import shutil
 import datetime
 import sys
 import os
+import threading
+import time
 # 设置Qt平台插件路径 - 尝试多种可能的位置
 qt_plugin_paths = [
     os.path.join(os.path.dirname(sys.executable), 'Lib', 'site-packages', 'PyQt5', 'Qt', 'plugins', 'platforms'),
@@ -15,40 +17,280 @@ for path in qt_plugin_paths:
         break
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QPushButton,
-    QTableWidget, QTableWidgetItem, QFileDialog, QLabel, QDateEdit, QCheckBox,
-    QMessageBox, QDialog, QComboBox, QColorDialog
+    QTableView, QAbstractItemView, QMenu, QFileDialog, QLabel, QDateEdit, QCheckBox,
+    QMessageBox, QDialog, QComboBox, QColorDialog, QProgressDialog, QLineEdit
 )
 from PyQt5 import QtGui
-from PyQt5.QtCore import Qt, QDate
+from PyQt5.QtCore import Qt, QDate, QTimer, QThread, pyqtSignal, QAbstractTableModel, QModelIndex
 from dotenv import load_dotenv
 from services.reminder import ReminderService
-from services.invoice_importer import InvoiceImporter
+from services.backup import BackupService
+from services.invoice_importer import InvoiceImporter, compare_file_contents
 
 # 加载环境变量
 load_dotenv()
 
+# 搜索结果最多显示的发票数
+SEARCH_LIMIT = 200
+
+class TaskThread(QThread):
+    """在后台线程中执行耗时操作，结果通过信号回到界面线程"""
+    succeeded = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    progressed = pyqtSignal(int, int, str)
+
+    def __init__(self, task, parent=None):
+        """
+        :param task: 可调用对象 task(progress)，progress(已完成, 总数, 说明='') 可在任务中调用以报告进度
+        """
+        super().__init__(parent)
+        self.task = task
+
+    def run(self):
+        try:
+            self.succeeded.emit(self.task(self._progress))
+        except Exception as e:
+            self.failed.emit(str(e))
+
+    def _progress(self, done, total, message=''):
+        self.progressed.emit(done, total, message)
+
+def format_duration(seconds):
+    """把秒数显示为“X分Y秒”"""
+    seconds = int(round(seconds))
+    return f"{seconds // 60}分{seconds % 60}秒" if seconds >= 60 else f"{seconds}秒"
+
+class InvoiceTableModel(QAbstractTableModel):
+    """
+    发票列表的数据模型：按筛选条件和排序字段每次只从数据库读取一页列表字段，表格滚动到已读取部分的末尾时再读取下一页；
+    表格只为可见的单元格取数据绘制，不为每行创建控件
+    """
+    HEADERS = ["发票编号", "金额", "税额", "日期", "发票类型", "分类", "状态", "截止日期", "行程单"]
+    # 各列对应的排序字段（见 services.invoice_list.SORT_COLUMNS），None为不能排序的列
+    SORT_FIELDS = ["invoice_number", "total_amount", None, "invoice_date", "invoice_type", "category", None, "due_date", None]
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.rows = []
+        # 与 rows 对应的发票ID和排序键；不搜索时按排序键排列
+        self.ids = []
+        self.keys = []
+        self.query = ''
+        self.filters = []
+        self.sort_field = 'id'
+        self.descending = False
+        # 搜索结果的匹配片段 {发票ID: 摘要}，鼠标悬停时显示
+        self.snippets = {}
+        self.has_more = False
+
+    def load(self, query='', filters=()):
+        """
+        重新加载列表：有搜索词时显示符合筛选条件、按相关度排列的搜索结果，否则按排序字段读取第一页
+        :param query: 搜索词
+        :param filters: services.invoice_list.invoice_filters 返回的条件
+        :return: 本次加载的行数
+        """
+        from models.database import session_scope
+        from services.invoice_list import list_page, list_rows, LIST_PAGE_SIZE
+        from services.invoice_search import search_invoices
+
+        filters = list(filters)
+        with session_scope() as db:
+            if query:
+                results = search_invoices(query, db, limit=SEARCH_LIMIT)
+                snippets = dict(results)
+                rows = list_rows(db, [invoice_id for invoice_id, _ in results], filters)
+                has_more = False
+            else:
+                snippets = {}
+                rows = list_page(db, filters, self.sort_field, self.descending)
+                has_more = len(rows) == LIST_PAGE_SIZE
+        self.beginResetModel()
+        self.rows, self.snippets, self.has_more, self.query, self.filters = rows, snippets, has_more, query, filters
+        self.ids = [row.id for row in rows]
+        self.keys = [self._sort_key(row) for row in rows]
+        self.endResetModel()
+        return len(rows)
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        """按列排序并重新读取第一页；column 为-1或不能排序的列时按发票ID排列。搜索结果始终按相关度排列"""
+        field = self.SORT_FIELDS[column] if 0 <= column < len(self.SORT_FIELDS) else None
+        self.sort_field = field or 'id'
+        self.descending = order == Qt.DescendingOrder
+        if not self.query:
+            self.load(self.query, self.filters)
+
+    def sort_column(self):
+        """当前排序的列，按发票ID排列时为-1"""
+        return self.SORT_FIELDS.index(self.sort_field) if self.sort_field in self.SORT_FIELDS else -1
+
+    def refresh_rows(self, invoice_ids):
+        """
+        只重新读取指定发票所在的行：修改的行原地更新，已删除或不再符合筛选条件的行移除，排序值改变的行移到新位置，
+        新增的发票在已读取的范围内时插入到对应位置；其余的行、选中状态和滚动位置不变。搜索时新增的发票不插入，重新搜索后才显示
+        :param invoice_ids: 新增、修改或删除的发票ID
+        """
+        from models.database import session_scope
+        from services.invoice_list import list_rows
+
+        with session_scope() as db:
+            fresh = {row.id: row for row in list_rows(db, sorted(invoice_ids), self.filters)}
+        for invoice_id in sorted(invoice_ids):
+            position = self.ids.index(invoice_id) if invoice_id in self.ids else None
+            row = fresh.get(invoice_id)
+            key = self._sort_key(row) if row is not None else None
+            if position is not None and (row is None or (not self.query and key != self.keys[position])):
+                self.beginRemoveRows(QModelIndex(), position, position)
+                del self.rows[position]
+                del self.ids[position]
+                del self.keys[position]
+                self.endRemoveRows()
+                position = None
+            if position is not None:
+                self.rows[position] = row
+                self.dataChanged.emit(self.index(position, 0), self.index(position, len(self.HEADERS) - 1))
+            elif row is not None and not self.query:
+                position = self._insert_position(key)
+                # 排在已读取的行之后的发票由 fetchMore 读取
+                if position < len(self.ids) or not self.has_more:
+                    self.beginInsertRows(QModelIndex(), position, position)
+                    self.rows.insert(position, row)
+                    self.ids.insert(position, invoice_id)
+                    self.keys.insert(position, key)
+                    self.endInsertRows()
+
+    def _sort_key(self, row):
+        from services.invoice_list import sort_key
+
+        return sort_key(row, self.sort_field)
+
+    def _insert_position(self, key):
+        """按排序键二分查找插入位置，降序时 keys 从大到小排列"""
+        low, high = 0, len(self.keys)
+        while low < high:
+            middle = (low + high) // 2
+            if (self.keys[middle] > key) if self.descending else (self.keys[middle] < key):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.has_more
+
+    def fetchMore(self, parent=QModelIndex()):
+        from models.database import session_scope
+        from services.invoice_list import list_page, LIST_PAGE_SIZE
+
+        if parent.isValid() or not self.has_more:
+            return
+        with session_scope() as db:
+            page = list_page(db, self.filters, self.sort_field, self.descending,
+                             after=self.rows[-1] if self.rows else None)
+        self.has_more = len(page) == LIST_PAGE_SIZE
+        if page:
+            self.beginInsertRows(QModelIndex(), len(self.rows), len(self.rows) + len(page) - 1)
+            self.rows.extend(page)
+            self.ids.extend(row.id for row in page)
+            self.keys.extend(self._sort_key(row) for row in page)
+            self.endInsertRows()
+
+    def invoice_id(self, row):
+        """第 row 行的发票ID"""
+        return self.ids[row]
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        invoice = self.rows[index.row()]
+        column = index.column()
+        if role == Qt.DisplayRole:
+            return self._display_text(invoice, column)
+        if role == Qt.BackgroundRole and column == 5 and invoice.category_color:
+            return QtGui.QColor(invoice.category_color)
+        if role == Qt.ToolTipRole:
+            return self.snippets.get(invoice.id)
+        return None
+
+    @staticmethod
+    def _display_text(invoice, column):
+        if column == 0:
+            return invoice.invoice_number or "未知"
+        if column == 1:
+            # 显示价税合计，由列表查询一并计算
+            return str(invoice.total_amount) if invoice.total_amount else "未知"
+        if column == 2:
+            return str(invoice.tax_amount) if invoice.tax_amount else "未知"
+        if column == 3:
+            return invoice.invoice_date.strftime('%Y-%m-%d') if invoice.invoice_date else "未知"
+        if column == 4:
+            return invoice.invoice_type or "未知类型"
+        if column == 5:
+            return invoice.category or "未分类"
+        if column == 6:
+            return "已报销" if invoice.is_reimbursed else "未报销"
+        if column == 7:
+            return invoice.due_date.strftime('%Y-%m-%d') if invoice.due_date else "未设置"
+        # 行程单状态，行程数由列表查询一并计算
+        return f"有（{invoice.itinerary_count}笔）" if invoice.itinerary_count else "无"
+
 class InvoiceManagerApp(QApplication):
     def __init__(self, argv):
         super().__init__(argv)
         self.init_database()
-        self.main_window = MainWindow()
+        self.backup_service = BackupService()
+        self.main_window = MainWindow(self.backup_service)
         self.main_window.show()
         
         # 启动提醒服务
         self.reminder_service = ReminderService()
         self.reminder_service.start()
+        # 启动自动备份（环境变量 BACKUP_INTERVAL_HOURS、BACKUP_KEEP、BACKUP_DIR）
+        self.backup_service.start()
 
     def init_database(self):
         """初始化数据库连接"""
         from models.database import init_db
+        from services.invoice_search import build_search_index
         init_db()
+        # 升级前已有的识别文本在后台分批补建搜索索引，新导入的发票由触发器实时索引
+        threading.Thread(target=build_search_index, daemon=True).start()
 
 class MainWindow(QMainWindow):
-    def __init__(self):
+    # 发票修改通知，可能来自后台线程，经信号转到界面线程
+    invoices_changed = pyqtSignal(object)
+
+    def __init__(self, backup_service=None):
+        from models.database import on_invoices_changed
+
         super().__init__()
+        self.backup_service = backup_service or BackupService()
+        self.backup_thread = None
+        self.restore_thread = None
+        self.import_thread = None
         self.setWindowTitle("个人发票管理系统")
         self.setGeometry(100, 100, 1000, 700)
         self.setup_ui()
+        # 提交后才刷新：排队到事件循环中处理，不在提交过程中查询数据库
+        self.invoices_changed.connect(self.refresh_invoices, Qt.QueuedConnection)
+        self._invoices_listener = on_invoices_changed(self.invoices_changed.emit)
+
+    def closeEvent(self, event):
+        from models.database import remove_invoices_listener
+
+        remove_invoices_listener(self._invoices_listener)
+        super().closeEvent(event)
 
     def setup_ui(self):
         """设置主窗口UI"""
@@ -79,7 +321,7 @@ class MainWindow(QMainWindow):
         top_layout.addWidget(self.restore_btn)
 
         self.refresh_btn = QPushButton("刷新列表")
-        self.refresh_btn.clicked.connect(self.load_invoices)
+        self.refresh_btn.clicked.connect(self.refresh_list)
         top_layout.addWidget(self.refresh_btn)
 
         self.report_btn = QPushButton("生成报表")
@@ -93,15 +335,71 @@ class MainWindow(QMainWindow):
 
         main_layout.addLayout(top_layout)
 
-        # 发票列表
-        self.invoice_table = QTableWidget()
-        self.invoice_table.setColumnCount(10)
-        self.invoice_table.setHorizontalHeaderLabels(["发票编号", "金额", "税额", "日期", "发票类型", "分类", "状态", "截止日期", "行程单", "操作"])
+        # 全文搜索：停止输入一段时间后再查询，避免每输入一个字刷新一次列表
+        self.search_edit = QLineEdit()
+        self.search_edit.setPlaceholderText("搜索发票内容（商户、项目、行程地点、发票号码等，多个词用空格分隔）")
+        self.search_edit.setClearButtonEnabled(True)
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(300)
+        self.search_timer.timeout.connect(self.load_invoices)
+        self.search_edit.textChanged.connect(self.search_timer.start)
+        main_layout.addWidget(self.search_edit)
+
+        # 筛选栏：条件改变后与搜索一样稍等再重新查询
+        filter_layout = QHBoxLayout()
+        self.status_filter = QComboBox()
+        self.status_filter.addItem("全部状态", None)
+        self.status_filter.addItem("未报销", False)
+        self.status_filter.addItem("已报销", True)
+        self.category_filter = QComboBox()
+        self.type_filter = QComboBox()
+        self.date_from_edit = self._filter_date_edit()
+        self.date_to_edit = self._filter_date_edit()
+        self.amount_min_edit = self._filter_amount_edit("最低金额")
+        self.amount_max_edit = self._filter_amount_edit("最高金额")
+        self.clear_filters_btn = QPushButton("清除筛选")
+        self.clear_filters_btn.clicked.connect(self.clear_filters)
+        for label, widget in (("状态:", self.status_filter), ("分类:", self.category_filter),
+                              ("日期:", self.date_from_edit), ("至", self.date_to_edit),
+                              ("价税合计:", self.amount_min_edit), ("至", self.amount_max_edit),
+                              ("类型:", self.type_filter)):
+            filter_layout.addWidget(QLabel(label))
+            filter_layout.addWidget(widget)
+        filter_layout.addWidget(self.clear_filters_btn)
+        filter_layout.addStretch()
+        main_layout.addLayout(filter_layout)
+        self.update_filter_choices()
+        for combo in (self.status_filter, self.category_filter, self.type_filter):
+            combo.currentIndexChanged.connect(self.search_timer.start)
+        for date_edit in (self.date_from_edit, self.date_to_edit):
+            date_edit.dateChanged.connect(self.search_timer.start)
+        for amount_edit in (self.amount_min_edit, self.amount_max_edit):
+            amount_edit.textChanged.connect(self.search_timer.start)
+
+        # 发票列表：分页读取的数据模型，标记报销、设置提醒、分类和删除在右键菜单中
+        self.invoice_model = InvoiceTableModel(self)
+        self.invoice_table = QTableView()
+        self.invoice_table.setModel(self.invoice_model)
         self.invoice_table.horizontalHeader().setStretchLastSection(True)
-        # 设置选择模式为多选
-        self.invoice_table.setSelectionMode(QTableWidget.ExtendedSelection)
+        self.invoice_table.verticalHeader().setDefaultSectionSize(24)
+        # 设置选择模式为多选，整行选中
+        self.invoice_table.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.invoice_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.invoice_table.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.invoice_table.customContextMenuRequested.connect(self.show_invoice_menu)
+        # 点击表头按该列排序，再次点击切换升降序；排序在数据库中进行
+        header = self.invoice_table.horizontalHeader()
+        header.setSectionsClickable(True)
+        header.setSortIndicatorShown(True)
+        header.setSortIndicator(-1, Qt.AscendingOrder)
+        header.sectionClicked.connect(self.sort_invoices)
         main_layout.addWidget(self.invoice_table)
 
+        # 合计栏，数据来自汇总表
+        self.totals_label = QLabel()
+        main_layout.addWidget(self.totals_label)
+
         # 加载发票数据
         self.load_invoices()
     
@@ -184,257 +482,264 @@ class MainWindow(QMainWindow):
         """上传发票文件（支持多文件）"""
         file_paths, _ = QFileDialog.getOpenFileNames(self, "选择发票PDF", "", "PDF Files (*.pdf)")
         if file_paths:
-            try:
-                # 让用户选择分类
-                category, color = self.select_category()
-                if not category:
-                    QMessageBox.warning(self, "警告", "未选择分类，导入已取消!")
-                    return
-                
-                # 处理发票并保存到数据库
-                from services.ocr_processor import OCRProcessor
-                from models.database import get_db, Invoice
-                from datetime import datetime
-                import shutil
-                import os
-
-                ocr = OCRProcessor()
-                db = next(get_db())
-                success_count = 0
-                failed_count = 0
-                failed_files = []
-
-                for file_path in file_paths:
-                    try:
-                        # 提取发票信息
-                        text = ocr.extract_text_from_pdf(file_path)
-                        parsed_info = ocr.parse_invoice_info(text)
-
-                        # 重命名文件（默认为未报销状态）
-                        new_file_path = self._rename_invoice_file(file_path, parsed_info, is_reimbursed=False, category=category)
+            # 让用户选择分类
+            category, color = self.select_category()
+            if not category:
+                QMessageBox.warning(self, "警告", "未选择分类，导入已取消!")
+                return
+
+            # 每个文件单独作为一张发票导入
+            self._run_import(file_paths, category, color, pair_itineraries=False, action="上传")
 
-                        # 创建发票记录
-                        new_invoice = Invoice(
-                            invoice_number=parsed_info.get('invoice_number'),
-                            pdf_path=new_file_path,
-                            amount=parsed_info.get('amount'),
-                            tax_amount=parsed_info.get('tax_amount'),
-                            invoice_date=parsed_info.get('date'),
-                            invoice_type=parsed_info.get('type'),
-                            recognized_text=text,
-                            category=category,
-                            category_color=color
-                        )
-                        db.add(new_invoice)
-                        success_count += 1
-                    except Exception as e:
-                        failed_count += 1
-                        failed_files.append(f"{os.path.basename(file_path)}: {str(e)}")
-
-                db.commit()
-                message = f"成功上传 {success_count} 个发票文件！"
-                if failed_count > 0:
-                    message += f"\n\n有 {failed_count} 个文件上传失败:\n" + "\n".join(failed_files)
-                QMessageBox.information(self, "上传结果", message)
-                self.load_invoices()
-            except Exception as e:
-                QMessageBox.critical(self, "错误", f"处理发票失败: {str(e)}")
-    
     def batch_import(self):
         """批量导入发票和行程单"""
         file_paths, _ = QFileDialog.getOpenFileNames(self, "选择发票和行程单PDF", "", "PDF Files (*.pdf)")
         if file_paths:
-            try:
-                # 让用户选择分类
-                category, color = self.select_category()
-                if not category:
-                    QMessageBox.warning(self, "警告", "未选择分类，导入已取消!")
-                    return
-                
-                importer = InvoiceImporter()
-                success_count, failed_count, failed_files = importer.batch_import(file_paths, category=category, color=color)
-
-                message = f"成功导入 {success_count} 个文件！"
-                if failed_count > 0:
-                    message += f"\n\n有 {failed_count} 个文件导入失败:\n" + "\n".join(failed_files)
-                QMessageBox.information(self, "导入结果", message)
-                self.load_invoices()
-            except Exception as e:
-                QMessageBox.critical(self, "错误", f"批量导入失败: {str(e)}")
-    
+            # 让用户选择分类
+            category, color = self.select_category()
+            if not category:
+                QMessageBox.warning(self, "警告", "未选择分类，导入已取消!")
+                return
+
+            self._run_import(file_paths, category, color, action="导入")
+
+    def _run_import(self, file_paths, category, color, pair_itineraries=True, action="导入"):
+        """
+        在后台线程中并行解析并导入文件，导入期间界面可以继续使用。进度对话框显示已完成的文件数、当前文件和预计剩余时间，
+        取消后已解析的文件照常保存；提交的发票通过修改通知随即出现在列表中
+        """
+        cancel_event = threading.Event()
+        progress_dialog = QProgressDialog("正在解析发票...", "取消", 0, len(file_paths), self)
+        progress_dialog.setWindowTitle(f"{action}发票")
+        progress_dialog.setMinimumDuration(0)
+        progress_dialog.setAutoClose(False)
+        progress_dialog.setAutoReset(False)
+        started = time.monotonic()
+
+        def on_cancel():
+            cancel_event.set()
+            self.statusBar().showMessage(f"正在取消{action}，已解析的文件会保存…")
+
+        def on_progress(done, total, message):
+            elapsed = time.monotonic() - started
+            remaining = f"，预计还需 {format_duration(elapsed / done * (total - done))}" if 0 < done < total else ""
+            progress_dialog.setLabelText(f"已解析 {done}/{total}{remaining}\n{message}")
+            progress_dialog.setValue(done)
+
+        def finish():
+            progress_dialog.canceled.disconnect(on_cancel)
+            progress_dialog.close()
+            self.statusBar().clearMessage()
+            for button in (self.upload_btn, self.batch_import_btn):
+                button.setEnabled(True)
+
+        def on_finished(result):
+            finish()
+            success_count, failed_count, failed_files = result
+            message = f"成功{action} {success_count} 个文件！"
+            if cancel_event.is_set():
+                message += f"\n已取消{action}，未解析的文件没有{action}。"
+            if failed_count > 0:
+                message += f"\n\n有 {failed_count} 个文件{action}失败:\n" + "\n".join(failed_files)
+            QMessageBox.information(self, f"{action}结果", message)
+
+        def on_failed(message):
+            finish()
+            QMessageBox.critical(self, "错误", f"{action}发票失败: {message}")
+
+        importer = InvoiceImporter()
+        self.import_thread = TaskThread(lambda progress: importer.import_files(
+            file_paths, category=category, color=color, pair_itineraries=pair_itineraries,
+            progress=lambda done, total, file_path, error: progress(
+                done, total, f"{os.path.basename(file_path)} {f'失败: {error}' if error else '完成'}"
+            ),
+            cancelled=cancel_event.is_set
+        ), self)
+        self.import_thread.progressed.connect(on_progress)
+        self.import_thread.succeeded.connect(on_finished)
+        self.import_thread.failed.connect(on_failed)
+        progress_dialog.canceled.connect(on_cancel)
+        # 同一时间只进行一个导入
+        for button in (self.upload_btn, self.batch_import_btn):
+            button.setEnabled(False)
+        self.import_thread.start()
+        progress_dialog.show()
+
     def _compare_file_contents(self, file1_path, file2_path):
         """比较两个文件的内容是否相同"""
-        try:
-            # 对于小文件，可以直接比较内容
-            with open(file1_path, 'rb') as f1, open(file2_path, 'rb') as f2:
-                return f1.read() == f2.read()
-        except Exception as e:
-            print(f"比较文件内容失败: {str(e)}")
-            return False
+        return compare_file_contents(file1_path, file2_path)
     
-    def _rename_invoice_file(self, file_path, parsed_info, is_reimbursed=False, category=None, target_dir=None):
-        """根据发票信息和报销状态重命名文件并保存到对应文件夹"""
-        import os
+    def _filter_date_edit(self):
+        """筛选栏的日期框，最小日期表示不限"""
+        date_edit = QDateEdit()
+        date_edit.setCalendarPopup(True)
+        date_edit.setDisplayFormat("yyyy-MM-dd")
+        date_edit.setMinimumDate(QDate(2000, 1, 1))
+        date_edit.setSpecialValueText("不限")
+        date_edit.setDate(date_edit.minimumDate())
+        return date_edit
+
+    def _filter_amount_edit(self, placeholder):
+        """筛选栏的金额框，空白表示不限"""
+        amount_edit = QLineEdit()
+        amount_edit.setPlaceholderText(placeholder)
+        amount_edit.setClearButtonEnabled(True)
+        amount_edit.setMaximumWidth(100)
+        validator = QtGui.QDoubleValidator(0, 1e12, 2, amount_edit)
+        validator.setNotation(QtGui.QDoubleValidator.StandardNotation)
+        amount_edit.setValidator(validator)
+        return amount_edit
+
+    def update_filter_choices(self):
+        """用数据库中已有的分类和发票类型更新筛选栏的下拉框，保留当前的选择"""
+        from models.database import session_scope
+        from services.invoice_list import filter_choices
+
+        with session_scope() as db:
+            categories, types = filter_choices(db)
+        for combo, all_text, values in ((self.category_filter, "全部分类", categories),
+                                        (self.type_filter, "全部类型", types)):
+            current = combo.currentData()
+            combo.blockSignals(True)
+            combo.clear()
+            combo.addItem(all_text, None)
+            for value in values:
+                combo.addItem(value, value)
+            combo.setCurrentIndex(max(combo.findData(current), 0) if current is not None else 0)
+            combo.blockSignals(False)
+
+    def current_filters(self):
+        """筛选栏当前的条件，参数见 services.invoice_list.invoice_filters"""
+        def date_value(date_edit):
+            return None if date_edit.date() == date_edit.minimumDate() else date_edit.date().toPyDate()
+
+        def amount_value(amount_edit):
+            try:
+                return float(amount_edit.text())
+            except ValueError:
+                return None
+
+        return {
+            'reimbursed': self.status_filter.currentData(),
+            'category': self.category_filter.currentData(),
+            'date_from': date_value(self.date_from_edit),
+            'date_to': date_value(self.date_to_edit),
+            'amount_min': amount_value(self.amount_min_edit),
+            'amount_max': amount_value(self.amount_max_edit),
+            'invoice_type': self.type_filter.currentData(),
+        }
 
-        # 创建固定文件夹: 已报销和未报销
-        base_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'invoices')
-        reimbursed_dir = os.path.join(base_dir, '已报销')
-        not_reimbursed_dir = os.path.join(base_dir, '未报销')
-        os.makedirs(reimbursed_dir, exist_ok=True)
-        os.makedirs(not_reimbursed_dir, exist_ok=True)
-
-        # 确定目标文件夹
-        if target_dir:
-            # 使用指定的目标文件夹
-            os.makedirs(target_dir, exist_ok=True)
-        else:
-            target_dir = reimbursed_dir if is_reimbursed else not_reimbursed_dir
-
-        # 生成新文件名
-        invoice_type = parsed_info.get('type', '其他票据')
-        invoice_number = parsed_info.get('invoice_number', '未知编号')
-        invoice_date = parsed_info.get('date')
-        amount = parsed_info.get('amount', 0)
-        tax_amount = parsed_info.get('tax_amount', 0)
-        
-        # 计算含税金额（价税合计）
-        total_amount = amount + tax_amount
-        
-        if invoice_date:
-            date_str = invoice_date.strftime('%Y%m%d')
-        else:
-            date_str = datetime.datetime.now().strftime('%Y%m%d')
+    def clear_filters(self):
+        """清除筛选栏的全部条件"""
+        for combo in (self.status_filter, self.category_filter, self.type_filter):
+            combo.setCurrentIndex(0)
+        for date_edit in (self.date_from_edit, self.date_to_edit):
+            date_edit.setDate(date_edit.minimumDate())
+        for amount_edit in (self.amount_min_edit, self.amount_max_edit):
+            amount_edit.clear()
+
+    def sort_invoices(self, column):
+        """点击表头后按该列重新读取列表；不能排序的列恢复原来的排序标记"""
+        header = self.invoice_table.horizontalHeader()
+        if self.invoice_model.SORT_FIELDS[column] is None:
+            header.setSortIndicator(self.invoice_model.sort_column(),
+                                    Qt.DescendingOrder if self.invoice_model.descending else Qt.AscendingOrder)
+            return
+        self.invoice_model.sort(column, header.sortIndicatorOrder())
 
-        # 确定分类：优先使用用户提供的分类，否则自动确定
-        if category:
-            category_to_use = category
-        else:
-            # 这里可以添加自动确定分类的逻辑
-            category_to_use = '交通费'  # 默认分类
-
-        # 使用含税金额构建文件名
-        amount_str = f"{total_amount:.2f}" if total_amount else "未知金额"
-
-        # 构建新文件名: 日期_分类_类型_金额_编号
-        file_ext = os.path.splitext(file_path)[1]
-        new_file_name = f"{date_str}_{category_to_use}_{invoice_type}_{amount_str}_{invoice_number}{file_ext}"
-        new_file_path = os.path.join(target_dir, new_file_name)
-
-        # 检查文件是否已存在，如果存在且内容相同，则直接返回该路径
-        if os.path.exists(new_file_path):
-            if self._compare_file_contents(file_path, new_file_path):
-                return new_file_path
-            # 内容不同时添加时间戳
-            timestamp = datetime.datetime.now().strftime('%H%M%S')
-            new_file_name = f"{date_str}_{category_to_use}_{invoice_type}_{amount_str}_{invoice_number}_{timestamp}{file_ext}"
-            new_file_path = os.path.join(target_dir, new_file_name)
-
-        # 复制并重命名文件
-        shutil.copy2(file_path, new_file_path)
-
-        return new_file_path
-    
     def load_invoices(self):
-        """加载发票列表"""
-        from models.database import get_db, Invoice
-
-        self.invoice_table.setRowCount(0)
-        db = next(get_db())
-        invoices = db.query(Invoice).all()
-
-        for row, invoice in enumerate(invoices):
-            self.invoice_table.insertRow(row)
-            self.invoice_table.setItem(row, 0, QTableWidgetItem(invoice.invoice_number or "未知"))
-            # 显示含税金额
-            total_amount = invoice.amount + invoice.tax_amount if (invoice.amount and invoice.tax_amount) else invoice.amount
-            self.invoice_table.setItem(row, 1, QTableWidgetItem(str(total_amount) if total_amount else "未知"))
-            self.invoice_table.setItem(row, 2, QTableWidgetItem(str(invoice.tax_amount) if invoice.tax_amount else "未知"))
-            self.invoice_table.setItem(row, 3, QTableWidgetItem(invoice.invoice_date.strftime('%Y-%m-%d') if invoice.invoice_date else "未知"))
-            self.invoice_table.setItem(row, 4, QTableWidgetItem(invoice.invoice_type or "未知类型"))
-            # 分类显示（带颜色）
-            category_item = QTableWidgetItem(invoice.category or "未分类")
-            if invoice.category_color:
-                category_item.setBackground(QtGui.QColor(invoice.category_color))
-            self.invoice_table.setItem(row, 5, category_item)
-
-            self.invoice_table.setItem(row, 6, QTableWidgetItem("已报销" if invoice.is_reimbursed else "未报销"))
-            self.invoice_table.setItem(row, 7, QTableWidgetItem(invoice.due_date.strftime('%Y-%m-%d') if invoice.due_date else "未设置"))
-
-            # 行程单状态
-            has_itinerary = "有" if "--- 行程单信息 ---" in invoice.recognized_text else "无"
-            self.invoice_table.setItem(row, 8, QTableWidgetItem(has_itinerary))
-
-            # 操作按钮
-            btn_layout = QHBoxLayout()
-            status_btn = QPushButton("标记报销")
-            status_btn.clicked.connect(lambda checked, id=invoice.id: self.toggle_reimbursement(id))
-            btn_layout.addWidget(status_btn)
-
-            reminder_btn = QPushButton("设置提醒")
-            reminder_btn.clicked.connect(lambda checked, id=invoice.id: self.set_reminder(id))
-            btn_layout.addWidget(reminder_btn)
-
-            category_btn = QPushButton("分类")
-            category_btn.clicked.connect(lambda checked, id=invoice.id: self.set_category(id))
-            btn_layout.addWidget(category_btn)
-
-            delete_btn = QPushButton("删除")
-            delete_btn.clicked.connect(lambda checked, id=invoice.id: self.delete_invoice(id))
-            btn_layout.addWidget(delete_btn)
-
-            btn_widget = QWidget()
-            btn_widget.setLayout(btn_layout)
-            self.invoice_table.setCellWidget(row, 9, btn_widget)
-    
-    def toggle_reimbursement(self, invoice_id):
-        """切换发票报销状态并移动文件到对应文件夹"""
-        from models.database import get_db, Invoice
-        from datetime import datetime
-        import os
-        import shutil
+        """重新加载发票列表，修改个别发票后由 refresh_invoices 只刷新这些行"""
+        from services.invoice_list import invoice_filters
 
-        db = next(get_db())
-        invoice = db.query(Invoice).filter(Invoice.id == invoice_id).first()
-        if invoice:
-            old_is_reimbursed = invoice.is_reimbursed
-            invoice.is_reimbursed = not invoice.is_reimbursed
-            if invoice.is_reimbursed:
-                invoice.reimbursement_date = datetime.now().date()
-            else:
-                invoice.reimbursement_date = None
-
-            # 移动文件到对应文件夹
-            if invoice.pdf_path and os.path.exists(invoice.pdf_path):
-                # 解析发票信息以生成新路径
-                from services.ocr_processor import OCRProcessor
-                ocr = OCRProcessor()
-                text = ocr.extract_text_from_pdf(invoice.pdf_path)
-                parsed_info = ocr.parse_invoice_info(text)
-
-                # 生成新路径
-                new_file_path = self._rename_invoice_file(
-                    invoice.pdf_path, parsed_info, invoice.is_reimbursed, invoice.category
-                )
-
-                # 更新数据库中的文件路径
-                invoice.pdf_path = new_file_path
-
-            db.commit()
-            self.load_invoices()
-    
-    def set_category(self, invoice_id):
-        """设置发票分类"""
-        from models.database import get_db, Invoice
-        from PyQt5.QtGui import QColor
+        query = self.search_edit.text().strip()
+        # 搜索时只显示匹配的发票，按相关度排列，鼠标悬停显示匹配的文本片段；筛选条件对搜索结果同样有效
+        self.invoice_model.load(query, invoice_filters(**self.current_filters()))
+        self.update_totals()
+
+    def refresh_list(self):
+        """重新读取筛选栏的可选值和发票列表"""
+        self.update_filter_choices()
+        self.load_invoices()
+
+    def refresh_invoices(self, invoice_ids):
+        """发票修改提交后只重新读取这些发票所在的行，并更新合计栏"""
+        self.invoice_model.refresh_rows(invoice_ids)
+        self.update_totals()
+
+    def update_totals(self):
+        """更新合计栏，数据来自汇总表"""
+        from models.database import session_scope
+        from services.invoice_summary import invoice_totals
 
-        db = next(get_db())
-        invoice = db.query(Invoice).filter(Invoice.id == invoice_id).first()
-        if not invoice:
+        with session_scope() as db:
+            totals = invoice_totals(db)
+
+        footer = (
+            f"共 {totals['count']} 张，价税合计 ¥{totals['total_amount']:.2f}（税额 ¥{totals['tax_amount']:.2f}）；"
+            f"已报销 {totals['reimbursed_count']} 张 ¥{totals['reimbursed_amount']:.2f}，"
+            f"未报销 {totals['unreimbursed_count']} 张 ¥{totals['unreimbursed_amount']:.2f}"
+        )
+        if self.invoice_model.query:
+            footer = f"搜索结果 {len(self.invoice_model.ids)} 张；全部{footer}"
+        elif self.invoice_model.filters:
+            footer = f"已筛选；全部{footer}"
+        self.totals_label.setText(footer)
+
+    def selected_invoice_ids(self):
+        """选中行的发票ID，按行的顺序排列"""
+        rows = sorted(index.row() for index in self.invoice_table.selectionModel().selectedRows())
+        return [self.invoice_model.invoice_id(row) for row in rows]
+
+    def show_invoice_menu(self, pos):
+        """发票的右键菜单，操作作用于全部选中的发票；在未选中的行上右键时只选中该行"""
+        index = self.invoice_table.indexAt(pos)
+        if not index.isValid():
             return
+        if not self.invoice_table.selectionModel().isRowSelected(index.row(), QModelIndex()):
+            self.invoice_table.selectRow(index.row())
+        invoice_ids = self.selected_invoice_ids()
+        menu = QMenu(self)
+        menu.addAction("标记为已报销", lambda: self.mark_reimbursed(invoice_ids, True))
+        menu.addAction("标记为未报销", lambda: self.mark_reimbursed(invoice_ids, False))
+        menu.addAction("设置提醒", lambda: self.set_reminder(invoice_ids))
+        menu.addAction("分类", lambda: self.set_category(invoice_ids))
+        menu.addSeparator()
+        menu.addAction(f"删除（{len(invoice_ids)}张）" if len(invoice_ids) > 1 else "删除",
+                       lambda: self.delete_invoices(invoice_ids))
+        menu.exec_(self.invoice_table.viewport().mapToGlobal(pos))
+
+    def _file_errors_text(self, errors):
+        """文件操作失败的说明，没有失败时为空"""
+        if not errors:
+            return ""
+        return f"\n\n有 {len(errors)} 个文件处理失败:\n" + "\n".join(f"{path}: {error}" for path, error in errors)
+
+    def mark_reimbursed(self, invoice_ids, reimbursed=True):
+        """批量设置报销状态，并把状态改变的发票文件移动到对应文件夹"""
+        from models.database import session_scope
+        from services.invoice_actions import set_reimbursed
+
+        with session_scope() as db:
+            _, errors = set_reimbursed(db, invoice_ids, reimbursed, datetime.date.today())
+        if errors:
+            QMessageBox.warning(self, "警告", "报销状态已更新。" + self._file_errors_text(errors))
+
+    def set_category(self, invoice_ids):
+        """批量设置发票分类，对话框默认显示第一张发票的分类和颜色"""
+        from models.database import session_scope, Invoice
+        from services.invoice_actions import set_category
+        from PyQt5.QtGui import QColor
+
+        # 读取后立即结束会话，对话框打开期间不持有数据库快照
+        with session_scope() as db:
+            invoice = db.get(Invoice, invoice_ids[0]) if invoice_ids else None
+            if not invoice:
+                return
+            category, category_color = invoice.category, invoice.category_color
 
         # 创建分类对话框
         dialog = QDialog(self)
-        dialog.setWindowTitle("设置分类")
+        dialog.setWindowTitle("设置分类" if len(invoice_ids) == 1 else f"设置 {len(invoice_ids)} 张发票的分类")
         layout = QVBoxLayout(dialog)
 
         # 分类选择
@@ -443,15 +748,15 @@ class MainWindow(QMainWindow):
         categories = ["餐饮", "交通", "办公", "差旅", "娱乐", "其他"]
         category_combo.addItems(categories)
         category_combo.setEditable(True)
-        if invoice.category:
-            category_combo.setCurrentText(invoice.category)
+        if category:
+            category_combo.setCurrentText(category)
         layout.addWidget(category_combo)
 
         # 颜色选择
         color_layout = QHBoxLayout()
         color_label = QLabel("分类颜色:")
         color_btn = QPushButton("选择颜色")
-        current_color = QColor(invoice.category_color) if invoice.category_color else QColor("#FFFFFF")
+        current_color = QColor(category_color) if category_color else QColor("#FFFFFF")
         color_preview = QLabel()
         color_preview.setFixedSize(30, 30)
         color_preview.setStyleSheet(f"background-color: {current_color.name()}")
@@ -473,21 +778,16 @@ class MainWindow(QMainWindow):
         btn_layout = QHBoxLayout()
         ok_btn = QPushButton("确定")
         cancel_btn = QPushButton("取消")
-
-        def on_ok():
-            invoice.category = category_combo.currentText()
-            invoice.category_color = current_color.name() if current_color.isValid() else None
-            db.commit()
-            self.load_invoices()
-            dialog.accept()
-
-        ok_btn.clicked.connect(on_ok)
+        ok_btn.clicked.connect(dialog.accept)
         cancel_btn.clicked.connect(dialog.reject)
         btn_layout.addWidget(ok_btn)
         btn_layout.addWidget(cancel_btn)
         layout.addLayout(btn_layout)
 
-        dialog.exec_()
+        if dialog.exec_() == QDialog.Accepted:
+            with session_scope() as db:
+                set_category(db, invoice_ids, category_combo.currentText(),
+                             current_color.name() if current_color.isValid() else None)
     
     def backup_database(self):
         """备份数据库"""
@@ -497,250 +797,162 @@ class MainWindow(QMainWindow):
             return
 
         # 生成默认备份文件名
-        default_filename = f"invoice_backup_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.db"
+        default_filename = f"invoice_backup_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.db.gz"
         save_path, _ = QFileDialog.getSaveFileName(
-            self, "保存备份", default_filename, "Database Files (*.db);;All Files (*)"
+            self, "保存备份", default_filename, "Compressed Backup (*.db.gz);;Database Files (*.db);;All Files (*)"
         )
 
         if save_path:
-            try:
-                shutil.copy2(DB_PATH, save_path)
-                QMessageBox.information(self, "成功", f"数据库备份成功！\n保存路径：{save_path}")
-            except Exception as e:
-                QMessageBox.critical(self, "备份失败", f"无法创建备份文件：{str(e)}")
+            # 在线备份接口分步复制，在后台线程中执行，备份期间界面可以继续使用
+            self.backup_btn.setEnabled(False)
+            self.backup_thread = TaskThread(lambda progress: self.backup_service.backup_to(save_path, progress), self)
+            self.backup_thread.progressed.connect(
+                lambda done, total, _message: self.statusBar().showMessage(f"正在备份数据库… {done}/{total} 页")
+            )
+
+            def on_finished(path):
+                self.backup_btn.setEnabled(True)
+                self.statusBar().clearMessage()
+                QMessageBox.information(self, "成功", f"数据库备份成功，已通过完整性检查！\n保存路径：{path}")
+
+            def on_failed(message):
+                self.backup_btn.setEnabled(True)
+                self.statusBar().clearMessage()
+                QMessageBox.critical(self, "备份失败", f"无法创建备份文件：{message}")
+
+            self.backup_thread.succeeded.connect(on_finished)
+            self.backup_thread.failed.connect(on_failed)
+            self.backup_thread.start()
     
     def restore_database(self):
-        """恢复数据库"""
-        from models.database import DB_PATH, get_db
-        from sqlalchemy import create_engine
-
-        # 关闭现有数据库连接
-        try:
-            db = next(get_db())
-            db.close()
-        except:
-            pass
-
+        """恢复数据库：在后台线程中校验并写入备份，完成后直接刷新界面，不需要重启程序"""
         # 选择备份文件
         file_path, _ = QFileDialog.getOpenFileName(
-            self, "选择备份文件", "", "Database Files (*.db);;All Files (*)"
+            self, "选择备份文件", "", "Backup Files (*.db.gz *.db);;All Files (*)"
         )
 
         if file_path:
+            if QMessageBox.question(self, "确认恢复", "恢复备份将替换当前的全部数据，当前数据库会先备份为 .bak 文件。是否继续？",
+                                    QMessageBox.Yes | QMessageBox.No) != QMessageBox.Yes:
+                return
+            self.backup_btn.setEnabled(False)
+            self.restore_btn.setEnabled(False)
+            self.statusBar().showMessage("正在恢复数据库…")
+            self.restore_thread = TaskThread(lambda progress: self.backup_service.restore_from(file_path), self)
+
+            def on_finished(safety_path):
+                from services.invoice_search import build_search_index
+
+                self.backup_btn.setEnabled(True)
+                self.restore_btn.setEnabled(True)
+                self.statusBar().clearMessage()
+                # 备份中可能有尚未建立搜索索引的识别文本
+                threading.Thread(target=build_search_index, daemon=True).start()
+                self.refresh_list()
+                QMessageBox.information(self, "成功", f"数据库恢复成功！\n恢复前的数据库已保存为：{safety_path}")
+
+            def on_failed(message):
+                self.backup_btn.setEnabled(True)
+                self.restore_btn.setEnabled(True)
+                self.statusBar().clearMessage()
+                QMessageBox.critical(self, "恢复失败", f"无法恢复数据库，当前数据未改动：{message}")
+
+            self.restore_thread.succeeded.connect(on_finished)
+            self.restore_thread.failed.connect(on_failed)
+            self.restore_thread.start()
+
+    def set_reminder(self, invoice_ids):
+        """批量设置报销截止日期"""
+        from models.database import session_scope
+        from services.invoice_actions import set_due_date
+
+        dialog = QDialog(self)
+        dialog.setWindowTitle("设置提醒")
+        layout = QVBoxLayout(dialog)
+        layout.addWidget(QLabel("选择报销截止日期:"))
+        date_edit = QDateEdit(QDate.currentDate().addDays(7))
+        date_edit.setDisplayFormat("yyyy-MM-dd")
+        date_edit.setCalendarPopup(True)
+        layout.addWidget(date_edit)
+        btn_layout = QHBoxLayout()
+        ok_btn = QPushButton("确定")
+        cancel_btn = QPushButton("取消")
+        ok_btn.clicked.connect(dialog.accept)
+        cancel_btn.clicked.connect(dialog.reject)
+        btn_layout.addWidget(ok_btn)
+        btn_layout.addWidget(cancel_btn)
+        layout.addLayout(btn_layout)
+
+        if dialog.exec_() == QDialog.Accepted:
+            with session_scope() as db:
+                set_due_date(db, invoice_ids, date_edit.date().toPyDate())
+
+    def delete_invoices(self, invoice_ids):
+        """删除发票记录、关联的行程记录，提交后再删除对应的文件"""
+        from models.database import session_scope
+        from services.invoice_actions import delete_invoices
+
+        if not invoice_ids:
+            return
+        question = '确定要删除此发票吗？' if len(invoice_ids) == 1 else f'确定要删除选中的 {len(invoice_ids)} 个发票吗？'
+        reply = QMessageBox.question(self, '确认删除', question, QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+        if reply != QMessageBox.Yes:
+            return
+
+        with session_scope() as db:
             try:
-                # 备份当前数据库（以防万一）
-                backup_path = f"{DB_PATH}.bak"
-                shutil.copy2(DB_PATH, backup_path)
-                
-                # 恢复选中的备份
-                shutil.copy2(file_path, DB_PATH)
-                QMessageBox.information(self, "成功", "数据库恢复成功！程序将重启以应用更改。")
-                # 重启应用
-                os.execl(sys.executable, sys.executable, *sys.argv)
+                deleted_count, errors = delete_invoices(db, invoice_ids)
             except Exception as e:
-                QMessageBox.critical(self, "恢复失败", f"无法恢复数据库：{str(e)}")
-    
-    def set_reminder(self, invoice_id):
-        """设置报销提醒"""
-        from models.database import get_db, Invoice
-
-        db = next(get_db())
-        invoice = db.query(Invoice).filter(Invoice.id == invoice_id).first()
-        if invoice:
-            date_dialog = QDateEdit(QDate.currentDate().addDays(7))
-            date_dialog.setDisplayFormat("yyyy-MM-dd")
-            date_dialog.setCalendarPopup(True)
-
-            if QMessageBox.question(self, "设置提醒", "选择报销截止日期:",
-                                   QMessageBox.Ok | QMessageBox.Cancel) == QMessageBox.Ok:
-                invoice.due_date = date_dialog.date().toPyDate()
-                db.commit()
-                self.load_invoices()
-    
-    def delete_invoice(self, invoice_id):
-        """删除发票记录、对应的文件以及关联的行程记录"""
-        from models.database import get_db, Invoice, Itinerary
-        import os
+                db.rollback()
+                QMessageBox.critical(self, "错误", f"删除发票失败: {str(e)}")
+                return
+        QMessageBox.information(self, "成功", f"成功删除 {deleted_count} 个发票及其关联的行程记录！"
+                                + self._file_errors_text(errors))
 
-        # 显示确认对话框
-        reply = QMessageBox.question(self, '确认删除', '确定要删除此发票吗？',
-                                     QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
-
-        if reply == QMessageBox.Yes:
-            db = next(get_db())
-            invoice = db.query(Invoice).filter(Invoice.id == invoice_id).first()
-            if invoice:
-                try:
-                    # 先删除关联的行程记录
-                    itineraries = db.query(Itinerary).filter(Itinerary.invoice_id == invoice_id).all()
-                    for itinerary in itineraries:
-                        db.delete(itinerary)
-                    
-                    # 删除对应的PDF文件
-                    if invoice.pdf_path and os.path.exists(invoice.pdf_path):
-                        os.remove(invoice.pdf_path)
-
-                    # 从数据库中删除发票记录
-                    db.delete(invoice)
-                    db.commit()
-                    QMessageBox.information(self, "成功", "发票及其关联的行程已成功删除！")
-                    self.load_invoices()
-                except Exception as e:
-                    db.rollback()
-                    QMessageBox.critical(self, "错误", f"删除发票失败: {str(e)}")
-    
     def generate_report(self):
         """生成市内交通明细表，并将选中的发票标记为已报销"""
         from services.excel_generator import ExcelGenerator
-        from models.database import get_db, Invoice
-        from datetime import datetime
-        import os
-        import shutil
+        from services.invoice_actions import set_reimbursed
+        from models.database import session_scope
 
-        # 获取选中的发票ID
-        selected_rows = set(index.row() for index in self.invoice_table.selectedIndexes())
-        if not selected_rows:
+        # 获取选中发票的ID
+        selected_invoice_ids = self.selected_invoice_ids()
+        if not selected_invoice_ids:
             QMessageBox.information(self, "提示", "请先选择要包含在报表中的发票")
             return
 
-        # 获取选中发票的ID
-        db = next(get_db())
-        invoices = db.query(Invoice).all()
-        selected_invoice_ids = []
-        selected_invoices = []
-        for row in selected_rows:
-            invoice_number = self.invoice_table.item(row, 0).text()
-            for invoice in invoices:
-                if invoice.invoice_number == invoice_number:
-                    selected_invoice_ids.append(invoice.id)
-                    selected_invoices.append(invoice)
-                    break
-
-        # 生成报表
-        try:
-            # 创建已报销子文件夹（按当前日期）
-            base_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'invoices', '已报销')
-            current_date = datetime.now().strftime('%Y-%m')
-            reimbursement_folder = os.path.join(base_dir, current_date)
-            os.makedirs(reimbursement_folder, exist_ok=True)
-
-            excel_generator = ExcelGenerator()
-            # 将报表保存到已报销文件夹
-            report_path = excel_generator.generate_transportation_table(selected_invoice_ids, reimbursement_folder)
-
-            # 将选中的发票标记为已报销并移动文件
-            for invoice in selected_invoices:
-                if not invoice.is_reimbursed:
-                    invoice.is_reimbursed = True
-                    invoice.reimbursement_date = datetime.now().date()
-
-                    # 移动发票文件到已报销子文件夹
-                    if invoice.pdf_path and os.path.exists(invoice.pdf_path):
-                        # 解析发票信息以生成新路径
-                        from services.ocr_processor import OCRProcessor
-                        ocr = OCRProcessor()
-                        text = ocr.extract_text_from_pdf(invoice.pdf_path)
-                        parsed_info = ocr.parse_invoice_info(text)
-
-                        # 生成新路径
-                        new_file_path = self._rename_invoice_file(
-                            invoice.pdf_path, parsed_info, True, invoice.category, reimbursement_folder
-                        )
+        # 已报销子文件夹（按当前月份）
+        base_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'invoices', '已报销')
+        reimbursement_folder = os.path.join(base_dir, datetime.datetime.now().strftime('%Y-%m'))
+
+        with session_scope() as db:
+            # 生成报表
+            try:
+                report_path = ExcelGenerator().generate_transportation_table(selected_invoice_ids)
 
-                        # 尝试移动对应的行程单文件
-                        invoice_dir = os.path.dirname(invoice.pdf_path)
-                        invoice_filename = os.path.basename(invoice.pdf_path)
-                        invoice_name_without_ext = os.path.splitext(invoice_filename)[0]
-                        itinerary_filename = f"{invoice_name_without_ext}_行程单.pdf"
-                        itinerary_path = os.path.join(invoice_dir, itinerary_filename)
-
-                        if os.path.exists(itinerary_path):
-                            # 生成行程单新路径
-                            new_itinerary_name = f"{os.path.splitext(os.path.basename(new_file_path))[0]}_行程单.pdf"
-                            new_itinerary_path = os.path.join(reimbursement_folder, new_itinerary_name)
-                            # 移动行程单文件
-                            shutil.move(itinerary_path, new_itinerary_path)
-                            print(f"已移动行程单文件: {itinerary_path} -> {new_itinerary_path}")
-                        else:
-                            # 可能有时间戳的行程单文件
-                            for file in os.listdir(invoice_dir):
-                                if f"{invoice_name_without_ext}_行程单" in file:
-                                    itinerary_path = os.path.join(invoice_dir, file)
-                                    new_itinerary_name = f"{os.path.splitext(os.path.basename(new_file_path))[0]}_{os.path.splitext(file)[1]}"
-                                    new_itinerary_path = os.path.join(reimbursement_folder, new_itinerary_name)
-                                    shutil.move(itinerary_path, new_itinerary_path)
-                                    print(f"已移动行程单文件: {itinerary_path} -> {new_itinerary_path}")
-                                    break
-
-                        # 更新数据库中的文件路径
-                        invoice.pdf_path = new_file_path
-
-            db.commit()
-            self.load_invoices()
-
-            QMessageBox.information(self, "成功", f"报表生成成功！\n文件路径：{report_path}\n已将选中的发票标记为已报销并移动到对应文件夹。")
-            # 打开生成的报表
+                # 将选中的发票标记为已报销，提交后把发票和行程单文件移动到已报销子文件夹
+                _, errors = set_reimbursed(db, selected_invoice_ids, True, datetime.date.today(), reimbursement_folder)
+            except Exception as e:
+                db.rollback()
+                QMessageBox.critical(self, "错误", f"生成报表失败: {str(e)}")
+                return
+
+        QMessageBox.information(self, "成功", f"报表生成成功！\n文件路径：{report_path}\n已将选中的发票标记为已报销并移动到对应文件夹。"
+                                + self._file_errors_text(errors))
+        # 打开生成的报表
+        try:
             os.startfile(report_path)
-        except Exception as e:
-            db.rollback()
-            QMessageBox.critical(self, "错误", f"生成报表失败: {str(e)}")
-    
+        except (AttributeError, OSError) as e:
+            QMessageBox.warning(self, "警告", f"无法打开报表: {str(e)}")
+
     def bulk_delete_invoices(self):
         """批量删除选中的发票及其关联的行程记录"""
-        # 获取选中的行
-        selected_rows = set(index.row() for index in self.invoice_table.selectedIndexes())
-        if not selected_rows:
+        invoice_ids = self.selected_invoice_ids()
+        if not invoice_ids:
             QMessageBox.warning(self, "警告", "请先选择要删除的发票！")
             return
+        self.delete_invoices(invoice_ids)
 
-        # 确认删除
-        reply = QMessageBox.question(self, '确认删除', f'确定要删除选中的 {len(selected_rows)} 个发票吗？',
-                                     QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
-
-        if reply == QMessageBox.Yes:
-            from models.database import get_db, Invoice, Itinerary
-            import os
-
-            db = next(get_db())
-            invoices = db.query(Invoice).all()
-            deleted_count = 0
-            failed_count = 0
-            failed_invoices = []
-
-            try:
-                for row in selected_rows:
-                    invoice_number = self.invoice_table.item(row, 0).text()
-                    # 查找对应的发票
-                    for invoice in invoices:
-                        if invoice.invoice_number == invoice_number:
-                            try:
-                                # 删除关联的行程记录
-                                itineraries = db.query(Itinerary).filter(Itinerary.invoice_id == invoice.id).all()
-                                for itinerary in itineraries:
-                                    db.delete(itinerary)
-
-                                # 删除对应的PDF文件
-                                if invoice.pdf_path and os.path.exists(invoice.pdf_path):
-                                    os.remove(invoice.pdf_path)
-
-                                # 从数据库中删除发票记录
-                                db.delete(invoice)
-                                deleted_count += 1
-                            except Exception as e:
-                                failed_count += 1
-                                failed_invoices.append(f"{invoice_number}: {str(e)}")
-                            break
-
-                db.commit()
-                message = f"成功删除 {deleted_count} 个发票及其关联的行程记录！"
-                if failed_count > 0:
-                    message += f"\n\n有 {failed_count} 个发票删除失败:\n" + "\n".join(failed_invoices)
-                QMessageBox.information(self, "成功", message)
-                self.load_invoices()
-            except Exception as e:
-                db.rollback()
-                QMessageBox.critical(self, "错误", f"批量删除失败: {str(e)}")
-    
     def manual_add_invoice(self):
         """手动添加发票信息"""
         from PyQt5.QtWidgets import QDialog, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QDateEdit, QPushButton, QFileDialog, QComboBox, QDoubleSpinBox
@@ -843,56 +1055,69 @@ class MainWindow(QMainWindow):
                 return
 
             try:
-                from models.database import get_db, Invoice
-
-                # 处理文件
-                new_file_path = ""
-                if selected_file_path:
-                    # 重命名并保存文件
-                    base_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'invoices', '未报销')
-                    os.makedirs(base_dir, exist_ok=True)
-
-                    # 生成新文件名 - 使用含税金额
-                    date_str = invoice_date.strftime('%Y%m%d')
-                    file_ext = os.path.splitext(selected_file_path)[1]
-                    # 计算含税金额（价税合计）
-                    total_amount = amount + tax_amount
-                    new_file_name = f"{date_str}_{category}_{invoice_type}_{total_amount:.2f}_{invoice_number}{file_ext}"
-                    new_file_path = os.path.join(base_dir, new_file_name)
-
-                    # 检查文件是否已存在，如果存在且内容相同，则直接使用现有文件
-                    if os.path.exists(new_file_path):
-                        if self._compare_file_contents(selected_file_path, new_file_path):
-                            # 文件内容相同，不复制新文件
-                            pass
-                        else:
-                            # 内容不同时添加时间戳
-                            timestamp = datetime.now().strftime('%H%M%S')
-                            new_file_name = f"{date_str}_{category}_{invoice_type}_{total_amount:.2f}_{invoice_number}_{timestamp}{file_ext}"
+                from models.database import begin_write, session_scope, Invoice
+                from services.duplicate_index import business_key, find_by_business_key, find_by_content_hash
+                from services.extraction_cache import hash_file
+
+                key = business_key(invoice_number, amount, invoice_date)
+                content_hash = hash_file(selected_file_path) if selected_file_path else None
+                # 先按业务指纹和文件内容检查是否已导入，重复时不复制文件；查重和写入在同一个事务中，开始时就取得写锁
+                with session_scope() as db:
+                    begin_write(db)
+                    existing_id = (find_by_business_key(db, [key]).get(key)
+                                   or find_by_content_hash(db, [content_hash]).get(content_hash))
+                    if not existing_id:
+                        # 处理文件
+                        new_file_path = ""
+                        if selected_file_path:
+                            # 重命名并保存文件
+                            base_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'invoices', '未报销')
+                            os.makedirs(base_dir, exist_ok=True)
+
+                            # 生成新文件名 - 使用含税金额
+                            date_str = invoice_date.strftime('%Y%m%d')
+                            file_ext = os.path.splitext(selected_file_path)[1]
+                            # 计算含税金额（价税合计）
+                            total_amount = amount + tax_amount
+                            new_file_name = f"{date_str}_{category}_{invoice_type}_{total_amount:.2f}_{invoice_number}{file_ext}"
                             new_file_path = os.path.join(base_dir, new_file_name)
-                            shutil.copy2(selected_file_path, new_file_path)
-                    else:
-                        # 文件不存在，直接复制
-                        shutil.copy2(selected_file_path, new_file_path)
-
-                # 创建发票记录
-                db = next(get_db())
-                new_invoice = Invoice(
-                    invoice_number=invoice_number,
-                    pdf_path=new_file_path,
-                    amount=amount,
-                    tax_amount=tax_amount,
-                    invoice_date=invoice_date,
-                    invoice_type=invoice_type,
-                    category=category,
-                    recognized_text=f"手动添加发票\n发票类型: {invoice_type}\n金额: {amount}\n税额: {tax_amount}"
-                )
-                db.add(new_invoice)
-                db.commit()
 
+                            # 检查文件是否已存在，如果存在且内容相同，则直接使用现有文件
+                            if os.path.exists(new_file_path):
+                                if self._compare_file_contents(selected_file_path, new_file_path):
+                                    # 文件内容相同，不复制新文件
+                                    pass
+                                else:
+                                    # 内容不同时添加时间戳
+                                    timestamp = datetime.now().strftime('%H%M%S')
+                                    new_file_name = f"{date_str}_{category}_{invoice_type}_{total_amount:.2f}_{invoice_number}_{timestamp}{file_ext}"
+                                    new_file_path = os.path.join(base_dir, new_file_name)
+                                    shutil.copy2(selected_file_path, new_file_path)
+                            else:
+                                # 文件不存在，直接复制
+                                shutil.copy2(selected_file_path, new_file_path)
+
+                        # 创建发票记录
+                        new_invoice = Invoice(
+                            invoice_number=invoice_number,
+                            pdf_path=new_file_path,
+                            amount=amount,
+                            tax_amount=tax_amount,
+                            invoice_date=invoice_date,
+                            invoice_type=invoice_type,
+                            category=category,
+                            content_hash=content_hash,
+                            business_key=key,
+                            recognized_text=f"手动添加发票\n发票类型: {invoice_type}\n金额: {amount}\n税额: {tax_amount}"
+                        )
+                        db.add(new_invoice)
+
+                # 会话结束后再显示对话框，对话框打开期间不占用数据库
+                if existing_id:
+                    QMessageBox.warning(dialog, "警告", f"该发票已导入（发票ID {existing_id}），不能重复添加！")
+                    return
                 QMessageBox.information(dialog, "成功", "发票添加成功！")
                 dialog.accept()
-                self.load_invoices()
             except Exception as e:
                 QMessageBox.critical(dialog, "错误", f"添加发票失败: {str(e)}")
 
@@ -1,26 +1,118 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, Boolean, Date, DateTime
+from sqlalchemy import (
+    create_engine, event, func, literal_column, select, Column, Integer, String, Float, Boolean, Date, DateTime, ForeignKey, Index, LargeBinary, text
+)
+from sqlalchemy.engine import Engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, scoped_session, relationship
 import os
+import re
+import sqlite3
+import threading
+import zlib
+from contextlib import contextmanager
 from datetime import datetime
 
+from models.migrations import migrate, SEARCH_INDEX_DDL, SUMMARY_DDL
+
 # 数据库配置
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_PATH = os.path.join(BASE_DIR, '..', 'invoice_manager.db')
 SQLALCHEMY_DATABASE_URL = f'sqlite:///{DB_PATH}'
 
+def sqlite_pragmas():
+    """
+    每个连接建立时设置的PRAGMA，可用环境变量调整：
+    SQLITE_SYNCHRONOUS（默认NORMAL，WAL模式下断电最多丢失最后几次提交，不会损坏数据库）、
+    SQLITE_CACHE_SIZE_MB（每个连接的页缓存，默认64）、SQLITE_MMAP_SIZE_MB（内存映射读取的大小，默认256，0为关闭）
+    """
+    return {
+        # WAL模式下读不阻塞写、写不阻塞读，提醒线程和界面可同时访问数据库
+        'journal_mode': 'WAL',
+        'synchronous': os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL') or 'NORMAL',
+        # 负数表示以KB为单位
+        'cache_size': -int(float(os.getenv('SQLITE_CACHE_SIZE_MB', '64') or 0) * 1024),
+        'mmap_size': int(float(os.getenv('SQLITE_MMAP_SIZE_MB', '256') or 0) * 1024 * 1024),
+    }
+
+def create_sqlite_engine(db_path, pragmas=None):
+    """
+    创建SQLite引擎，每个新连接设置 pragmas
+    :param db_path: 数据库文件路径
+    :param pragmas: {名称: 值}，默认使用 sqlite_pragmas()，在连接时读取，因此 .env 中的设置也会生效
+    """
+    new_engine = create_engine(f'sqlite:///{db_path}', connect_args={'check_same_thread': False})
+
+    @event.listens_for(new_engine, "connect")
+    def _apply_pragmas(dbapi_connection, connection_record):
+        for name, value in (pragmas or sqlite_pragmas()).items():
+            dbapi_connection.execute(f"PRAGMA {name} = {value}")
+
+    return new_engine
+
 # 创建引擎
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={'check_same_thread': False}
-)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+engine = create_sqlite_engine(DB_PATH)
+# 会话在作用域结束时关闭，提交后不让已加载的对象过期，离开作用域后仍可读取已加载的属性
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+
+# 每个线程一个会话：界面、提醒线程和后台任务各自使用自己的会话和连接
+ScopedSession = scoped_session(SessionLocal)
+_scope_depth = threading.local()
 
 # 基础模型
 Base = declarative_base()
 
+def compress_text(text):
+    """压缩识别文本，存入 invoice_texts"""
+    return zlib.compress(text.encode('utf-8'))
+
+def decompress_text(content):
+    """解压 invoice_texts 中的识别文本"""
+    return zlib.decompress(content).decode('utf-8') if content is not None else None
+
+# 中日韩文字，全文索引中每个字单独作为一个词
+_CJK_CHAR = re.compile(r'([\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff])')
+
+def search_text(text):
+    """
+    全文索引使用的文本：unicode61 分词器会把连续的汉字当作一个词，在每个汉字两侧加空格后逐字成词，
+    搜索时把搜索词作为短语匹配，即可查到任意位置、任意长度的中文片段
+    """
+    return _CJK_CHAR.sub(r' \1 ', text) if text is not None else None
+
+@event.listens_for(Engine, "connect")
+def _register_sqlite_functions(dbapi_connection, connection_record):
+    """为每个SQLite连接注册全文索引触发器使用的函数"""
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.create_function(
+            'invoice_search_text', 1, lambda content: search_text(decompress_text(content)), deterministic=True
+        )
+        # sqlite3模块只在写语句前隐式开启事务，最外层的SAVEPOINT释放时会直接提交；
+        # 关闭它的事务管理，由下面的 begin 事件显式开启事务，SAVEPOINT才能正确嵌套在事务中
+        dbapi_connection.isolation_level = None
+
+@event.listens_for(Engine, "begin")
+def _begin_sqlite_transaction(connection):
+    if connection.dialect.name == 'sqlite':
+        # 默认的 DEFERRED 事务在第一次读取时取得快照；begin_write 设置的 IMMEDIATE 事务开始时就取得写锁
+        connection.exec_driver_sql(f"BEGIN {connection.get_execution_options().get('sqlite_begin', 'DEFERRED')}")
+
+def begin_write(db):
+    """
+    以 BEGIN IMMEDIATE 开启会话的事务，用于先读后写的事务：开始时就取得写锁，其他连接要写入时按 busy_timeout 等待。
+    普通事务先读取时持有快照，期间其他连接提交过修改的话，之后的写入会直接失败（SQLITE_BUSY_SNAPSHOT），不会等待重试
+    :param db: 没有进行中事务的会话
+    """
+    db.connection(execution_options={'sqlite_begin': 'IMMEDIATE'})
+
 class Invoice(Base):
     """发票模型"""
     __tablename__ = "invoices"
+    __table_args__ = (
+        # 提醒服务只查询未报销且设置了截止日期的发票，部分索引只包含这些行
+        Index('ix_invoices_reminder', 'due_date', sqlite_where=text('is_reimbursed = 0 AND due_date IS NOT NULL')),
+        # 按分类生成报表时按开票日期排序
+        Index('ix_invoices_category_date', 'category', 'invoice_date'),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     invoice_number = Column(String, index=True, comment="发票编号")
@@ -29,7 +121,8 @@ class Invoice(Base):
     tax_amount = Column(Float, nullable=True, comment="税额")
     invoice_date = Column(Date, comment="发票日期")
     invoice_type = Column(String, nullable=True, comment="发票类型")
-    recognized_text = Column(String, comment="OCR识别文本")
+    content_hash = Column(String, index=True, nullable=True, comment="PDF文件内容哈希，用于判断重复导入")
+    business_key = Column(String, index=True, nullable=True, comment="业务指纹：发票编号|金额|日期，用于判断重复导入")
     is_reimbursed = Column(Boolean, default=False, comment="是否报销")
     reimbursement_date = Column(Date, nullable=True, comment="报销日期")
     due_date = Column(Date, nullable=True, comment="报销截止日期")
@@ -39,14 +132,177 @@ class Invoice(Base):
     created_at = Column(DateTime, default=datetime.utcnow, comment="创建时间")
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, comment="更新时间")
 
-# 初始化数据库
+    # 识别文本单独存放在 invoice_texts，列表查询不会读取，首次访问 recognized_text 时才加载
+    text_record = relationship("InvoiceText", uselist=False, cascade="all, delete-orphan")
+    # 行程单中的每一笔行程，按序号排列；删除发票时一并删除。需要逐张读取行程时用 selectinload 一次查出
+    itineraries = relationship(
+        "Itinerary", back_populates="invoice", order_by="Itinerary.sequence", cascade="all, delete-orphan"
+    )
+
+    @property
+    def recognized_text(self):
+        """OCR识别文本"""
+        return decompress_text(self.text_record.content) if self.text_record else None
+
+    @recognized_text.setter
+    def recognized_text(self, text):
+        if text is None:
+            self.text_record = None
+        elif self.text_record is None:
+            self.text_record = InvoiceText(content=compress_text(text))
+        else:
+            self.text_record.content = compress_text(text)
+
+class InvoiceText(Base):
+    """发票OCR识别文本，zlib压缩后与发票行分开存放"""
+    __tablename__ = "invoice_texts"
+
+    invoice_id = Column(Integer, ForeignKey("invoices.id"), primary_key=True, comment="发票ID")
+    content = Column(LargeBinary, comment="zlib压缩的UTF-8识别文本")
+
+class Itinerary(Base):
+    """行程模型，对应行程单中的每一笔行程"""
+    __tablename__ = "itineraries"
+
+    id = Column(Integer, primary_key=True, index=True)
+    invoice_id = Column(Integer, ForeignKey("invoices.id"), index=True, comment="所属发票ID")
+    sequence = Column(Integer, comment="行程序号")
+    vehicle_type = Column(String, comment="车型")
+    start_time = Column(DateTime, comment="上车时间")
+    start_location = Column(String, comment="起点")
+    end_location = Column(String, comment="终点")
+    amount = Column(Float, comment="行程金额")
+    created_at = Column(DateTime, default=datetime.utcnow, comment="创建时间")
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, comment="更新时间")
+
+    invoice = relationship("Invoice", back_populates="itineraries")
+
+# 价税合计，发票列表显示、筛选和排序使用；ix_invoices_total_amount 是这个表达式上的索引，
+# 0 写成字面量，SQL中的表达式才与索引一致
+TOTAL_AMOUNT = Invoice.amount + func.coalesce(Invoice.tax_amount, literal_column('0'))
+
+# 发票列表按这些字段筛选和排序
+Index('ix_invoices_invoice_date', Invoice.invoice_date)
+Index('ix_invoices_total_amount', TOTAL_AMOUNT)
+Index('ix_invoices_invoice_type', Invoice.invoice_type)
+Index('ix_invoices_due_date', Invoice.due_date)
+
+# 每张发票的行程数，作为关联子查询放在列表查询中，通过 ix_itineraries_invoice_id 计数，不读取识别文本
+ITINERARY_COUNT = (
+    select(func.count(Itinerary.id)).where(Itinerary.invoice_id == Invoice.id)
+    .correlate(Invoice).scalar_subquery().label('itinerary_count')
+)
+
+# 发票列表显示需要的字段，只查询这些列比加载完整的发票对象省内存
+LIST_COLUMNS = (
+    Invoice.id, Invoice.invoice_number, Invoice.amount, Invoice.tax_amount, Invoice.invoice_date,
+    Invoice.invoice_type, Invoice.category, Invoice.category_color, Invoice.is_reimbursed, Invoice.due_date,
+    TOTAL_AMOUNT.label('total_amount'), ITINERARY_COUNT,
+)
+
+class ReparseCheckpoint(Base):
+    """批量重新解析的进度，每个解析器版本一条，用于中断后继续"""
+    __tablename__ = "reparse_checkpoints"
+
+    parser_version = Column(String, primary_key=True, comment="解析器版本")
+    last_invoice_id = Column(Integer, default=0, comment="已处理到的最大发票ID")
+    scanned = Column(Integer, default=0, comment="已扫描行数")
+    changed = Column(Integer, default=0, comment="已更新行数")
+    finished_at = Column(DateTime, nullable=True, comment="完成时间")
+    created_at = Column(DateTime, default=datetime.utcnow, comment="创建时间")
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, comment="更新时间")
+
+class InvoiceSummary(Base):
+    """按分类、开票月份和报销状态汇总的发票张数和金额，由 invoices 上的触发器维护，不要直接修改"""
+    __tablename__ = "invoice_summary"
+
+    category = Column(String, primary_key=True, comment="发票分类，未分类为空字符串")
+    month = Column(String, primary_key=True, comment="开票月份 YYYY-MM，没有日期为空字符串")
+    is_reimbursed = Column(Boolean, primary_key=True, comment="是否报销")
+    invoice_count = Column(Integer, nullable=False, comment="发票张数")
+    amount_cents = Column(Integer, nullable=False, comment="金额合计（分）")
+    tax_cents = Column(Integer, nullable=False, comment="税额合计（分）")
+
+# create_all 建表时同时创建全文搜索索引和汇总触发器，与迁移得到的表结构一致
+@event.listens_for(Base.metadata, "after_create")
+def _create_triggers(target, connection, **kw):
+    for statement in SEARCH_INDEX_DDL + SUMMARY_DDL:
+        connection.exec_driver_sql(statement)
+
+# 初始化数据库：按版本号执行未完成的迁移，版本已是最新时只读取一次版本号
 def init_db():
-    Base.metadata.create_all(bind=engine)
+    migrate(engine)
+
+@contextmanager
+def session_scope():
+    """
+    使用当前线程的数据库会话：最外层退出时提交，发生异常时回滚，并关闭会话归还连接；
+    嵌套使用时共用外层的会话和事务，由最外层提交或回滚
+    """
+    depth = getattr(_scope_depth, 'value', 0)
+    db = ScopedSession()
+    _scope_depth.value = depth + 1
+    try:
+        yield db
+        if depth == 0:
+            db.commit()
+    except BaseException:
+        if depth == 0:
+            db.rollback()
+        raise
+    finally:
+        _scope_depth.value = depth
+        if depth == 0:
+            ScopedSession.remove()
 
-# 获取数据库会话
+# 获取独立的数据库会话（生成器，用完后由调用方关闭生成器）；程序中使用 session_scope
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# 发票修改通知：会话提交后把这次提交中新增、修改和删除的发票ID交给监听函数，界面据此只重新读取这些行
+_invoice_listeners = []
+
+def on_invoices_changed(listener):
+    """
+    注册监听函数 listener(发票ID集合)。在提交会话的线程中调用，界面应通过信号转到界面线程处理
+    :return: listener，可作为装饰器使用
+    """
+    _invoice_listeners.append(listener)
+    return listener
+
+def remove_invoices_listener(listener):
+    """取消 on_invoices_changed 注册的监听函数"""
+    if listener in _invoice_listeners:
+        _invoice_listeners.remove(listener)
+
+def mark_invoices_changed(db, invoice_ids):
+    """
+    登记用Core语句批量新增、修改或删除的发票，ORM对象的修改会自动登记；会话提交后一并通知，回滚时丢弃
+    :param db: 执行修改的会话
+    :param invoice_ids: 发票ID
+    """
+    db.info.setdefault('changed_invoice_ids', set()).update(invoice_ids)
+
+@event.listens_for(SessionLocal, "after_flush")
+def _collect_changed_invoices(session, flush_context):
+    changed = [obj.id for obj in (*session.new, *session.dirty, *session.deleted) if isinstance(obj, Invoice)]
+    # 行程数显示在发票列表中，行程的增删也算作发票的修改
+    changed += [obj.invoice_id for obj in (*session.new, *session.dirty, *session.deleted) if isinstance(obj, Itinerary)]
+    if changed:
+        mark_invoices_changed(session, changed)
+
+@event.listens_for(SessionLocal, "after_commit")
+def _notify_changed_invoices(session):
+    invoice_ids = session.info.pop('changed_invoice_ids', None)
+    invoice_ids = {invoice_id for invoice_id in invoice_ids or () if invoice_id is not None}
+    if invoice_ids:
+        for listener in list(_invoice_listeners):
+            listener(invoice_ids)
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_changed_invoices(session):
+    session.info.pop('changed_invoice_ids', None)
@@ -0,0 +1,405 @@
+import hashlib
+import re
+import sqlite3
+import zlib
+from datetime import date, datetime
+
+# 已发布的迁移步骤必须对同一个数据库总是得到相同结果，不能随解析器、指纹规则的后续修改而变化，
+# 下面是这些步骤用到的规则在发布时的副本，以后不要修改
+
+# 行程单文本合并到识别文本时使用的分隔标记
+_ITINERARY_MARKER = '--- 行程单信息 ---'
+# 行程单中的一行：序号、车型、上车时间、（星期）、城市、起点、终点、里程、金额
+_ITINERARY_ROW_PATTERN = re.compile(
+    r'^(\d+)[ \t]+(\S+)[ \t]+(\d{1,2}-\d{1,2}[ \t]+\d{1,2}:\d{2})[ \t]+(?:周\S[ \t]+)?(\S+)[ \t]+(\S+)[ \t]+'
+    r'(.+?)[ \t]+([\d.]+)[ \t]+([\d.]+)(?:[ \t].*)?$',
+    re.MULTILINE
+)
+_ITINERARY_YEAR_PATTERN = re.compile(r'(?:行程起止日期|申请日期)[:：]\s*(\d{4})-')
+
+
+def _business_key(invoice_number, amount, invoice_date):
+    """业务指纹：发票号码|金额|开票日期，缺少任一项时为None"""
+    if not invoice_number or amount is None or invoice_date is None:
+        return None
+    return f"{invoice_number}|{amount:.2f}|{invoice_date.isoformat()}"
+
+
+def _hash_file(path, chunk_size=1024 * 1024):
+    """文件内容的SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _compress_text(text):
+    """识别文本的存储格式，models.database.decompress_text 必须一直能读取"""
+    return zlib.compress(text.encode('utf-8'))
+
+
+def _itinerary_rows(text):
+    """从行程单文本中解析每一笔行程：(序号, 车型, 上车时间, 起点, 终点, 金额)"""
+    year_match = _ITINERARY_YEAR_PATTERN.search(text)
+    year = int(year_match.group(1)) if year_match else datetime.now().year
+    rows = []
+    for match in _ITINERARY_ROW_PATTERN.finditer(text):
+        sequence, vehicle_type, start_time, _city, start_location, end_location, _mileage, amount = match.groups()
+        try:
+            start_time = datetime.strptime(f"{year}-{' '.join(start_time.split())}", '%Y-%m-%d %H:%M')
+            amount = float(amount)
+        except ValueError:
+            continue
+        rows.append((int(sequence), vehicle_type, start_time, start_location, end_location, amount))
+    return rows
+
+
+def _columns(conn, table):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def _add_column(conn, table, column, column_type):
+    """添加列；版本号出现之前的数据库可能已经由旧脚本加过这一列"""
+    if column not in _columns(conn, table):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+
+
+def _create_invoices(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS invoices (
+            id INTEGER NOT NULL,
+            invoice_number VARCHAR,
+            pdf_path VARCHAR,
+            amount FLOAT,
+            invoice_date DATE,
+            recognized_text VARCHAR,
+            is_reimbursed BOOLEAN,
+            reimbursement_date DATE,
+            due_date DATE,
+            reminder_date DATETIME,
+            category VARCHAR,
+            category_color VARCHAR,
+            created_at DATETIME,
+            updated_at DATETIME,
+            PRIMARY KEY (id)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_invoices_id ON invoices (id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_invoices_invoice_number ON invoices (invoice_number)")
+
+
+def _add_tax_and_type(conn):
+    # 原 fix_database.py / migrate_db.py
+    _add_column(conn, 'invoices', 'tax_amount', 'FLOAT')
+    _add_column(conn, 'invoices', 'invoice_type', 'VARCHAR')
+
+
+def _create_itineraries(conn):
+    # 原 migrate_itinerary_table.py
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS itineraries (
+            id INTEGER NOT NULL,
+            invoice_id INTEGER,
+            sequence INTEGER,
+            vehicle_type VARCHAR,
+            start_time DATETIME,
+            start_location VARCHAR,
+            end_location VARCHAR,
+            amount FLOAT,
+            created_at DATETIME,
+            updated_at DATETIME,
+            PRIMARY KEY (id),
+            FOREIGN KEY(invoice_id) REFERENCES invoices (id)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_itineraries_id ON itineraries (id)")
+
+
+def _add_fingerprints(conn):
+    """重复导入判断用的内容哈希和业务指纹，并为已有发票补算"""
+    _add_column(conn, 'invoices', 'content_hash', 'VARCHAR')
+    _add_column(conn, 'invoices', 'business_key', 'VARCHAR')
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_invoices_content_hash ON invoices (content_hash)")
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_invoices_business_key ON invoices (business_key)")
+    keys = []
+    hashes = []
+    for invoice_id, invoice_number, amount, invoice_date, pdf_path in conn.execute(
+        "SELECT id, invoice_number, amount, invoice_date, pdf_path FROM invoices"
+    ).fetchall():
+        key = _business_key(invoice_number, amount, date.fromisoformat(invoice_date) if invoice_date else None)
+        if key:
+            keys.append((key, invoice_id))
+        if pdf_path:
+            try:
+                hashes.append((_hash_file(pdf_path), invoice_id))
+            except OSError:
+                # 文件已不存在的发票只有业务指纹
+                pass
+    conn.executemany("UPDATE invoices SET business_key = ? WHERE id = ?", keys)
+    conn.executemany("UPDATE invoices SET content_hash = ? WHERE id = ?", hashes)
+
+
+def _create_reparse_checkpoints(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS reparse_checkpoints (
+            parser_version VARCHAR NOT NULL,
+            last_invoice_id INTEGER,
+            scanned INTEGER,
+            changed INTEGER,
+            finished_at DATETIME,
+            created_at DATETIME,
+            updated_at DATETIME,
+            PRIMARY KEY (parser_version)
+        )
+    """)
+
+
+def _add_query_indexes(conn):
+    """提醒、分类报表和删除发票时使用的索引"""
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS ix_invoices_reminder ON invoices (due_date) "
+        "WHERE is_reimbursed = 0 AND due_date IS NOT NULL"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_invoices_category_date ON invoices (category, invoice_date)")
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_itineraries_invoice_id ON itineraries (invoice_id)")
+
+
+def _move_recognized_text(conn):
+    """
+    识别文本压缩后移到 invoice_texts，发票行只保留列表需要的字段。
+    列表不再读取识别文本判断是否有行程单，合并了行程单文本但还没有行程记录的旧发票在这里补建行程记录
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS invoice_texts (
+            invoice_id INTEGER NOT NULL,
+            content BLOB,
+            PRIMARY KEY (invoice_id),
+            FOREIGN KEY(invoice_id) REFERENCES invoices (id)
+        )
+    """)
+    if 'recognized_text' not in _columns(conn, 'invoices'):
+        return
+    with_itineraries = {row[0] for row in conn.execute("SELECT DISTINCT invoice_id FROM itineraries")}
+    now = datetime.utcnow().isoformat(' ', 'microseconds')
+    # 按ID分批搬移，内存占用与发票数量无关
+    after_id = 0
+    while True:
+        rows = conn.execute(
+            "SELECT id, recognized_text FROM invoices WHERE id > ? AND recognized_text IS NOT NULL ORDER BY id LIMIT 500",
+            (after_id,)
+        ).fetchall()
+        if not rows:
+            break
+        after_id = rows[-1][0]
+        conn.executemany(
+            "INSERT OR REPLACE INTO invoice_texts (invoice_id, content) VALUES (?, ?)",
+            [(invoice_id, _compress_text(text)) for invoice_id, text in rows]
+        )
+        itineraries = []
+        for invoice_id, text in rows:
+            marker = f"\n\n{_ITINERARY_MARKER}\n"
+            if marker not in text or invoice_id in with_itineraries:
+                continue
+            for sequence, vehicle_type, start_time, start_location, end_location, amount in _itinerary_rows(
+                text.split(marker, 1)[1]
+            ):
+                itineraries.append((
+                    invoice_id, sequence, vehicle_type, start_time.isoformat(' ', 'microseconds'),
+                    start_location, end_location, amount, now, now
+                ))
+        conn.executemany(
+            "INSERT INTO itineraries (invoice_id, sequence, vehicle_type, start_time, start_location, end_location, "
+            "amount, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            itineraries
+        )
+    if sqlite3.sqlite_version_info >= (3, 35, 0):
+        conn.execute("ALTER TABLE invoices DROP COLUMN recognized_text")
+    else:
+        # 旧版SQLite不支持删除列，清空后空间由后续写入复用
+        conn.execute("UPDATE invoices SET recognized_text = NULL")
+
+
+# 全文搜索索引：invoice_search 保存 search_text 处理后的识别文本，由触发器与 invoice_texts 同步；
+# 触发器调用的 invoice_search_text 函数在 models/database.py 中为每个连接注册。
+# 修改这里的语句时需要追加新的迁移步骤，已有数据库不会重新执行旧步骤
+SEARCH_INDEX_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS invoice_search USING fts5(text, tokenize = 'unicode61')",
+    # 迁移前已有的识别文本由 services.invoice_search.build_search_index 分批补建索引，这里记录进度
+    """
+    CREATE TABLE IF NOT EXISTS search_index_state (
+        id INTEGER NOT NULL CHECK (id = 1),
+        next_id INTEGER NOT NULL,
+        until_id INTEGER NOT NULL,
+        PRIMARY KEY (id)
+    )
+    """,
+    "INSERT OR IGNORE INTO search_index_state (id, next_id, until_id) VALUES (1, 1, 0)",
+    """
+    CREATE TRIGGER IF NOT EXISTS invoice_texts_search_insert AFTER INSERT ON invoice_texts BEGIN
+        INSERT INTO invoice_search (rowid, text) VALUES (new.invoice_id, invoice_search_text(new.content));
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS invoice_texts_search_update AFTER UPDATE OF content ON invoice_texts BEGIN
+        DELETE FROM invoice_search WHERE rowid = old.invoice_id;
+        INSERT INTO invoice_search (rowid, text) VALUES (new.invoice_id, invoice_search_text(new.content));
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS invoice_texts_search_delete AFTER DELETE ON invoice_texts BEGIN
+        DELETE FROM invoice_search WHERE rowid = old.invoice_id;
+    END
+    """,
+    # 不经过ORM批量删除发票时，一并删除识别文本和搜索索引
+    """
+    CREATE TRIGGER IF NOT EXISTS invoices_delete_text AFTER DELETE ON invoices BEGIN
+        DELETE FROM invoice_texts WHERE invoice_id = old.id;
+    END
+    """,
+]
+
+
+def _create_search_index(conn):
+    """创建全文搜索索引和同步触发器；已有的识别文本不在迁移中建索引，启动后在后台分批补建"""
+    for statement in SEARCH_INDEX_DDL:
+        conn.execute(statement)
+    conn.execute("UPDATE search_index_state SET next_id = 1, until_id = (SELECT coalesce(max(invoice_id), 0) FROM invoice_texts)")
+
+
+# 分类/月份汇总：invoice_summary 按（分类, 开票月份, 是否报销）累计发票张数、金额和税额，由触发器随发票的增删改更新，
+# 查询合计时不需要扫描发票表。金额以分为单位的整数累加，反复增减不会产生浮点误差；没有分类或日期的发票记为空字符串
+_SUMMARY_KEY = (
+    "coalesce({row}.category, ''), coalesce(strftime('%Y-%m', {row}.invoice_date), ''), coalesce({row}.is_reimbursed, 0)"
+)
+_SUMMARY_ADD = f"""
+    INSERT INTO invoice_summary (category, month, is_reimbursed, invoice_count, amount_cents, tax_cents)
+    VALUES ({_SUMMARY_KEY.format(row='new')}, 1,
+            CAST(round(coalesce(new.amount, 0) * 100) AS INTEGER), CAST(round(coalesce(new.tax_amount, 0) * 100) AS INTEGER))
+    ON CONFLICT (category, month, is_reimbursed) DO UPDATE SET
+        invoice_count = invoice_count + 1,
+        amount_cents = amount_cents + excluded.amount_cents,
+        tax_cents = tax_cents + excluded.tax_cents;
+"""
+_SUMMARY_REMOVE = f"""
+    UPDATE invoice_summary SET
+        invoice_count = invoice_count - 1,
+        amount_cents = amount_cents - CAST(round(coalesce(old.amount, 0) * 100) AS INTEGER),
+        tax_cents = tax_cents - CAST(round(coalesce(old.tax_amount, 0) * 100) AS INTEGER)
+    WHERE (category, month, is_reimbursed) = ({_SUMMARY_KEY.format(row='old')});
+    DELETE FROM invoice_summary WHERE invoice_count = 0;
+"""
+SUMMARY_DDL = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS invoices_summary_insert AFTER INSERT ON invoices BEGIN
+        {_SUMMARY_ADD}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS invoices_summary_update
+    AFTER UPDATE OF amount, tax_amount, invoice_date, category, is_reimbursed ON invoices BEGIN
+        {_SUMMARY_REMOVE}
+        {_SUMMARY_ADD}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS invoices_summary_delete AFTER DELETE ON invoices BEGIN
+        {_SUMMARY_REMOVE}
+    END
+    """,
+]
+
+
+def _create_summary(conn):
+    """创建分类/月份汇总表和维护触发器，并按现有发票计算初始汇总"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS invoice_summary (
+            category VARCHAR NOT NULL,
+            month VARCHAR NOT NULL,
+            is_reimbursed BOOLEAN NOT NULL,
+            invoice_count INTEGER NOT NULL,
+            amount_cents INTEGER NOT NULL,
+            tax_cents INTEGER NOT NULL,
+            PRIMARY KEY (category, month, is_reimbursed)
+        )
+    """)
+    for statement in SUMMARY_DDL:
+        conn.execute(statement)
+    conn.execute("DELETE FROM invoice_summary")
+    conn.execute(f"""
+        INSERT INTO invoice_summary (category, month, is_reimbursed, invoice_count, amount_cents, tax_cents)
+        SELECT {_SUMMARY_KEY.format(row='invoices')}, count(*),
+               sum(CAST(round(coalesce(amount, 0) * 100) AS INTEGER)),
+               sum(CAST(round(coalesce(tax_amount, 0) * 100) AS INTEGER))
+        FROM invoices GROUP BY 1, 2, 3
+    """)
+
+
+def _add_list_indexes(conn):
+    """发票列表按开票日期、价税合计、发票类型和截止日期筛选排序使用的索引"""
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_invoices_invoice_date ON invoices (invoice_date)")
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_invoices_total_amount ON invoices (amount + coalesce(tax_amount, 0))")
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_invoices_invoice_type ON invoices (invoice_type)")
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_invoices_due_date ON invoices (due_date)")
+
+
+# 迁移步骤，第N项把数据库从版本 N-1 升级到 N。已发布的步骤不能修改，表结构变化只能在末尾追加新步骤，
+# 并同步修改 models/database.py 中的模型
+MIGRATIONS = [
+    ('创建发票表', _create_invoices),
+    ('发票表增加税额和发票类型', _add_tax_and_type),
+    ('创建行程表', _create_itineraries),
+    ('发票表增加内容哈希和业务指纹', _add_fingerprints),
+    ('创建批量重新解析进度表', _create_reparse_checkpoints),
+    ('增加提醒、分类报表和行程查询的索引', _add_query_indexes),
+    ('识别文本压缩后移到单独的表', _move_recognized_text),
+    ('创建全文搜索索引', _create_search_index),
+    ('创建分类和月份汇总表', _create_summary),
+    ('增加发票列表筛选和排序的索引', _add_list_indexes),
+]
+
+# 当前代码对应的数据库版本
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(conn):
+    """读取数据库版本（PRAGMA user_version），新建或版本号出现之前的数据库为0"""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(engine):
+    """
+    把数据库升级到 SCHEMA_VERSION。版本已是最新时只读取一次版本号；
+    否则在一个事务中依次执行未完成的步骤并写入新版本号，任一步骤失败时整体回滚
+    :param engine: SQLite引擎
+    :return: 本次执行的步骤说明列表
+    """
+    raw = engine.raw_connection()
+    try:
+        conn = raw.driver_connection
+        if schema_version(conn) == SCHEMA_VERSION:
+            return []
+        # 关闭sqlite3模块的隐式事务管理，由BEGIN显式开启事务，使DDL也能回滚
+        isolation_level = conn.isolation_level
+        conn.isolation_level = None
+        try:
+            # 获取写锁后重新读取版本号，其他进程可能已经完成了迁移
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                version = schema_version(conn)
+                if version > SCHEMA_VERSION:
+                    raise RuntimeError(f"数据库版本 {version} 高于程序支持的版本 {SCHEMA_VERSION}，请升级程序")
+                applied = []
+                for description, step in MIGRATIONS[version:]:
+                    step(conn)
+                    applied.append(description)
+                conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.isolation_level = isolation_level
+        return applied
+    finally:
+        raw.close()
@@ -0,0 +1,317 @@
+import glob
+import gzip
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import schedule
+
+from models.database import DB_PATH, create_sqlite_engine
+from models.migrations import migrate, schema_version, SCHEMA_VERSION
+
+# 自动备份的默认目录，与 invoice_manager.db 放在同一目录
+DEFAULT_BACKUP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backups')
+# 自动备份文件名前缀，轮换时只清理带这个前缀的文件
+BACKUP_PREFIX = 'invoice_backup_'
+# 每一步复制的页数；每步之间让出写锁，备份期间界面和提醒线程仍可写入
+BACKUP_STEP_PAGES = 256
+
+
+class BackupError(Exception):
+    """备份失败或备份文件校验不通过"""
+
+
+def verify_database(db_path):
+    """
+    检查数据库文件的完整性
+    :raise BackupError: 文件不是有效的SQLite数据库或完整性检查不通过
+    """
+    try:
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        try:
+            result = [row[0] for row in conn.execute("PRAGMA integrity_check")]
+        finally:
+            conn.close()
+    except sqlite3.DatabaseError as e:
+        raise BackupError(f"不是有效的数据库文件: {str(e)}")
+    if result != ['ok']:
+        raise BackupError(f"完整性检查未通过: {'; '.join(result[:5])}")
+
+
+def backup_database(target_path, db_path=DB_PATH, compress=None, pages=BACKUP_STEP_PAGES, sleep=0.005, progress=None):
+    """
+    用SQLite在线备份接口分步复制数据库，得到某一时刻一致的副本，校验完整性后再写到目标路径
+    :param target_path: 备份文件路径
+    :param db_path: 要备份的数据库
+    :param compress: 是否用gzip压缩，默认按目标文件名是否以 .gz 结尾判断
+    :param pages: 每一步复制的页数
+    :param sleep: 每一步之间等待的秒数
+    :param progress: 进度回调 progress(已复制页数, 总页数)
+    :return: 备份文件路径
+    :raise BackupError: 备份或校验失败，目标路径不会留下不完整的文件
+    """
+    if compress is None:
+        compress = target_path.endswith('.gz')
+    target_dir = os.path.dirname(os.path.abspath(target_path))
+    os.makedirs(target_dir, exist_ok=True)
+    # 先写到同目录的临时文件，全部完成后再改名，备份目录中不会出现不完整的文件
+    snapshot_path = f"{target_path}.tmp-db"
+    partial_path = f"{target_path}.partial"
+    try:
+        source = sqlite3.connect(db_path)
+        try:
+            snapshot = sqlite3.connect(snapshot_path)
+            try:
+                source.backup(
+                    snapshot, pages=pages, sleep=sleep,
+                    progress=(lambda status, remaining, total: progress(total - remaining, total)) if progress else None
+                )
+                # 备份文件单独使用，不需要WAL
+                snapshot.execute("PRAGMA journal_mode = DELETE")
+            finally:
+                snapshot.close()
+        finally:
+            source.close()
+        verify_database(snapshot_path)
+        if compress:
+            with open(snapshot_path, 'rb') as src, gzip.open(partial_path, 'wb', compresslevel=6) as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+            # 读回一遍，确认压缩文件完整（gzip会校验CRC）
+            with gzip.open(partial_path, 'rb') as f:
+                while f.read(1024 * 1024):
+                    pass
+            os.replace(partial_path, target_path)
+        else:
+            os.replace(snapshot_path, target_path)
+    except sqlite3.Error as e:
+        raise BackupError(f"备份失败: {str(e)}")
+    except OSError as e:
+        raise BackupError(f"写入备份文件失败: {str(e)}")
+    finally:
+        for path in (snapshot_path, partial_path):
+            if os.path.exists(path):
+                os.remove(path)
+    return target_path
+
+
+def _prepare_restore(backup_path, staging_path, page_size):
+    """把备份解压或复制到临时文件，校验后升级到当前版本，页大小与正在使用的数据库保持一致"""
+    if backup_path.endswith('.gz'):
+        with gzip.open(backup_path, 'rb') as src, open(staging_path, 'wb') as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+    else:
+        shutil.copyfile(backup_path, staging_path)
+    verify_database(staging_path)
+    conn = sqlite3.connect(staging_path)
+    try:
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'invoices'").fetchone():
+            raise BackupError("备份文件中没有发票数据")
+        version = schema_version(conn)
+        if version > SCHEMA_VERSION:
+            raise BackupError(f"备份的数据库版本 {version} 高于程序支持的版本 {SCHEMA_VERSION}")
+        conn.execute("PRAGMA journal_mode = DELETE")
+        # WAL模式的数据库不能改变页大小，在线备份接口要求两边一致
+        if conn.execute("PRAGMA page_size").fetchone()[0] != page_size:
+            conn.execute(f"PRAGMA page_size = {page_size}")
+            conn.execute("VACUUM")
+    finally:
+        conn.close()
+    staging_engine = create_sqlite_engine(staging_path, {'journal_mode': 'DELETE'})
+    try:
+        migrate(staging_engine)
+    finally:
+        staging_engine.dispose()
+
+
+def restore_database(backup_path, db_path=DB_PATH, engine=None):
+    """
+    不重启程序恢复备份：备份先在临时文件中校验并升级到当前版本，再用在线备份接口在一个写事务中整体写入正在使用的数据库，
+    其他连接在提交后一次看到全部恢复的数据，不会看到一半；不替换数据库文件，已打开的连接不需要关闭
+    :param backup_path: 备份文件，.gz 结尾的按gzip解压
+    :param db_path: 要恢复到的数据库
+    :param engine: 使用该数据库的引擎，恢复后清空它的连接池，默认为程序的引擎
+    :return: 恢复前数据库的副本路径
+    :raise BackupError: 备份文件无效或恢复失败，此时数据库保持原样
+    """
+    if engine is None:
+        from models import database
+        engine = database.engine
+    staging_path = f"{db_path}.restore"
+    try:
+        target = sqlite3.connect(db_path, timeout=30)
+        try:
+            page_size = target.execute("PRAGMA page_size").fetchone()[0]
+            _prepare_restore(backup_path, staging_path, page_size)
+            # 恢复前先备份当前数据库，以防万一
+            safety_path = backup_database(f"{db_path}.bak", db_path, compress=False)
+            source = sqlite3.connect(staging_path)
+            try:
+                # pages 为-1时一步复制全部页，整个恢复在目标数据库的一个写事务中完成
+                source.backup(target, pages=-1)
+            finally:
+                source.close()
+        finally:
+            target.close()
+    except sqlite3.Error as e:
+        raise BackupError(f"恢复失败: {str(e)}")
+    except (OSError, EOFError) as e:
+        raise BackupError(f"读取备份文件失败: {str(e)}")
+    finally:
+        for path in (staging_path, f"{staging_path}-journal"):
+            if os.path.exists(path):
+                os.remove(path)
+    # 连接池中的连接可能缓存了旧的表结构和数据页，丢弃后按需重新建立
+    engine.dispose()
+    return safety_path
+
+
+def backup_digest(backup_path):
+    """
+    备份中数据库内容的SHA-256，.gz 结尾的按解压后的内容计算。
+    在线备份逐页复制，数据库没有修改时两次备份的内容相同，重新打开程序后也是如此
+    """
+    digest = hashlib.sha256()
+    with (gzip.open if backup_path.endswith('.gz') else open)(backup_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def list_backups(backup_dir):
+    """自动备份目录中的备份文件，按时间从旧到新排列"""
+    return sorted(glob.glob(os.path.join(backup_dir, f"{BACKUP_PREFIX}*.db")) +
+                  glob.glob(os.path.join(backup_dir, f"{BACKUP_PREFIX}*.db.gz")))
+
+
+def rotate_backups(backup_dir, keep):
+    """
+    只保留最新的 keep 个自动备份
+    :return: 删除的文件列表
+    """
+    backups = list_backups(backup_dir)
+    removed = backups[:-keep] if keep > 0 else []
+    for path in removed:
+        os.remove(path)
+    return removed
+
+
+class BackupService:
+    """
+    后台备份服务：在后台线程中执行手动备份，并按间隔自动备份、轮换旧备份；数据库没有变化时跳过自动备份，
+    每次启动程序时也不会因为同样的数据多出一个备份而把更早的备份轮换掉
+    """
+    def __init__(self, db_path=DB_PATH, backup_dir=None, interval_hours=None, keep=None, compress=True):
+        """
+        :param db_path: 要备份的数据库
+        :param backup_dir: 自动备份目录，默认读取环境变量 BACKUP_DIR，未设置时为项目目录下的 backups
+        :param interval_hours: 自动备份间隔（小时），默认读取环境变量 BACKUP_INTERVAL_HOURS，未设置时为24；0表示不自动备份
+        :param keep: 保留的自动备份个数，默认读取环境变量 BACKUP_KEEP，未设置时为7
+        :param compress: 自动备份是否用gzip压缩
+        """
+        if backup_dir is None:
+            backup_dir = os.getenv('BACKUP_DIR') or DEFAULT_BACKUP_DIR
+        if interval_hours is None:
+            interval_hours = float(os.getenv('BACKUP_INTERVAL_HOURS', '24') or 0)
+        if keep is None:
+            keep = int(os.getenv('BACKUP_KEEP', '7') or 0)
+        self.db_path = db_path
+        self.backup_dir = backup_dir
+        self.interval_hours = interval_hours
+        self.keep = keep
+        self.compress = compress
+        self.running = False
+        self.thread = None
+        self.scheduler = schedule.Scheduler()
+        # 同一时间只执行一个备份
+        self._lock = threading.Lock()
+        # 用一个长期打开的连接读取 PRAGMA data_version：其他连接提交后它会变化，据此判断数据库是否有改动
+        self._monitor = None
+        self._backed_up_version = None
+
+    def start(self):
+        """启动自动备份"""
+        if self.running or self.interval_hours <= 0:
+            return
+        self.running = True
+        self.scheduler.every(int(self.interval_hours * 60)).minutes.do(self.backup_if_changed)
+        self.thread = threading.Thread(target=self._run_scheduler, daemon=True)
+        self.thread.start()
+        print("自动备份服务已启动")
+
+    def stop(self):
+        """停止自动备份"""
+        self.running = False
+        self.scheduler.clear()
+        with self._lock:
+            if self._monitor is not None:
+                self._monitor.close()
+                self._monitor = None
+                self._backed_up_version = None
+        print("自动备份服务已停止")
+
+    def _run_scheduler(self):
+        # 启动时先备份一次
+        self.backup_if_changed()
+        while self.running:
+            self.scheduler.run_pending()
+            time.sleep(30)
+
+    def _data_version(self):
+        if self._monitor is None:
+            self._monitor = sqlite3.connect(self.db_path, check_same_thread=False)
+        return self._monitor.execute("PRAGMA data_version").fetchone()[0]
+
+    def backup_if_changed(self):
+        """
+        执行一次自动备份并轮换旧备份。上次自动备份之后数据库没有变化时跳过：本次运行中按 data_version 判断，
+        程序刚启动时与最新的自动备份比较内容，相同时删除新备份
+        :return: 备份文件路径，跳过或失败时返回None
+        """
+        with self._lock:
+            version = self._data_version()
+            if version == self._backed_up_version:
+                return None
+            previous = list_backups(self.backup_dir)
+            name = f"{BACKUP_PREFIX}{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.db{'.gz' if self.compress else ''}"
+            try:
+                path = backup_database(os.path.join(self.backup_dir, name), self.db_path)
+            except BackupError as e:
+                print(f"自动备份失败: {str(e)}")
+                return None
+            unchanged = self._backed_up_version is None and previous and self._same_content(path, previous[-1])
+            self._backed_up_version = version
+            if unchanged:
+                os.remove(path)
+                return None
+            rotate_backups(self.backup_dir, self.keep)
+            return path
+
+    @staticmethod
+    def _same_content(path, previous_path):
+        """两个备份中的数据库内容是否相同，旧备份无法读取时视为不同"""
+        try:
+            return backup_digest(path) == backup_digest(previous_path)
+        except (OSError, EOFError):
+            return False
+
+    def backup_to(self, target_path, progress=None):
+        """
+        备份到指定路径，在调用线程中执行，界面应在后台线程中调用
+        :return: 备份文件路径
+        :raise BackupError: 备份或校验失败
+        """
+        with self._lock:
+            return backup_database(target_path, self.db_path, progress=progress)
+
+    def restore_from(self, backup_path):
+        """
+        恢复备份，在调用线程中执行，界面应在后台线程中调用
+        :return: 恢复前数据库的副本路径
+        :raise BackupError: 备份文件无效或恢复失败
+        """
+        with self._lock:
+            return restore_database(backup_path, self.db_path)
@@ -0,0 +1,101 @@
+from sqlalchemy import select, update, or_
+
+from models.database import session_scope, init_db, Invoice
+from services.extraction_cache import hash_file
+
+# 每次IN查询最多带的值个数，低于SQLite的变量个数上限
+LOOKUP_CHUNK = 500
+
+
+def business_key(invoice_number, amount, invoice_date):
+    """
+    发票的业务指纹：同一张发票换了文件、分类或导入日期，指纹仍然相同
+    :return: "发票编号|金额|日期"，编号、金额或日期缺失时无法可靠判重，返回None
+    """
+    if not invoice_number or amount is None or invoice_date is None:
+        return None
+    return f"{invoice_number}|{amount:.2f}|{invoice_date.isoformat()}"
+
+
+def parsed_business_key(parsed_info):
+    """按解析信息计算业务指纹"""
+    return business_key(parsed_info.get('invoice_number'), parsed_info.get('amount'), parsed_info.get('date'))
+
+
+def _lookup(db, column, values):
+    """按索引列批量查找已有发票，返回 {值: 发票ID}，同一个值有多张发票时取ID最小的"""
+    values = sorted({value for value in values if value})
+    found = {}
+    for start in range(0, len(values), LOOKUP_CHUNK):
+        rows = db.execute(
+            select(column, Invoice.id).where(column.in_(values[start:start + LOOKUP_CHUNK])).order_by(Invoice.id)
+        )
+        for value, invoice_id in rows:
+            found.setdefault(value, invoice_id)
+    return found
+
+
+def find_by_content_hash(db, content_hashes):
+    """
+    查找内容相同的已导入发票
+    :return: {内容哈希: 发票ID}
+    """
+    return _lookup(db, Invoice.content_hash, content_hashes)
+
+
+def find_by_business_key(db, business_keys):
+    """
+    查找业务指纹相同的已导入发票
+    :return: {业务指纹: 发票ID}
+    """
+    return _lookup(db, Invoice.business_key, business_keys)
+
+
+def backfill_fingerprints(db=None, chunk_size=500):
+    """
+    为还没有指纹的发票补算业务指纹和文件内容哈希，例如迁移时文件缺失、之后又找回了文件的发票
+    :return: 更新的行数
+    """
+    if db is None:
+        with session_scope() as db:
+            return backfill_fingerprints(db, chunk_size)
+    updated = 0
+    after_id = 0
+    while True:
+        rows = db.execute(
+            select(Invoice.id, Invoice.invoice_number, Invoice.amount, Invoice.invoice_date, Invoice.pdf_path,
+                   Invoice.content_hash, Invoice.business_key)
+            .where(Invoice.id > after_id, or_(Invoice.content_hash.is_(None), Invoice.business_key.is_(None)))
+            .order_by(Invoice.id).limit(chunk_size)
+        ).all()
+        if not rows:
+            break
+        after_id = rows[-1].id
+        updates = []
+        for row in rows:
+            values = {}
+            if row.business_key is None:
+                values['business_key'] = business_key(row.invoice_number, row.amount, row.invoice_date)
+            if row.content_hash is None and row.pdf_path:
+                try:
+                    values['content_hash'] = hash_file(row.pdf_path)
+                except OSError:
+                    pass
+            values = {column: value for column, value in values.items() if value is not None}
+            if values:
+                updates.append({'id': row.id, **values})
+        if updates:
+            # 每行补算的列不同，按列组合分组批量更新
+            groups = {}
+            for values in updates:
+                groups.setdefault(tuple(sorted(values)), []).append(values)
+            for group in groups.values():
+                db.execute(update(Invoice), group)
+            db.commit()
+            updated += len(updates)
+    return updated
+
+
+if __name__ == "__main__":
+    init_db()
+    print(f"已为 {backfill_fingerprints()} 张发票补算指纹")
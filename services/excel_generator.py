@@ -3,7 +3,8 @@ import datetime
 from openpyxl import Workbook
 from openpyxl.styles import Font, Alignment, Border, Side
 from openpyxl.utils import get_column_letter
-from models.database import get_db, Invoice
+from sqlalchemy.orm import selectinload
+from models.database import session_scope, Invoice
 
 class ExcelGenerator:
     """Excel生成器，用于生成符合公司要求的市内交通明细表"""
@@ -36,9 +37,9 @@ class ExcelGenerator:
         :param additional_info: 额外信息字典，键为发票ID，值为补充信息
         :return: 生成的Excel文件路径
         """
-        # 获取数据库会话和发票数据
-        db = next(get_db())
-        invoices = db.query(Invoice).filter(Invoice.id.in_(invoice_ids)).all()
+        # 获取发票数据，交通方式需要识别文本，一次查询加载所选发票的文本
+        with session_scope() as db:
+            invoices = db.query(Invoice).options(selectinload(Invoice.text_record)).filter(Invoice.id.in_(invoice_ids)).all()
         invoices.sort(key=lambda x: x.invoice_date or datetime.date.min)
 
         # 初始化表格样式
@@ -124,9 +125,12 @@ class ExcelGenerator:
         :param category: 发票分类
         :return: 生成的Excel文件路径
         """
-        # 获取数据库会话和发票数据
-        db = next(get_db())
-        invoices = db.query(Invoice).filter(Invoice.category == category).all()
-        invoice_ids = [invoice.id for invoice in invoices]
+        with session_scope() as db:
+            invoice_ids = [invoice_id for invoice_id, in self.category_invoice_query(db, category)]
 
-        return self.generate_transportation_table(invoice_ids)
\ No newline at end of file
+        return self.generate_transportation_table(invoice_ids)
+
+    @staticmethod
+    def category_invoice_query(db, category):
+        """分类下的发票ID，按开票日期排序，由索引 ix_invoices_category_date 直接得出，无需读取发票行"""
+        return db.query(Invoice.id).filter(Invoice.category == category).order_by(Invoice.invoice_date)
\ No newline at end of file
@@ -0,0 +1,195 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import date
+
+# 默认缓存文件，与 invoice_manager.db 放在同一目录
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'extraction_cache.db')
+
+
+def hash_file(file_path, chunk_size=1024 * 1024):
+    """
+    计算文件内容的SHA-256
+    :param file_path: 文件路径
+    :return: 十六进制摘要
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _encode_parsed_info(parsed_info):
+    return json.dumps(
+        {key: {'__date__': value.isoformat()} if isinstance(value, date) else value for key, value in parsed_info.items()},
+        ensure_ascii=False
+    )
+
+
+def _decode_parsed_info(payload):
+    return {
+        key: date.fromisoformat(value['__date__']) if isinstance(value, dict) and '__date__' in value else value
+        for key, value in json.loads(payload).items()
+    }
+
+
+class ExtractionCache:
+    """PDF提取结果缓存，以文件内容哈希和解析器版本为键，保存原始文本和解析字段"""
+    def __init__(self, cache_path=DEFAULT_CACHE_PATH, max_entries=5000, max_bytes=64 * 1024 * 1024, touch_seconds=3600):
+        """
+        :param cache_path: 缓存数据库文件路径
+        :param max_entries: 最多缓存的条目数
+        :param max_bytes: 缓存文本的总大小上限（字节），超出后按最近最少使用淘汰
+        :param touch_seconds: 命中时距上次记录的使用时间超过这么多秒才更新使用时间，
+                              大部分命中只读不写，多个解析进程也不必争抢写锁；最近使用的判断精确到这个时间
+        """
+        self.cache_path = cache_path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.touch_seconds = touch_seconds
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.cache_path, timeout=10, check_same_thread=False)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS extraction_cache (
+                    content_hash TEXT NOT NULL,
+                    parser_version TEXT NOT NULL,
+                    raw_text TEXT NOT NULL,
+                    parsed_info TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_used REAL NOT NULL,
+                    text_backend TEXT,
+                    PRIMARY KEY (content_hash, parser_version)
+                )
+            """)
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(extraction_cache)")]
+            if 'text_backend' not in columns:
+                # 旧版本的缓存文件没有记录提取后端
+                self._conn.execute("ALTER TABLE extraction_cache ADD COLUMN text_backend TEXT")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS ix_extraction_cache_last_used ON extraction_cache (last_used)")
+            # 解析时超时、内存超限或导致进程崩溃的文件，不参与淘汰
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS quarantine (
+                    content_hash TEXT PRIMARY KEY,
+                    reason TEXT NOT NULL,
+                    file_name TEXT,
+                    created_at REAL NOT NULL
+                )
+            """)
+            self._conn.commit()
+        return self._conn
+
+    def get(self, content_hash, parser_version):
+        """
+        读取缓存
+        :return: (raw_text, parsed_info, text_backend)，未命中时返回None
+        """
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT raw_text, parsed_info, text_backend, last_used FROM extraction_cache "
+                "WHERE content_hash = ? AND parser_version = ?",
+                (content_hash, parser_version)
+            ).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            if now - row[3] >= self.touch_seconds:
+                conn.execute(
+                    "UPDATE extraction_cache SET last_used = ? WHERE content_hash = ? AND parser_version = ?",
+                    (now, content_hash, parser_version)
+                )
+                conn.commit()
+        return row[0], _decode_parsed_info(row[1]), row[2]
+
+    def put(self, content_hash, parser_version, raw_text, parsed_info, text_backend=None):
+        """
+        写入缓存，超出容量时淘汰最久未使用的条目
+        :param text_backend: 提取文本所用的后端名称
+        """
+        size = len(raw_text.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO extraction_cache "
+                "(content_hash, parser_version, raw_text, parsed_info, size, last_used, text_backend) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (content_hash, parser_version, raw_text, _encode_parsed_info(parsed_info), size, time.time(), text_backend)
+            )
+            self._evict(conn)
+            conn.commit()
+
+    def _evict(self, conn):
+        count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM extraction_cache").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        # 一次淘汰到上限的90%，避免每次写入都触发淘汰
+        target_count = int(self.max_entries * 0.9)
+        target_bytes = int(self.max_bytes * 0.9)
+        evicted = []
+        for content_hash, parser_version, entry_size in conn.execute(
+            "SELECT content_hash, parser_version, size FROM extraction_cache ORDER BY last_used, rowid"
+        ):
+            if count <= target_count and total <= target_bytes:
+                break
+            evicted.append((content_hash, parser_version))
+            count -= 1
+            total -= entry_size
+        conn.executemany("DELETE FROM extraction_cache WHERE content_hash = ? AND parser_version = ?", evicted)
+
+    def quarantine(self, content_hash, reason, file_name=None):
+        """
+        隔离文件，之后导入相同内容的文件时直接跳过
+        :param reason: 隔离原因
+        :param file_name: 原文件名，仅用于查看
+        """
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO quarantine VALUES (?, ?, ?, ?)",
+                (content_hash, reason, file_name, time.time())
+            )
+            conn.commit()
+
+    def quarantine_reason(self, content_hash):
+        """
+        查询文件是否被隔离
+        :return: 隔离原因，未隔离时返回None
+        """
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT reason FROM quarantine WHERE content_hash = ?", (content_hash,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def release_quarantine(self, content_hash=None):
+        """解除隔离，不指定哈希时解除全部"""
+        with self._lock:
+            conn = self._connect()
+            if content_hash is None:
+                conn.execute("DELETE FROM quarantine")
+            else:
+                conn.execute("DELETE FROM quarantine WHERE content_hash = ?", (content_hash,))
+            conn.commit()
+
+    def clear(self):
+        """清空缓存，隔离记录保留"""
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM extraction_cache")
+            conn.commit()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
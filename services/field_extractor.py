@@ -0,0 +1,253 @@
+import re
+
+
+def _trie_pattern(literals):
+    """
+    把字面量集合编译成前缀树形状的正则，公共前缀只比较一次（类似Aho-Corasick的goto表）
+    同一位置上总是贪婪地匹配最长的字面量
+    """
+    trie = {}
+    for literal in literals:
+        node = trie
+        for char in literal:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def emit(node):
+        branches = [re.escape(char) + emit(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        # 当前节点本身是一个完整字面量时，更长的后续部分是可选的
+        return f'(?:{body})?' if '' in node else body
+
+    return emit(trie)
+
+
+class LiteralScanner:
+    """多字面量扫描器，一次扫描找出文本中出现过的全部字面量"""
+    def __init__(self, literals):
+        self.literals = sorted(set(literal for literal in literals if literal), key=len, reverse=True)
+        self._regex = re.compile(_trie_pattern(self.literals)) if self.literals else None
+        # findall 的匹配互不重叠，被命中字面量包含的字面量一定也出现了
+        self._contained = {
+            literal: frozenset(other for other in self.literals if other in literal)
+            for literal in self.literals
+        }
+        # 与命中字面量首尾交叉的字面量可能被跳过，记录交叉的起始偏移，只在命中位置附近确认
+        self._crossing = {
+            literal: tuple(
+                (offset, other) for other in self.literals if other not in literal
+                for offset in range(1, len(literal)) if other.startswith(literal[offset:])
+            )
+            for literal in self.literals
+        }
+
+    def scan(self, text):
+        """
+        扫描文本
+        :param text: 待扫描文本
+        :return: 文本中出现过的字面量集合
+        """
+        found = set()
+        if not self._regex or not text:
+            return found
+        matched = set(self._regex.findall(text))
+        for literal in matched:
+            found |= self._contained[literal]
+        for literal in matched:
+            pending = [(offset, other) for offset, other in self._crossing[literal] if other not in found]
+            start = text.find(literal) if pending else -1
+            while start != -1:
+                for offset, other in pending:
+                    if text.startswith(other, start + offset):
+                        found.add(other)
+                pending = [(offset, other) for offset, other in pending if other not in found]
+                start = text.find(literal, start + 1) if pending else -1
+        return found
+
+    def iter_scan(self, text):
+        """
+        按文本顺序逐步扫描，调用方可以在结果已经确定时提前停止
+        :param text: 待扫描文本
+        :return: 生成器，每次产出新命中的字面量集合
+        """
+        if not self._regex or not text:
+            return
+        found = set()
+        for match in self._regex.finditer(text):
+            literal = match.group()
+            new = self._contained[literal] - found
+            for offset, other in self._crossing[literal]:
+                if other not in found and text.startswith(other, match.start() + offset):
+                    new = new | {other}
+            if new:
+                found |= new
+                yield new
+
+
+class PatternTable:
+    """按优先级排列的预编译正则表
+
+    每条规则声明匹配所必需的字面量锚点。匹配时先一次扫描找出文本中出现的锚点，
+    再按优先级只执行锚点命中的正则，不再对整段文本逐条做注定失败的搜索。
+    """
+    def __init__(self, rules):
+        """
+        :param rules: [(锚点, 正则)] 列表，按优先级排列。锚点可以是字符串、
+                      字符串元组（任意一个出现即可）或None（总是执行）
+        """
+        self.rules = []
+        for anchors, pattern in rules:
+            if isinstance(anchors, str):
+                anchors = (anchors,)
+            self.rules.append((anchors, re.compile(pattern)))
+        self.anchors = {anchor for anchors, _ in self.rules if anchors for anchor in anchors}
+        self.scanner = LiteralScanner(self.anchors)
+
+    def matches(self, text, found_anchors=None):
+        """
+        按优先级依次产出每条可能命中的正则在文本中的第一个匹配
+        :param text: 待匹配文本
+        :param found_anchors: 已扫描得到的锚点集合，为None时自行扫描
+        :return: 匹配对象生成器
+        """
+        if found_anchors is None:
+            found_anchors = self.scanner.scan(text)
+        for anchors, regex in self.rules:
+            if anchors and found_anchors.isdisjoint(anchors):
+                continue
+            match = regex.search(text)
+            if match:
+                yield match
+
+
+# 发票编号提取规则，针对多种发票格式优化
+INVOICE_NUMBER_TABLE = PatternTable([
+    # 滴滴行程单/发票常见格式
+    ('订单号', r'订单号[:：]\s*([A-Za-z0-9]+)'),
+    ('发票号码', r'发票号码[:：]\s*([A-Z0-9]+)'),
+    ('发票代码', r'发票代码[:：]\s*([A-Z0-9]+)\s*发票号码[:：]\s*([A-Z0-9]+)'),
+    ('票据号码', r'票据号码[:：]\s*([A-Z0-9]+)'),
+    # 滴滴专车/快车行程单
+    ('行程单号', r'行程单号[:：]\s*([A-Z0-9]+)'),
+    ('订单编号', r'订单编号[:：]\s*([A-Z0-9]+)'),
+    # 增加更多常见格式
+    ('发票号', r'发票号[:：]\s*([A-Z0-9]+)'),
+    ('票号', r'票号[:：]\s*([A-Z0-9]+)'),
+    ('单据号', r'单据号[:：]\s*([A-Z0-9]+)'),
+    ('编号', r'编号[:：]\s*([A-Z0-9]+)'),
+    # 针对行程单的增强格式
+    ('上车时间', r'序号\s+车型\s+上车时间.*?\n1\s+.*?\s+([A-Z0-9]+)'),  # 尝试从行程详情中提取
+    ('订单', r'订单[\s:：]*([A-Za-z0-9]+)'),  # 更宽松的订单号匹配
+    ('笔行程', r'共\d+笔行程.*?订单[\s:：]*([A-Za-z0-9]+)')  # 从行程汇总信息中提取
+])
+
+# 金额提取规则，按优先级排序
+AMOUNT_TABLE = PatternTable([
+    # 最高优先级：总计金额相关格式
+    ('价税合计', r'价税合计[:：]\s*¥?\s*([0-9,.]+)'),
+    ('价税合计', r'价税合计[:：]\s*([0-9,.]+)\s*元'),
+    ('总', r'总\s*计[:：]\s*¥?\s*([0-9,.]+)'),
+    ('总', r'总\s*计[:：]\s*([0-9,.]+)\s*元'),
+    ('合计金额', r'合计金额[:：]\s*¥?\s*([0-9,.]+)'),
+    ('合计金额', r'合计金额[:：]\s*([0-9,.]+)\s*元'),
+    ('总金额', r'总金额[:：]\s*¥?\s*([0-9,.]+)'),
+    ('总金额', r'总金额[:：]\s*([0-9,.]+)'),
+
+    # 第二优先级：实付金额相关格式
+    ('实付金额', r'实付金额[:：]\s*¥?\s*([0-9,.]+)'),
+    ('实付金额', r'实付金额[:：]\s*([0-9,.]+)\s*元'),
+    ('实付', r'实付\s*¥?\s*([0-9,.]+)'),
+    ('实付', r'实付\s*([0-9,.]+)\s*元'),
+
+    # 第三优先级：滴滴行程单特有格式
+    ('笔行程，', r'共\d+笔行程，\s*合计\s*¥?\s*([0-9,.]+)\s*元'),
+    ('笔行程，', r'共\d+笔行程，\s*合计\s*([0-9,.]+)\s*元'),
+    ('支付金额', r'支付金额[:：]\s*¥?\s*([0-9,.]+)'),
+    ('支付金额', r'支付金额[:：]\s*([0-9,.]+)\s*元'),
+    ('费用', r'费用[:：]\s*¥?\s*([0-9,.]+)'),
+    ('费用', r'费用[:：]\s*([0-9,.]+)\s*元'),
+
+    # 第四优先级：其他常见金额格式
+    ('金额', r'金额[:：]\s*¥?\s*([0-9,.]+)'),
+    ('金额', r'金额[:：]\s*([0-9,.]+)'),
+    ('小写金额', r'小写金额[:：]\s*¥?\s*([0-9,.]+)'),
+    ('小写金额', r'小写金额[:：]\s*([0-9,.]+)'),
+    ('合计', r'合计[:：]\s*¥?\s*([0-9,.]+)'),
+    ('合计', r'合计[:：]\s*([0-9,.]+)\s*元'),
+    ('总价款', r'总价款[:：]\s*¥?\s*([0-9,.]+)'),
+    ('总价款', r'总价款[:：]\s*([0-9,.]+)\s*元'),
+    ('应付', r'应付[:：]\s*¥?\s*([0-9,.]+)'),
+    ('应付', r'应付[:：]\s*([0-9,.]+)\s*元'),
+    ('结算金额', r'结算金额[:：]\s*¥?\s*([0-9,.]+)'),
+    ('结算金额', r'结算金额[:：]\s*([0-9,.]+)\s*元'),
+    ('消费金额', r'消费金额[:：]\s*¥?\s*([0-9,.]+)'),
+    ('消费金额', r'消费金额[:：]\s*([0-9,.]+)\s*元'),
+
+    # 第五优先级：金额字段格式
+    ('金额', r'金额\s*\(小写\)[:：]\s*¥?\s*([0-9,.]+)'),
+    ('金额', r'金额\s*\(小写\)[:：]\s*([0-9,.]+)'),
+
+    # 第六优先级：带货币符号的格式
+    ('¥', r'¥\s*([0-9,.]+)'),
+    ('￥', r'￥\s*([0-9,.]+)'),
+    ('¥', r'¥([0-9,.]+)'),
+    ('￥', r'￥([0-9,.]+)'),
+
+    # 第七优先级：特殊格式
+    ('元', r'\s*([0-9,.]+)\s*元\s*$'),
+    ('元', r'\s*([0-9,.]+)\s*元\s*\*'),
+    ('元', r'\*\s*([0-9,.]+)\s*元'),
+
+    # 第八优先级：表格中的金额列
+    ('金额[元]', r'金额\[元\]\s+([0-9,.]+)')
+])
+
+# 税额提取规则，支持多种格式
+TAX_AMOUNT_TABLE = PatternTable([
+    ('税额', r'税额[:：]\s*([0-9,.]+)\s*(?:元|¥|￥)'),
+    ('税率', r'税率[:：]\s*\d+%\s*税额[:：]\s*([0-9,.]+)\s*(?:元|¥|￥)'),
+    ('税额', r'税额\(\d+%\):\s*([0-9,.]+)\s*(?:元|¥|￥)'),
+    ('增值税额', r'增值税额[:：]\s*([0-9,.]+)\s*(?:元|¥|￥)'),
+    # 增强更多常见格式
+    ('增值税', r'增值税\s*([0-9,.]+)\s*(?:元|¥|￥)'),
+    ('税额', r'税额\s*=\s*([0-9,.]+)'),
+    ('税', r'税\s*金[:：]\s*([0-9,.]+)\s*(?:元|¥|￥)'),
+    ('税额', r'税额\s*\(小写\)[:：]\s*([0-9,.]+)'),
+    ('(税)', r'(?:¥|￥)\s*([0-9,.]+)\s*\(税\)'),
+    (('¥', '￥'), r'(?:¥|￥)\s*([0-9,.]+)\s*税'),
+    # 针对行程单的增强格式
+    ('税额[', r'税额\[元?\]\s*[:：]?\s*([0-9,.]+)'),
+    ('税费', r'税费\s*(?:¥|￥)?\s*([0-9,.]+)'),
+    ('不含税', r'含税\s*([0-9,.]+)\s*不含税'),
+    (('价税合计', '总计'), r'(?:价税合计|总计)[:：]\s*(?:¥|￥)?\s*[0-9,.]+\s*[,，]\s*税额\s*[:：]?\s*(?:¥|￥)?\s*([0-9,.]+)'),
+    ('其中税额', r'(?:价税合计|总计)[:：]\s*(?:¥|￥)?\s*[0-9,.]+\s*[,，]\s*其中税额\s*[:：]?\s*(?:¥|￥)?\s*([0-9,.]+)'),
+    ('税额', r'税额\s*(?:¥|￥)?\s*([0-9,.]+)\s*[,，]?\s*(?:价税合计|不含税)'),
+    ('其中', r'(?:其中|其中税额)[:：]?\s*(?:¥|￥)?\s*([0-9,.]+)\s*(?:元|¥|￥)?\s*税'),
+    ('税', r'(?:税|增值税)[:：]?\s*(?:¥|￥)?\s*([0-9,.]+)')
+])
+
+# 发票日期提取规则，支持多种常见日期格式
+DATE_TABLE = PatternTable([
+    # 标准日期格式
+    ('开票日期', r'开票日期[:：]\s*([\d]{4}年[\d]{2}月[\d]{2}日)'),
+    ('日期', r'日期[:：]\s*([\d]{4}-[\d]{2}-[\d]{2})'),
+    ('年', r'([\d]{4}年[\d]{2}月[\d]{2}日)'),
+    # 滴滴行程单格式
+    ('出行日期', r'出行日期[:：]\s*([\d]{4}-[\d]{2}-[\d]{2})'),
+    ('乘车日期', r'乘车日期[:：]\s*([\d]{4}-[\d]{2}-[\d]{2})'),
+    ('订单时间', r'订单时间[:：]\s*([\d]{4}-[\d]{2}-[\d]{2})'),
+    # 增强更多常见格式
+    ('(DATE)', r'日期\s*\(DATE\):\s*([\d]{4}-[\d]{2}-[\d]{2})'),
+    ('制单日期', r'制单日期[:：]\s*([\d]{4}-[\d]{2}-[\d]{2})'),
+    ('发生日期', r'发生日期[:：]\s*([\d]{4}-[\d]{2}-[\d]{2})'),
+    ('交易日期', r'交易日期[:：]\s*([\d]{4}-[\d]{2}-[\d]{2})'),
+    (None, r'([\d]{8})'),  # 如20250814格式
+    ('/', r'([\d]{4}/[\d]{2}/[\d]{2})'),  # 如2025/08/14格式
+    ('/', r'([\d]{2}/[\d]{2}/[\d]{4})')  # 如08/14/2025格式
+])
+
+# 所有字段共用的锚点扫描器，parse_invoice_info 只需扫描一次文本
+FIELD_TABLES = (INVOICE_NUMBER_TABLE, AMOUNT_TABLE, TAX_AMOUNT_TABLE, DATE_TABLE)
+FIELD_ANCHOR_SCANNER = LiteralScanner(set().union(*(table.anchors for table in FIELD_TABLES)))
@@ -0,0 +1,149 @@
+import os
+
+from sqlalchemy import delete, false, select, true, update
+
+from models.database import mark_invoices_changed, Invoice, Itinerary
+from services.invoice_importer import archive_invoice_file, archive_itinerary_file, INVOICE_DIR
+
+# 每条语句中 IN 列表的最大发票ID数，不超过SQLite的参数个数上限
+ID_CHUNK = 500
+
+
+def _chunks(invoice_ids):
+    invoice_ids = sorted(set(invoice_ids))
+    for start in range(0, len(invoice_ids), ID_CHUNK):
+        yield invoice_ids[start:start + ID_CHUNK]
+
+
+def _remove_files(paths):
+    """删除文件，返回删除失败的 [(路径, 错误)]"""
+    errors = []
+    for path in paths:
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+        except OSError as e:
+            errors.append((path, str(e)))
+    return errors
+
+
+def _itinerary_files(invoice_path):
+    """发票文件旁的行程单文件：<发票文件名>_行程单*.pdf"""
+    invoice_dir = os.path.dirname(invoice_path)
+    prefix = f"{os.path.splitext(os.path.basename(invoice_path))[0]}_行程单"
+    return [os.path.join(invoice_dir, name) for name in sorted(os.listdir(invoice_dir)) if name.startswith(prefix)]
+
+
+def delete_invoices(db, invoice_ids):
+    """
+    按发票ID批量删除发票及其行程记录（识别文本和搜索索引由触发器删除），提交后再删除发票文件和旁边的行程单文件
+    :param db: 数据库会话，本函数会提交
+    :param invoice_ids: 发票ID
+    :return: (删除的发票数, 删除失败的文件 [(路径, 错误)])
+    """
+    deleted = 0
+    paths = []
+    for chunk in _chunks(invoice_ids):
+        paths += [path for path, in db.execute(select(Invoice.pdf_path).where(Invoice.id.in_(chunk))) if path]
+        db.execute(delete(Itinerary).where(Itinerary.invoice_id.in_(chunk)))
+        deleted += db.execute(delete(Invoice).where(Invoice.id.in_(chunk))).rowcount
+        mark_invoices_changed(db, chunk)
+    db.commit()
+    files = []
+    for path in paths:
+        if os.path.exists(path):
+            files += [path] + _itinerary_files(path)
+    return deleted, _remove_files(files)
+
+
+def set_category(db, invoice_ids, category, color=None):
+    """
+    批量设置发票分类和分类颜色
+    :return: 修改的发票数
+    """
+    updated = 0
+    for chunk in _chunks(invoice_ids):
+        updated += db.execute(
+            update(Invoice).where(Invoice.id.in_(chunk)).values(category=category, category_color=color)
+        ).rowcount
+        mark_invoices_changed(db, chunk)
+    db.commit()
+    return updated
+
+
+def set_due_date(db, invoice_ids, due_date):
+    """
+    批量设置报销截止日期，None为取消提醒
+    :return: 修改的发票数
+    """
+    updated = 0
+    for chunk in _chunks(invoice_ids):
+        updated += db.execute(update(Invoice).where(Invoice.id.in_(chunk)).values(due_date=due_date)).rowcount
+        mark_invoices_changed(db, chunk)
+    db.commit()
+    return updated
+
+
+def _archive_files(row, reimbursed, target_dir, base_dir):
+    """
+    把发票文件和行程单复制到新的报销状态对应的文件夹
+    :return: (新的发票文件路径, 复制后可以删除的原文件)
+    """
+    parsed_info = {
+        'invoice_number': row.invoice_number,
+        'amount': row.amount,
+        'tax_amount': row.tax_amount,
+        'date': row.invoice_date,
+        'type': row.invoice_type,
+    }
+    new_path = archive_invoice_file(row.pdf_path, parsed_info, reimbursed, row.category, target_dir, base_dir)
+    copies = [(row.pdf_path, new_path)]
+    for itinerary_path in _itinerary_files(row.pdf_path):
+        copies.append((itinerary_path, archive_itinerary_file(itinerary_path, new_path)))
+    return new_path, [old for old, new in copies if os.path.abspath(old) != os.path.abspath(new)]
+
+
+def set_reimbursed(db, invoice_ids, reimbursed=True, reimbursement_date=None, target_dir=None, base_dir=INVOICE_DIR):
+    """
+    批量设置报销状态，只修改状态确实改变的发票。状态提交后再把这些发票的文件和行程单移动到对应文件夹：
+    先复制，文件路径提交后再删除原文件，中途出错时数据库中的路径总是指向存在的文件
+    :param db: 数据库会话，本函数会提交
+    :param invoice_ids: 发票ID
+    :param reimbursed: 新的报销状态
+    :param reimbursement_date: 报销日期，标记为未报销时清空
+    :param target_dir: 文件移动到的文件夹，默认按报销状态放入 <base_dir>/已报销 或 <base_dir>/未报销
+    :param base_dir: 发票文件的根文件夹
+    :return: (修改的发票数, 移动失败的文件 [(路径, 错误)])
+    """
+    flag = true() if reimbursed else false()
+    rows = []
+    for chunk in _chunks(invoice_ids):
+        changing = Invoice.id.in_(chunk), Invoice.is_reimbursed.isnot(flag)
+        rows += db.execute(select(
+            Invoice.id, Invoice.pdf_path, Invoice.invoice_number, Invoice.amount, Invoice.tax_amount,
+            Invoice.invoice_date, Invoice.invoice_type, Invoice.category
+        ).where(*changing)).all()
+        db.execute(update(Invoice).where(*changing).values(
+            is_reimbursed=reimbursed, reimbursement_date=reimbursement_date if reimbursed else None
+        ))
+        mark_invoices_changed(db, chunk)
+    db.commit()
+
+    errors = []
+    paths = []
+    obsolete = []
+    for row in rows:
+        if not row.pdf_path or not os.path.exists(row.pdf_path):
+            continue
+        try:
+            new_path, old_files = _archive_files(row, reimbursed, target_dir, base_dir)
+        except OSError as e:
+            errors.append((row.pdf_path, str(e)))
+            continue
+        if new_path != row.pdf_path:
+            paths.append({'id': row.id, 'pdf_path': new_path})
+        obsolete += old_files
+    if paths:
+        db.execute(update(Invoice), paths)
+        db.commit()
+    return len(rows), errors + _remove_files(obsolete)
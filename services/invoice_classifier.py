@@ -0,0 +1,145 @@
+import re
+
+from services.field_extractor import LiteralScanner
+
+# 默认关键词表，键为关键词类别
+DEFAULT_KEYWORD_TABLES = {
+    # 行程单关键词
+    'itinerary': ['行程单', '乘车记录', '出行明细', '行程详情', '乘车凭证', '行程信息'],
+    # 电子发票关键词
+    'invoice': ['电子发票', '发票', '增值税电子普通发票', '增值税专用发票', '普通发票'],
+    # 滴滴发票关键词（不区分大小写）
+    'didi': ['滴滴', 'DiDi', 'didi'],
+    # 其他常见发票类型关键词
+    'taxi': ['出租车', 'Taxi', 'TAXI'],
+    'food': ['餐饮', '餐费', '美食', '饭店', '餐厅', '快餐'],
+    'transport': ['交通', '公交', '地铁', '高铁', '火车', '飞机', '机票', '动车'],
+    'hotel': ['酒店', '宾馆', '住宿', '旅店'],
+    'office': ['办公用品', '办公', '文具', '打印', '复印'],
+    'travel': ['差旅费', '差旅', '出差'],
+    'entertainment': ['娱乐', 'KTV', '电影', '演出'],
+}
+
+# 匹配时不区分大小写的类别
+IGNORE_CASE_CATEGORIES = ('didi',)
+
+# 滴滴和出租车之后，按顺序命中即返回的类别
+SIMPLE_CATEGORY_TYPES = [
+    ('food', '餐饮发票'),
+    ('transport', '交通发票'),
+    ('hotel', '住宿发票'),
+    ('office', '办公发票'),
+    ('travel', '差旅发票'),
+    ('entertainment', '娱乐发票'),
+    ('itinerary', '行程单'),
+    ('invoice', '电子发票'),
+]
+
+
+class InvoiceClassifier:
+    """发票分类器：一次扫描找出所有类别的关键词，再按优先级规则确定发票类型"""
+    def __init__(self, keyword_tables=None):
+        """
+        :param keyword_tables: 自定义关键词表，键为类别，值为关键词列表，覆盖同名类别的默认关键词
+        """
+        self.keyword_tables = {category: list(keywords) for category, keywords in DEFAULT_KEYWORD_TABLES.items()}
+        if keyword_tables:
+            unknown = set(keyword_tables) - set(self.keyword_tables)
+            if unknown:
+                raise ValueError(f"未知的关键词类别: {', '.join(sorted(unknown))}")
+            for category, keywords in keyword_tables.items():
+                self.keyword_tables[category] = list(keywords)
+
+        # 关键词 -> 所属类别，同一个关键词可以属于多个类别
+        self._categories = {}
+        # 含大小写字母且不区分大小写的关键词，需在小写化的文本上匹配
+        self._folded_categories = {}
+        # 含空关键词的类别对任何文本都命中
+        self._always_categories = set()
+        for category, keywords in self.keyword_tables.items():
+            for keyword in keywords:
+                if not keyword:
+                    self._always_categories.add(category)
+                elif category in IGNORE_CASE_CATEGORIES and keyword.lower() != keyword.upper():
+                    self._folded_categories.setdefault(keyword.lower(), set()).add(category)
+                else:
+                    self._categories.setdefault(keyword, set()).add(category)
+        self._scanner = LiteralScanner(self._categories)
+        self._folded_scanner = LiteralScanner(self._folded_categories)
+        # IGNORECASE 的匹配范围比 str.lower 宽，预筛不命中时就不必小写化整段文本
+        self._folded_prefilter = re.compile(
+            '|'.join(re.escape(keyword) for keyword in self._folded_categories), re.IGNORECASE
+        ) if self._folded_categories else None
+        # 所有不区分大小写的关键词同属一组类别时，预筛命中一个即可确定，无需再扫描小写文本
+        folded_groups = {frozenset(categories) for categories in self._folded_categories.values()}
+        self._folded_shared = next(iter(folded_groups)) if len(folded_groups) == 1 else None
+
+    def matched_categories(self, text, until=None):
+        """
+        扫描文本，返回命中了关键词的类别集合
+        :param text: 待分类文本
+        :param until: 可选的判断函数，命中类别已足以确定结果时返回True，扫描随即停止
+        """
+        hits = set(self._always_categories)
+        match = self._folded_prefilter.search(text) if self._folded_prefilter else None
+        if match:
+            if self._folded_shared and match.group().lower() in self._folded_categories:
+                hits |= self._folded_shared
+            else:
+                for keyword in self._folded_scanner.scan(text.lower()):
+                    hits |= self._folded_categories[keyword]
+        for keywords in self._scanner.iter_scan(text):
+            for keyword in keywords:
+                hits |= self._categories[keyword]
+            if until and until(hits):
+                break
+        return hits
+
+    @staticmethod
+    def _is_decided(hits):
+        """滴滴行程单优先级最高，两类关键词都出现后其余关键词不再影响结果"""
+        return 'didi' in hits and 'itinerary' in hits
+
+    @staticmethod
+    def is_final(invoice_type):
+        """分类结果是否已不会因文本中新增的关键词而改变，只有优先级最高的滴滴行程单如此"""
+        return invoice_type == '滴滴行程单'
+
+    def add_categories(self, hits, text):
+        """
+        把一段文本（如PDF的一页）命中的类别并入 hits，已能确定分类时不再扫描；逐页调用后用 classify_hits 得到分类
+        :return: hits
+        """
+        if not self._is_decided(hits):
+            hits |= self.matched_categories(text, until=lambda found: self._is_decided(hits | found))
+        return hits
+
+    def classify(self, text):
+        """根据文本内容对发票进行分类"""
+        return self.classify_hits(self.matched_categories(text, until=self._is_decided))
+
+    def classify_hits(self, hits):
+        """按优先级规则把命中的类别确定为发票类型"""
+        if 'didi' in hits:
+            if 'itinerary' in hits:
+                return '滴滴行程单'
+            elif 'invoice' in hits:
+                return '滴滴电子发票'
+            return '滴滴票据'
+
+        # 出租车发票
+        if 'taxi' in hits:
+            if 'invoice' in hits:
+                return '出租车发票'
+            elif 'itinerary' in hits:
+                return '出租车行程单'
+
+        # 其他类型发票
+        for category, invoice_type in SIMPLE_CATEGORY_TYPES:
+            if category in hits:
+                return invoice_type
+        return '其他票据'
+
+
+# 默认关键词表的分类器，导入时构建一次
+DEFAULT_CLASSIFIER = InvoiceClassifier()
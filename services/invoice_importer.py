@@ -0,0 +1,702 @@
+import os
+import time
+import shutil
+import datetime
+import functools
+import multiprocessing
+from collections import deque
+from multiprocessing.connection import wait
+
+from sqlalchemy import select
+
+from models.database import begin_write, session_scope, decompress_text, Invoice, InvoiceText, Itinerary
+from services.ocr_processor import OCRProcessor, ITINERARY_TYPES, get_default_cache
+from services.extraction_cache import ExtractionCache, hash_file
+from services.duplicate_index import find_by_content_hash, find_by_business_key, parsed_business_key
+from services.invoice_store import invoice_record, insert_invoices
+
+# 发票文件归档根目录
+INVOICE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'invoices')
+# 行程单文本追加到发票识别文本时使用的分隔标记
+ITINERARY_MARKER = '--- 行程单信息 ---'
+# 重复发票的处理方式: skip 跳过并报告，merge 把本次的分类和行程单合并到已有发票
+DUPLICATE_POLICIES = ('skip', 'merge')
+# 取消导入后未解析的文件的错误信息
+CANCELLED = '已取消'
+# 取消导入后最长多久停止解析
+CANCEL_POLL_SECONDS = 0.2
+# 不配对行程单时每解析完多少个文件提交一次
+IMPORT_BATCH_FILES = 20
+
+
+def invoice_text(recognized_text):
+    """识别文本中属于发票本身的部分，合并导入的行程单文本不包括在内"""
+    return (recognized_text or '').split(f"\n\n{ITINERARY_MARKER}\n", 1)[0]
+
+
+def compare_file_contents(file1_path, file2_path):
+    """比较两个文件的内容是否相同"""
+    try:
+        # 对于小文件，可以直接比较内容
+        with open(file1_path, 'rb') as f1, open(file2_path, 'rb') as f2:
+            return f1.read() == f2.read()
+    except Exception as e:
+        print(f"比较文件内容失败: {str(e)}")
+        return False
+
+
+def archive_invoice_file(file_path, parsed_info, is_reimbursed=False, category=None, target_dir=None,
+                         base_dir=INVOICE_DIR, created_files=None):
+    """
+    根据发票信息和报销状态重命名文件并保存到对应文件夹
+    :param created_files: 可选列表，实际复制出的新文件路径会追加到其中，便于失败时清理
+    """
+    # 创建固定文件夹: 已报销和未报销
+    reimbursed_dir = os.path.join(base_dir, '已报销')
+    not_reimbursed_dir = os.path.join(base_dir, '未报销')
+    os.makedirs(reimbursed_dir, exist_ok=True)
+    os.makedirs(not_reimbursed_dir, exist_ok=True)
+
+    # 确定目标文件夹
+    if target_dir:
+        # 使用指定的目标文件夹
+        os.makedirs(target_dir, exist_ok=True)
+    else:
+        target_dir = reimbursed_dir if is_reimbursed else not_reimbursed_dir
+
+    # 生成新文件名
+    invoice_type = parsed_info.get('type', '其他票据')
+    invoice_number = parsed_info.get('invoice_number', '未知编号')
+    invoice_date = parsed_info.get('date')
+    amount = parsed_info.get('amount', 0)
+    tax_amount = parsed_info.get('tax_amount', 0)
+
+    # 计算含税金额（价税合计），未识别的金额按0计算
+    total_amount = (amount or 0) + (tax_amount or 0)
+
+    if invoice_date:
+        date_str = invoice_date.strftime('%Y%m%d')
+    else:
+        date_str = datetime.datetime.now().strftime('%Y%m%d')
+
+    # 确定分类：优先使用用户提供的分类，否则自动确定
+    if category:
+        category_to_use = category
+    else:
+        # 这里可以添加自动确定分类的逻辑
+        category_to_use = '交通费'  # 默认分类
+
+    # 使用含税金额构建文件名
+    amount_str = f"{total_amount:.2f}" if total_amount else "未知金额"
+
+    # 构建新文件名: 日期_分类_类型_金额_编号
+    file_ext = os.path.splitext(file_path)[1]
+    new_file_name = f"{date_str}_{category_to_use}_{invoice_type}_{amount_str}_{invoice_number}{file_ext}"
+    new_file_path = os.path.join(target_dir, new_file_name)
+
+    # 检查文件是否已存在，如果存在且内容相同，则直接返回该路径
+    if os.path.exists(new_file_path):
+        if compare_file_contents(file_path, new_file_path):
+            return new_file_path
+        # 内容不同时添加时间戳
+        timestamp = datetime.datetime.now().strftime('%H%M%S')
+        new_file_name = f"{date_str}_{category_to_use}_{invoice_type}_{amount_str}_{invoice_number}_{timestamp}{file_ext}"
+        new_file_path = os.path.join(target_dir, new_file_name)
+
+    # 复制并重命名文件
+    shutil.copy2(file_path, new_file_path)
+    if created_files is not None:
+        created_files.append(new_file_path)
+
+    return new_file_path
+
+
+def archive_itinerary_file(file_path, invoice_path, created_files=None):
+    """把行程单文件复制到发票文件旁，命名为 <发票文件名>_行程单.pdf"""
+    invoice_dir = os.path.dirname(invoice_path)
+    invoice_name = os.path.splitext(os.path.basename(invoice_path))[0]
+    new_file_path = os.path.join(invoice_dir, f"{invoice_name}_行程单.pdf")
+    if os.path.exists(new_file_path):
+        if compare_file_contents(file_path, new_file_path):
+            return new_file_path
+        timestamp = datetime.datetime.now().strftime('%H%M%S')
+        new_file_path = os.path.join(invoice_dir, f"{invoice_name}_行程单_{timestamp}.pdf")
+    shutil.copy2(file_path, new_file_path)
+    if created_files is not None:
+        created_files.append(new_file_path)
+    return new_file_path
+
+
+# 工作进程内复用的处理器，每个进程对每个缓存只创建一次：{缓存路径: OCRProcessor}
+_worker_ocrs = {}
+
+
+def extract_file(file_path, content_hash=None, cache_path=None):
+    """
+    提取并解析单个PDF，可在工作进程中运行
+    :param file_path: PDF文件路径
+    :param content_hash: 已计算好的文件内容哈希
+    :param cache_path: 提取结果缓存的数据库路径，默认使用 extraction_cache.db；为False时不使用缓存
+    :return: 包含识别文本、解析信息、内容哈希、行程明细和文本提取后端的字典
+    """
+    ocr = _worker_ocrs.get(cache_path)
+    if ocr is None:
+        if cache_path:
+            ocr = OCRProcessor(cache=ExtractionCache(cache_path))
+        else:
+            ocr = OCRProcessor(cache=cache_path)
+        _worker_ocrs[cache_path] = ocr
+    result = ocr.process_invoice(file_path, content_hash=content_hash)
+    if result:
+        text, parsed_info, content_hash = result['raw_text'], result['parsed_info'], result['content_hash']
+        text_backend = result['text_backend']
+    else:
+        # 没有提取到文本时仍按空文本导入，与手工逐个上传的行为一致
+        text, parsed_info, text_backend = '', ocr.parse_invoice_info(''), None
+    itinerary_rows = ocr.parse_itinerary_rows(text) if parsed_info.get('type') in ITINERARY_TYPES else []
+    return {
+        'raw_text': text,
+        'parsed_info': parsed_info,
+        'content_hash': content_hash,
+        'itinerary_rows': itinerary_rows,
+        'text_backend': text_backend
+    }
+
+
+def _apply_memory_limit(memory_limit_mb):
+    """限制当前进程的地址空间，超出时分配内存会抛出MemoryError"""
+    try:
+        import resource
+    except ImportError:
+        # Windows上没有 resource 模块，只能依靠超时保护
+        return
+    limit = memory_limit_mb * 1024 * 1024
+    _soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+
+def _worker_main(conn, extract, memory_limit_mb):
+    """隔离工作进程的主循环：逐个接收文件并返回解析结果，收到None时退出"""
+    if memory_limit_mb:
+        _apply_memory_limit(memory_limit_mb)
+    while True:
+        task = conn.recv()
+        if task is None:
+            break
+        file_path, content_hash = task
+        try:
+            result = extract(file_path, content_hash)
+        except MemoryError:
+            # 内存耗尽后进程状态不可靠，返回结果后退出，由主进程重新启动
+            conn.send({'error': f"内存超出限制（{memory_limit_mb}MB）", 'quarantine': True})
+            break
+        except Exception as e:
+            result = {'error': str(e) or type(e).__name__}
+        conn.send(result)
+
+
+class _GuardedWorker:
+    """隔离工作进程，每次只处理一个文件，超时或异常时可以单独结束"""
+    def __init__(self, context, extract, memory_limit_mb):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn, extract, memory_limit_mb), daemon=True)
+        self.process.start()
+        child_conn.close()
+        # 正在处理的文件下标和截止时间
+        self.index = None
+        self.deadline = None
+
+    def submit(self, index, file_path, content_hash, timeout):
+        self.conn.send((file_path, content_hash))
+        self.index = index
+        self.deadline = time.monotonic() + timeout if timeout else None
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class InvoiceImporter:
+    """发票批量导入器：并行提取解析PDF，按选择顺序归档文件，并在一个事务中写入数据库"""
+    # 在工作进程中执行的解析函数，签名为 extract(file_path, content_hash)
+    extract = staticmethod(extract_file)
+
+    def __init__(self, workers=None, invoice_dir=INVOICE_DIR, timeout=None, memory_limit_mb=None, cache=None,
+                 duplicates='skip'):
+        """
+        :param workers: 解析进程数，默认读取环境变量 IMPORT_WORKERS，未设置时使用CPU核数
+        :param invoice_dir: 发票文件归档根目录
+        :param timeout: 单个文件的解析时限（秒），默认读取环境变量 IMPORT_TIMEOUT，未设置时为60秒
+        :param memory_limit_mb: 单个解析进程的内存上限（MB），默认读取环境变量 IMPORT_MEMORY_LIMIT_MB，未设置时为1024；
+                                Windows上不生效
+        :param cache: 提取结果缓存，也用于记录隔离的文件，默认使用 extraction_cache.db；
+                      传入False时不使用缓存，也不检查隔离
+        :param duplicates: 已导入过的发票（内容哈希或业务指纹相同）的处理方式，见 DUPLICATE_POLICIES
+        说明: 时限和内存上限都为0且只有1个进程时，在当前进程中逐个处理，不做隔离
+        """
+        if workers is None:
+            workers = int(os.getenv('IMPORT_WORKERS', '0') or 0) or os.cpu_count() or 1
+        if timeout is None:
+            timeout = float(os.getenv('IMPORT_TIMEOUT', '60') or 0)
+        if memory_limit_mb is None:
+            memory_limit_mb = int(os.getenv('IMPORT_MEMORY_LIMIT_MB', '1024') or 0)
+        self.workers = workers
+        self.invoice_dir = invoice_dir
+        self.timeout = timeout
+        self.memory_limit_mb = memory_limit_mb
+        self.cache = get_default_cache() if cache is None else cache
+        if duplicates not in DUPLICATE_POLICIES:
+            raise ValueError(f"未知的重复处理方式: {duplicates}")
+        self.duplicates = duplicates
+
+    def _extract_function(self):
+        """解析函数；使用默认的 extract_file 时，解析进程使用导入器的提取缓存"""
+        if self.extract is not extract_file:
+            return self.extract
+        return functools.partial(extract_file, cache_path=self.cache.cache_path if self.cache else False)
+
+    def extract_files(self, file_paths, progress=None, known=None, cancelled=None):
+        """
+        提取并解析多个PDF。每个文件在独立的工作进程中解析，超时、内存超限或导致进程崩溃的文件
+        会被结束并隔离，之后再导入相同内容的文件时直接跳过
+        :param file_paths: PDF文件路径列表
+        :param progress: 进度回调 progress(已完成数, 总数, 文件路径, 错误信息)，成功时错误信息为None
+        :param known: 可选函数 known(内容哈希列表) -> {下标: 结果}，返回的文件不再解析，直接使用给定结果
+        :param cancelled: 可选函数 cancelled() -> bool，返回True后不再解析剩余的文件，正在解析的进程被结束，
+                          这些文件的结果为 {'error': '已取消'}，不会被隔离
+        :return: 与 file_paths 同序的结果列表，失败的文件对应 {'error': 错误信息}
+        """
+        total = len(file_paths)
+        results = [None] * total
+        done = 0
+
+        def report(index, result):
+            nonlocal done
+            done += 1
+            results[index] = result
+            if progress:
+                progress(done, total, file_paths[index], result.get('error'))
+
+        # 先计算内容哈希，已隔离的文件不再解析
+        hashes = [None] * total
+        pending = deque()
+        for index, file_path in enumerate(file_paths):
+            try:
+                hashes[index] = hash_file(file_path)
+            except OSError as e:
+                report(index, {'error': str(e)})
+                continue
+        known_results = known(hashes) if known else {}
+        for index, content_hash in enumerate(hashes):
+            if content_hash is None:
+                continue
+            if index in known_results:
+                report(index, known_results[index])
+                continue
+            reason = self.cache.quarantine_reason(content_hash) if self.cache else None
+            if reason:
+                report(index, {'error': f"已隔离: {reason}"})
+            else:
+                pending.append(index)
+
+        extract = self._extract_function()
+        if not self.timeout and not self.memory_limit_mb and self.workers <= 1:
+            for index in pending:
+                if cancelled and cancelled():
+                    report(index, {'error': CANCELLED})
+                    continue
+                try:
+                    result = extract(file_paths[index], hashes[index])
+                except Exception as e:
+                    result = {'error': str(e) or type(e).__name__}
+                report(index, result)
+            return results
+
+        def fail(index, reason):
+            if self.cache:
+                self.cache.quarantine(hashes[index], reason, os.path.basename(file_paths[index]))
+            report(index, {'error': reason})
+
+        # 使用spawn启动工作进程，避免fork出带有Qt线程的主进程
+        context = multiprocessing.get_context('spawn')
+        max_workers = max(1, min(self.workers, len(pending)))
+        workers = []
+        try:
+            while pending or any(worker.index is not None for worker in workers):
+                if cancelled and cancelled():
+                    for worker in [worker for worker in workers if worker.index is not None]:
+                        workers.remove(worker)
+                        worker.kill()
+                        report(worker.index, {'error': CANCELLED})
+                    while pending:
+                        report(pending.popleft(), {'error': CANCELLED})
+                    break
+                # 把待处理文件分配给空闲进程，进程不足时新建
+                for worker in workers:
+                    if pending and worker.index is None:
+                        index = pending.popleft()
+                        worker.submit(index, file_paths[index], hashes[index], self.timeout)
+                while pending and len(workers) < max_workers:
+                    worker = _GuardedWorker(context, extract, self.memory_limit_mb)
+                    workers.append(worker)
+                    index = pending.popleft()
+                    worker.submit(index, file_paths[index], hashes[index], self.timeout)
+
+                busy = [worker for worker in workers if worker.index is not None]
+                deadlines = [worker.deadline for worker in busy if worker.deadline]
+                wait_timeout = max(0, min(deadlines) - time.monotonic()) if deadlines else None
+                if cancelled:
+                    # 定期醒来检查是否已取消
+                    wait_timeout = min(wait_timeout, CANCEL_POLL_SECONDS) if wait_timeout is not None else CANCEL_POLL_SECONDS
+                ready = wait([worker.conn for worker in busy], timeout=wait_timeout)
+
+                for worker in busy:
+                    index = worker.index
+                    if worker.conn in ready:
+                        try:
+                            result = worker.conn.recv()
+                        except EOFError:
+                            worker.process.join()
+                            workers.remove(worker)
+                            worker.conn.close()
+                            fail(index, f"解析进程异常退出（退出码 {worker.process.exitcode}）")
+                            continue
+                        worker.index = None
+                        if result.pop('quarantine', False):
+                            workers.remove(worker)
+                            worker.stop()
+                            fail(index, result['error'])
+                        else:
+                            report(index, result)
+                    elif worker.deadline and time.monotonic() >= worker.deadline:
+                        workers.remove(worker)
+                        worker.kill()
+                        fail(index, f"解析超时（超过{self.timeout:g}秒）")
+        finally:
+            for worker in workers:
+                if worker.index is None:
+                    worker.stop()
+                else:
+                    worker.kill()
+        return results
+
+    def _pair_itineraries(self, file_paths, results, invoice_indexes, itinerary_indexes):
+        """
+        为每个行程单找到对应的发票：先按行程单合计金额在发票文本中查找，再按文件名最长公共前缀匹配
+        :return: {行程单下标: 发票下标}
+        """
+        pairs = {}
+        unpaired = list(invoice_indexes)
+        for itinerary_index in itinerary_indexes:
+            if not unpaired:
+                break
+            amount = results[itinerary_index]['parsed_info'].get('amount')
+            matched = None
+            if amount:
+                amount_str = f"{amount:.2f}"
+                matched = next((index for index in unpaired if amount_str in results[index]['raw_text']), None)
+            if matched is None:
+                itinerary_name = os.path.basename(file_paths[itinerary_index])
+                prefix_lengths = {
+                    index: len(os.path.commonprefix([itinerary_name, os.path.basename(file_paths[index])]))
+                    for index in unpaired
+                }
+                best = max(unpaired, key=lambda index: prefix_lengths[index])
+                if prefix_lengths[best] > 0 or len(unpaired) == 1:
+                    matched = best
+            if matched is not None:
+                pairs[itinerary_index] = matched
+                unpaired.remove(matched)
+        return pairs
+
+    def _known_results(self, db, file_paths, hashes):
+        """
+        按内容哈希找出不需要解析的文件：与已导入发票内容相同的文件使用数据库中保存的识别结果并标记为重复，
+        与本次选择的前一个文件内容相同的文件直接报告失败
+        :return: {下标: 结果}，见 extract_files 的 known 参数
+        """
+        existing = find_by_content_hash(db, hashes)
+        rows = {}
+        if existing:
+            rows = {row.id: row for row in db.execute(
+                select(Invoice.id, Invoice.invoice_number, Invoice.amount, Invoice.tax_amount, Invoice.invoice_date,
+                       Invoice.invoice_type, InvoiceText.content)
+                .outerjoin(InvoiceText).where(Invoice.id.in_(set(existing.values())))
+            )}
+        known = {}
+        first_index = {}
+        for index, content_hash in enumerate(hashes):
+            if content_hash is None:
+                continue
+            if content_hash in existing:
+                row = rows[existing[content_hash]]
+                known[index] = {
+                    'raw_text': invoice_text(decompress_text(row.content)),
+                    'parsed_info': {
+                        'invoice_number': row.invoice_number,
+                        'amount': row.amount,
+                        'tax_amount': row.tax_amount,
+                        'date': row.invoice_date,
+                        'type': row.invoice_type
+                    },
+                    'content_hash': content_hash,
+                    'itinerary_rows': [],
+                    'duplicate_of': row.id
+                }
+            elif content_hash in first_index:
+                known[index] = {'error': f"与 {os.path.basename(file_paths[first_index[content_hash]])} 内容相同"}
+            else:
+                first_index[content_hash] = index
+        return known
+
+    def _mark_duplicates(self, db, file_paths, results):
+        """
+        在写入的事务中重新判断重复：解析期间其他会话可能导入或删除了发票，按内容哈希和业务指纹重新查找已导入的发票并标记，
+        本次选择中同一张发票的后续文件报告失败
+        """
+        ok_indexes = [index for index, result in enumerate(results) if 'error' not in result]
+        by_hash = find_by_content_hash(db, [results[index].get('content_hash') for index in ok_indexes])
+        keys = {}
+        for index in ok_indexes:
+            result = results[index]
+            result.pop('duplicate_of', None)
+            if result.get('content_hash') in by_hash:
+                result['duplicate_of'] = by_hash[result['content_hash']]
+                continue
+            result['business_key'] = parsed_business_key(result['parsed_info'])
+            if result['business_key']:
+                keys[index] = result['business_key']
+        existing = find_by_business_key(db, keys.values())
+        first_index = {}
+        for index, key in keys.items():
+            if key in existing:
+                results[index]['duplicate_of'] = existing[key]
+            elif key in first_index:
+                results[index] = {'error': f"与 {os.path.basename(file_paths[first_index[key]])} 是同一张发票"}
+            else:
+                first_index[key] = index
+
+    def _archive_itineraries(self, file_paths, results, paired, invoice_path, recognized_text, file_created):
+        """
+        把配对的行程单文件复制到发票文件旁，并合并识别文本和行程明细
+        :return: (合并后的识别文本, 行程明细列表)
+        """
+        itinerary_rows = []
+        for itinerary_index in paired:
+            itinerary = results[itinerary_index]
+            archive_itinerary_file(file_paths[itinerary_index], invoice_path, created_files=file_created)
+            recognized_text += f"\n\n{ITINERARY_MARKER}\n{itinerary['raw_text']}"
+            itinerary_rows.extend(itinerary['itinerary_rows'])
+        return recognized_text, itinerary_rows
+
+    def _merge_duplicate(self, db, file_paths, results, index, paired, category, color, created_files, failed_files):
+        """
+        处理与已导入发票重复的文件：skip 时跳过并报告；merge 时更新已有发票的分类，
+        已有发票还没有行程单时把本次配对的行程单合并进去
+        :return: 合并成功的文件数
+        """
+        invoice_id = results[index]['duplicate_of']
+        if self.duplicates == 'skip':
+            failed_files.append(f"{os.path.basename(file_paths[index])}: 已导入（发票ID {invoice_id}），已跳过")
+            for itinerary_index in paired:
+                failed_files.append(f"{os.path.basename(file_paths[itinerary_index])}: 对应发票已导入，已跳过")
+            return 0
+
+        invoice = db.get(Invoice, invoice_id)
+        if category:
+            invoice.category = category
+            invoice.category_color = color
+        if not paired:
+            return 1
+        if ITINERARY_MARKER in (invoice.recognized_text or '') or not invoice.pdf_path:
+            for itinerary_index in paired:
+                failed_files.append(f"{os.path.basename(file_paths[itinerary_index])}: 对应发票已有行程单或没有文件，已跳过")
+            return 1
+        file_created = []
+        try:
+            recognized_text, itinerary_rows = self._archive_itineraries(
+                file_paths, results, paired, invoice.pdf_path, invoice.recognized_text or '', file_created
+            )
+        except Exception as e:
+            for file_path in file_created:
+                os.remove(file_path)
+            for itinerary_index in paired:
+                failed_files.append(f"{os.path.basename(file_paths[itinerary_index])}: {str(e)}")
+            return 1
+        created_files.extend(file_created)
+        invoice.recognized_text = recognized_text
+        db.add_all(Itinerary(invoice_id=invoice.id, **row) for row in itinerary_rows)
+        return 1 + len(paired)
+
+    def batch_import(self, file_paths, category=None, color=None, pair_itineraries=True, progress=None, db=None,
+                     cancelled=None):
+        """
+        批量导入发票和行程单。内容哈希与已导入发票相同的文件不再解析，业务指纹相同的发票在归档文件之前识别，
+        按 duplicates 的设置跳过或合并
+        :param file_paths: PDF文件路径列表
+        :param category: 发票分类
+        :param color: 分类颜色
+        :param pair_itineraries: 是否把行程单合并到对应发票；为False时每个文件单独导入
+        :param progress: 解析进度回调，见 extract_files
+        :param db: 数据库会话，默认新建
+        :param cancelled: 取消检查函数，见 extract_files；取消时已解析的文件照常写入并提交
+        :return: (成功数, 失败数, 失败文件说明列表)
+        """
+        if db is None:
+            with session_scope() as db:
+                return self.batch_import(file_paths, category, color, pair_itineraries, progress, db, cancelled)
+
+        def known(hashes):
+            known_results = self._known_results(db, file_paths, hashes)
+            # 结束读取的事务，解析期间不持有快照，界面在此期间提交的修改不会使后面的写入失败
+            db.commit()
+            return known_results
+
+        results = self.extract_files(file_paths, progress, known=known, cancelled=cancelled)
+        # 重新判断重复和写入在同一个事务中，开始时就取得写锁；全部文件都失败时不需要写入
+        if any('error' not in result for result in results):
+            begin_write(db)
+        self._mark_duplicates(db, file_paths, results)
+
+        failed_files = []
+        ok_indexes = []
+        for index, result in enumerate(results):
+            if 'error' in result:
+                failed_files.append(f"{os.path.basename(file_paths[index])}: {result['error']}")
+            else:
+                ok_indexes.append(index)
+
+        itinerary_indexes = [
+            index for index in ok_indexes
+            if pair_itineraries and results[index]['parsed_info'].get('type') in ITINERARY_TYPES
+        ]
+        invoice_indexes = [index for index in ok_indexes if index not in itinerary_indexes]
+        pairs = self._pair_itineraries(file_paths, results, invoice_indexes, itinerary_indexes)
+        itineraries_by_invoice = {}
+        for itinerary_index, invoice_index in pairs.items():
+            if 'duplicate_of' in results[itinerary_index] and 'duplicate_of' not in results[invoice_index]:
+                # 已导入过的行程单不再合并到新发票
+                failed_files.append(
+                    f"{os.path.basename(file_paths[itinerary_index])}: "
+                    f"已导入（发票ID {results[itinerary_index]['duplicate_of']}），已跳过"
+                )
+                continue
+            itineraries_by_invoice.setdefault(invoice_index, []).append(itinerary_index)
+        # 找不到对应发票的行程单单独导入
+        invoice_indexes = sorted(invoice_indexes + [index for index in itinerary_indexes if index not in pairs])
+
+        created_files = []
+        success_count = 0
+        # 新发票最后一起批量写入：(下标, 本文件复制出的文件, 配对的行程单下标, 记录)
+        pending = []
+        try:
+            for index in invoice_indexes:
+                result = results[index]
+                paired = itineraries_by_invoice.get(index, [])
+                if 'duplicate_of' in result:
+                    success_count += self._merge_duplicate(
+                        db, file_paths, results, index, paired, category, color, created_files, failed_files
+                    )
+                    continue
+                parsed_info = result['parsed_info']
+                file_created = []
+                try:
+                    new_file_path = archive_invoice_file(
+                        file_paths[index], parsed_info, is_reimbursed=False, category=category,
+                        base_dir=self.invoice_dir, created_files=file_created
+                    )
+                    recognized_text, itinerary_rows = self._archive_itineraries(
+                        file_paths, results, paired, new_file_path, result['raw_text'], file_created
+                    )
+                    itinerary_rows = list(result['itinerary_rows']) + itinerary_rows
+                except Exception as e:
+                    for file_path in file_created:
+                        os.remove(file_path)
+                    failed_files.append(f"{os.path.basename(file_paths[index])}: {str(e)}")
+                    for itinerary_index in paired:
+                        failed_files.append(f"{os.path.basename(file_paths[itinerary_index])}: 对应发票导入失败")
+                    continue
+                created_files.extend(file_created)
+                pending.append((index, file_created, paired, invoice_record({
+                    'invoice_number': parsed_info.get('invoice_number'),
+                    'pdf_path': new_file_path,
+                    'amount': parsed_info.get('amount'),
+                    'tax_amount': parsed_info.get('tax_amount'),
+                    'invoice_date': parsed_info.get('date'),
+                    'invoice_type': parsed_info.get('type'),
+                    'category': category,
+                    'category_color': color,
+                    'content_hash': result.get('content_hash'),
+                    'business_key': result.get('business_key'),
+                }, recognized_text, itinerary_rows)))
+
+            # 每个文件有自己的SAVEPOINT，写入失败只影响该文件，其余发票在同一个事务中提交
+            _, errors = insert_invoices(db, [record for _, _, _, record in pending])
+            for position, (index, file_created, paired, _) in enumerate(pending):
+                if position not in errors:
+                    success_count += 1 + len(paired)
+                    continue
+                for file_path in file_created:
+                    created_files.remove(file_path)
+                    os.remove(file_path)
+                failed_files.append(f"{os.path.basename(file_paths[index])}: 保存失败: {errors[position]}")
+                for itinerary_index in paired:
+                    failed_files.append(f"{os.path.basename(file_paths[itinerary_index])}: 对应发票导入失败")
+
+            db.commit()
+        except Exception:
+            db.rollback()
+            # 事务失败时清理本次复制出的文件
+            for file_path in created_files:
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+            raise
+
+        return success_count, len(failed_files), failed_files
+
+    def import_files(self, file_paths, category=None, color=None, pair_itineraries=True, progress=None,
+                     cancelled=None, batch_files=IMPORT_BATCH_FILES):
+        """
+        供后台线程调用的导入：不配对行程单时每 batch_files 个文件解析完就写入并提交一次，新发票逐批出现在列表中；
+        配对行程单时需要在全部文件中查找对应的发票，解析完后一次提交。
+        取消后不再解析剩余的文件，已解析的文件照常写入并提交
+        :param progress: 进度回调 progress(已完成数, 总数, 文件路径, 错误信息)，已完成数和总数按全部文件计算
+        :param cancelled: 取消检查函数 cancelled() -> bool
+        :return: (成功数, 失败数, 失败文件说明列表)
+        """
+        batches = [file_paths] if pair_itineraries else [
+            file_paths[start:start + batch_files] for start in range(0, len(file_paths), batch_files)
+        ]
+        total = len(file_paths)
+        success_count = 0
+        failed_files = []
+        offset = 0
+        for batch in batches:
+            if cancelled and cancelled():
+                failed_files.extend(f"{os.path.basename(file_path)}: {CANCELLED}" for file_path in batch)
+                continue
+            done_before = offset
+            batch_progress = (
+                lambda done, _total, file_path, error: progress(done_before + done, total, file_path, error)
+            ) if progress else None
+            batch_success, _, batch_failed = self.batch_import(
+                batch, category, color, pair_itineraries, batch_progress, cancelled=cancelled
+            )
+            success_count += batch_success
+            failed_files.extend(batch_failed)
+            offset += len(batch)
+        return success_count, len(failed_files), failed_files
@@ -0,0 +1,127 @@
+from sqlalchemy import and_, false, true, tuple_
+
+from models.database import Invoice, LIST_COLUMNS, TOTAL_AMOUNT
+
+# 发票列表每次从数据库读取的行数，滚动到已读取部分的末尾时再读取下一页
+LIST_PAGE_SIZE = 200
+
+# 列表可以排序的字段：{名称: 排序表达式}，每个都有对应的索引，索引中隐含的发票ID作为相同值之间的次序
+SORT_COLUMNS = {
+    'id': Invoice.id,
+    'invoice_number': Invoice.invoice_number,
+    'total_amount': TOTAL_AMOUNT,
+    'invoice_date': Invoice.invoice_date,
+    'invoice_type': Invoice.invoice_type,
+    'category': Invoice.category,
+    'due_date': Invoice.due_date,
+}
+
+
+def invoice_filters(reimbursed=None, category=None, date_from=None, date_to=None,
+                    amount_min=None, amount_max=None, invoice_type=None):
+    """
+    把列表筛选条件转换为SQL条件，值为None的条件不限
+    :param reimbursed: 是否已报销
+    :param category: 分类
+    :param date_from: 开票日期不早于
+    :param date_to: 开票日期不晚于
+    :param amount_min: 价税合计不低于
+    :param amount_max: 价税合计不高于
+    :param invoice_type: 发票类型
+    :return: 条件列表，传给 list_page 和 list_rows
+    """
+    conditions = []
+    if reimbursed is not None:
+        # 字面量条件与部分索引 ix_invoices_reminder 的写法一致
+        conditions.append(Invoice.is_reimbursed == (true() if reimbursed else false()))
+    if category is not None:
+        conditions.append(Invoice.category == category)
+    if date_from is not None:
+        conditions.append(Invoice.invoice_date >= date_from)
+    if date_to is not None:
+        conditions.append(Invoice.invoice_date <= date_to)
+    if amount_min is not None:
+        conditions.append(TOTAL_AMOUNT >= amount_min)
+    if amount_max is not None:
+        conditions.append(TOTAL_AMOUNT <= amount_max)
+    if invoice_type is not None:
+        conditions.append(Invoice.invoice_type == invoice_type)
+    return conditions
+
+
+def _after(column, descending, value, last_id):
+    """
+    从上一页最后一行 (排序值, 发票ID) 之后继续读取的条件，按先后顺序分段查询。
+    SQLite升序时NULL排在最前、降序时排在最后，NULL和非NULL分段后每段都是索引上的一个连续范围
+    """
+    if column is Invoice.id:
+        return [Invoice.id < last_id if descending else Invoice.id > last_id]
+    if value is None:
+        in_nulls = and_(column.is_(None), Invoice.id < last_id if descending else Invoice.id > last_id)
+        return [in_nulls] if descending else [in_nulls, column.isnot(None)]
+    # 行值比较不包括NULL
+    in_values = tuple_(column, Invoice.id) < tuple_(value, last_id) if descending \
+        else tuple_(column, Invoice.id) > tuple_(value, last_id)
+    return [in_values, column.is_(None)] if descending else [in_values]
+
+
+def list_page(db, filters=(), sort='id', descending=False, after=None, limit=LIST_PAGE_SIZE):
+    """
+    按排序字段读取一页符合筛选条件的列表字段；从上一页最后一行之后继续读取（键集分页），不用OFFSET，
+    翻到后面的页同样只读取一页的行
+    :param db: 数据库会话
+    :param filters: invoice_filters 返回的条件
+    :param sort: 排序字段，见 SORT_COLUMNS；值相同时按发票ID排列
+    :param descending: 是否降序
+    :param after: 上一页最后一行，读取第一页时为None
+    :param limit: 每页的行数
+    :return: 列表字段的行，见 LIST_COLUMNS
+    """
+    column = SORT_COLUMNS[sort]
+    order_by = (column.desc(), Invoice.id.desc()) if descending else (column, Invoice.id)
+    if column is Invoice.id:
+        order_by = order_by[:1]
+    segments = [None] if after is None else _after(column, descending, sort_value(after, sort), after.id)
+    rows = []
+    for segment in segments:
+        query = db.query(*LIST_COLUMNS).filter(*filters)
+        if segment is not None:
+            query = query.filter(segment)
+        rows += query.order_by(*order_by).limit(limit - len(rows)).all()
+        if len(rows) == limit:
+            break
+    return rows
+
+
+def sort_value(row, sort):
+    """列表行的排序值"""
+    return getattr(row, sort)
+
+
+def sort_key(row, sort):
+    """
+    与SQLite的升序排列一致的Python排序键：NULL在最前，值相同时按发票ID；降序排列时与升序相反
+    """
+    value = sort_value(row, sort)
+    return (value is not None, value, row.id)
+
+
+def list_rows(db, invoice_ids, filters=()):
+    """
+    读取指定发票的列表字段，按 invoice_ids 的顺序返回，已不存在或不符合筛选条件的发票跳过
+    :param db: 数据库会话
+    :param invoice_ids: 发票ID列表，如搜索结果
+    :param filters: invoice_filters 返回的条件
+    """
+    rows = {row.id: row for row in db.query(*LIST_COLUMNS).filter(Invoice.id.in_(invoice_ids), *filters)}
+    return [rows[invoice_id] for invoice_id in invoice_ids if invoice_id in rows]
+
+
+def filter_choices(db):
+    """
+    筛选栏下拉框的可选值，分别从分类和发票类型的索引中读取不重复的值
+    :return: (分类列表, 发票类型列表)
+    """
+    categories = [value for value, in db.query(Invoice.category).distinct().order_by(Invoice.category) if value]
+    types = [value for value, in db.query(Invoice.invoice_type).distinct().order_by(Invoice.invoice_type) if value]
+    return categories, types
@@ -0,0 +1,213 @@
+import os
+import csv
+import argparse
+import multiprocessing
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from sqlalchemy import select, update
+
+from models.database import (
+    session_scope, init_db, decompress_text, mark_invoices_changed, Invoice, InvoiceText, ReparseCheckpoint
+)
+from services.duplicate_index import business_key
+from services.invoice_importer import invoice_text
+from services.ocr_processor import OCRProcessor
+
+# 解析结果字段 -> 发票表中需要刷新的列
+REPARSE_COLUMNS = {
+    'amount': 'amount',
+    'tax_amount': 'tax_amount',
+    'date': 'invoice_date',
+    'type': 'invoice_type',
+}
+
+# 差异报告的表头
+REPORT_HEADER = ['发票ID', '发票编号', '字段', '原值', '新值']
+
+
+# 工作进程内复用的处理器及其关键词表，关键词表不变时只创建一次
+_worker_ocr = None
+_worker_tables = None
+
+
+def reparse_rows(rows, keyword_tables=None):
+    """
+    重新解析一批识别文本，可在工作进程中运行
+    :param rows: [(发票ID, 压缩的识别文本)]，在工作进程中解压，减少进程间传输的数据量
+    :param keyword_tables: 自定义分类关键词表
+    :return: [(发票ID, {列名: 新值})]
+    """
+    global _worker_ocr, _worker_tables
+    if _worker_ocr is None or keyword_tables != _worker_tables:
+        _worker_ocr = OCRProcessor(keyword_tables=keyword_tables, cache=False)
+        _worker_tables = keyword_tables
+    results = []
+    for invoice_id, content in rows:
+        parsed_info = _worker_ocr.parse_invoice_info(invoice_text(decompress_text(content)))
+        results.append((invoice_id, {column: parsed_info[key] for key, column in REPARSE_COLUMNS.items()}))
+    return results
+
+
+class InvoiceReparser:
+    """批量重新解析已保存的识别文本，刷新金额、税额、日期和类型，无需重新读取PDF"""
+    def __init__(self, workers=None, chunk_size=500, keyword_tables=None):
+        """
+        :param workers: 解析进程数，默认读取环境变量 REPARSE_WORKERS，未设置时使用CPU核数；1表示在当前进程中处理
+        :param chunk_size: 每次从数据库读取和提交的行数
+        :param keyword_tables: 自定义分类关键词表
+        """
+        if workers is None:
+            workers = int(os.getenv('REPARSE_WORKERS', '0') or 0) or os.cpu_count() or 1
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.keyword_tables = keyword_tables
+        self.parser_version = OCRProcessor(keyword_tables=keyword_tables, cache=False).parser_version
+
+    def _read_chunks(self, db, after_id):
+        """按ID顺序分批读取识别文本和当前字段值，每批只在内存中保留 chunk_size 行"""
+        columns = [Invoice.id, Invoice.invoice_number, InvoiceText.content] + [
+            getattr(Invoice, column) for column in REPARSE_COLUMNS.values()
+        ]
+        while True:
+            rows = db.execute(
+                select(*columns).outerjoin(InvoiceText).where(Invoice.id > after_id)
+                .order_by(Invoice.id).limit(self.chunk_size)
+            ).all()
+            if not rows:
+                return
+            after_id = rows[-1].id
+            yield rows
+
+    def _checkpoint(self, db, restart):
+        checkpoint = db.get(ReparseCheckpoint, self.parser_version)
+        if checkpoint is None:
+            checkpoint = ReparseCheckpoint(parser_version=self.parser_version, last_invoice_id=0, scanned=0, changed=0)
+            db.add(checkpoint)
+        elif restart:
+            checkpoint.last_invoice_id = checkpoint.scanned = checkpoint.changed = 0
+            checkpoint.finished_at = None
+        db.commit()
+        return checkpoint
+
+    def run(self, db=None, report_path=None, restart=False, progress=None):
+        """
+        重新解析全部发票，只更新字段发生变化的行。每批的更新和进度在同一个事务中提交，
+        中断后再次运行会从上次提交的位置继续
+        :param db: 数据库会话，默认新建
+        :param report_path: 差异报告CSV路径，继续运行时追加写入
+        :param restart: 忽略已保存的进度，从头开始
+        :param progress: 进度回调 progress(已扫描行数, 已更新行数)，每批提交后调用
+        :return: 汇总字典，包含 scanned, changed, field_changes, resumed_from, finished
+        """
+        if db is None:
+            with session_scope() as db:
+                return self.run(db, report_path, restart, progress)
+        checkpoint = self._checkpoint(db, restart)
+        resumed_from = checkpoint.last_invoice_id
+        field_changes = Counter()
+        if checkpoint.finished_at is not None:
+            return self._summary(checkpoint, field_changes, resumed_from)
+
+        report_file = writer = None
+        if report_path:
+            new_report = restart or not os.path.exists(report_path) or resumed_from == 0
+            report_file = open(report_path, 'w' if new_report else 'a', newline='', encoding='utf-8-sig')
+            writer = csv.writer(report_file)
+            if new_report:
+                writer.writerow(REPORT_HEADER)
+
+        executor = None
+        if self.workers > 1:
+            # 使用spawn启动工作进程，避免fork出带有Qt线程的主进程
+            executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+        try:
+            # 同时在途的批次数有上限，内存占用与数据库大小无关
+            in_flight = deque()
+            chunks = self._read_chunks(db, resumed_from)
+            for rows in chunks:
+                texts = [(row.id, row.content) for row in rows if row.content is not None]
+                if executor:
+                    in_flight.append((rows, executor.submit(reparse_rows, texts, self.keyword_tables)))
+                    if len(in_flight) < self.workers * 2:
+                        continue
+                    rows, future = in_flight.popleft()
+                    self._apply(db, checkpoint, rows, future.result(), writer, field_changes)
+                else:
+                    self._apply(db, checkpoint, rows, reparse_rows(texts, self.keyword_tables), writer, field_changes)
+                if progress:
+                    progress(checkpoint.scanned, checkpoint.changed)
+            while in_flight:
+                rows, future = in_flight.popleft()
+                self._apply(db, checkpoint, rows, future.result(), writer, field_changes)
+                if progress:
+                    progress(checkpoint.scanned, checkpoint.changed)
+            checkpoint.finished_at = datetime.now()
+            db.commit()
+        except BaseException:
+            db.rollback()
+            raise
+        finally:
+            if executor:
+                executor.shutdown(cancel_futures=True)
+            if report_file:
+                report_file.close()
+        return self._summary(checkpoint, field_changes, resumed_from)
+
+    def _apply(self, db, checkpoint, rows, results, writer, field_changes):
+        """写回一批中字段有变化的行，并在同一事务中保存进度"""
+        current = {row.id: row for row in rows}
+        updates = []
+        diffs = []
+        for invoice_id, new_values in results:
+            row = current[invoice_id]
+            changed = {column: value for column, value in new_values.items() if getattr(row, column) != value}
+            if not changed:
+                continue
+            updates.append({
+                'id': invoice_id, **new_values,
+                'business_key': business_key(row.invoice_number, new_values['amount'], new_values['invoice_date']),
+                'updated_at': datetime.utcnow()
+            })
+            for column, value in changed.items():
+                field_changes[column] += 1
+                diffs.append([invoice_id, row.invoice_number, column, getattr(row, column), value])
+        if updates:
+            db.execute(update(Invoice), updates)
+            mark_invoices_changed(db, [values['id'] for values in updates])
+        checkpoint.last_invoice_id = rows[-1].id
+        checkpoint.scanned += len(rows)
+        checkpoint.changed += len(updates)
+        db.commit()
+        if writer and diffs:
+            writer.writerows(diffs)
+
+    @staticmethod
+    def _summary(checkpoint, field_changes, resumed_from):
+        return {
+            'scanned': checkpoint.scanned,
+            'changed': checkpoint.changed,
+            'field_changes': dict(field_changes),
+            'resumed_from': resumed_from,
+            'finished': checkpoint.finished_at is not None,
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="用当前解析规则重新解析已保存的发票识别文本")
+    parser.add_argument('--report', default='reparse_report.csv', help="差异报告CSV路径")
+    parser.add_argument('--workers', type=int, default=None, help="解析进程数")
+    parser.add_argument('--chunk-size', type=int, default=500, help="每批处理的行数")
+    parser.add_argument('--restart', action='store_true', help="忽略上次的进度，从头开始")
+    args = parser.parse_args()
+
+    init_db()
+    reparser = InvoiceReparser(workers=args.workers, chunk_size=args.chunk_size)
+    summary = reparser.run(
+        report_path=args.report, restart=args.restart,
+        progress=lambda scanned, changed: print(f"已扫描 {scanned} 行，更新 {changed} 行", end='\r')
+    )
+    print(f"\n重新解析完成: 扫描 {summary['scanned']} 行，更新 {summary['changed']} 行，差异报告: {args.report}")
+    for column, count in summary['field_changes'].items():
+        print(f"  {column}: {count} 行")
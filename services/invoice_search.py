@@ -0,0 +1,109 @@
+import re
+
+from sqlalchemy import text
+
+from models.database import session_scope, init_db, search_text
+
+# 摘要中匹配内容的标记和长度（词数）
+SNIPPET_OPEN = '【'
+SNIPPET_CLOSE = '】'
+SNIPPET_TOKENS = 16
+
+# search_text 在每个汉字两侧各加了一个空格，摘要中的标记夹在空格和汉字之间
+_SPACED_CJK = re.compile(r' ?(【?)([\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff])(】?) ?')
+
+
+def match_query(query):
+    """
+    把用户输入转换为FTS5查询：空格分隔的每个词作为一个短语，全部出现才算匹配，最后一个字支持前缀匹配
+    :return: FTS5查询字符串，没有可搜索的内容时返回None
+    """
+    phrases = []
+    for term in query.split():
+        tokens = search_text(term).split()
+        # 引号内的双引号需要转义，其余符号由分词器当作分隔符
+        phrase = ' '.join(tokens).replace('"', '""')
+        if phrase.strip('"'):
+            phrases.append(f'"{phrase}" *')
+    return ' AND '.join(phrases) or None
+
+
+def _clean_snippet(snippet):
+    """去掉索引时加在汉字两侧的空格，换行合并为空格显示在一行中"""
+    return ' '.join(_SPACED_CJK.sub(r'\1\2\3', snippet).split())
+
+
+def search_invoices(query, db=None, limit=50):
+    """
+    在发票识别文本中全文搜索
+    :param query: 搜索词，如商户名称、行程地点或发票号码；多个词用空格分隔
+    :param db: 数据库会话，默认新建
+    :param limit: 最多返回的发票数
+    :return: [(发票ID, 摘要)]，按相关度从高到低排列，摘要中的匹配内容用【】标出
+    """
+    fts_query = match_query(query)
+    if not fts_query:
+        return []
+    if db is None:
+        with session_scope() as db:
+            return search_invoices(query, db, limit)
+    rows = db.execute(text(f"""
+        SELECT invoice_search.rowid,
+               snippet(invoice_search, 0, '{SNIPPET_OPEN}', '{SNIPPET_CLOSE}', '…', {SNIPPET_TOKENS})
+        FROM invoice_search
+        JOIN invoices ON invoices.id = invoice_search.rowid
+        WHERE invoice_search MATCH :query
+        ORDER BY invoice_search.rank
+        LIMIT :limit
+    """), {'query': fts_query, 'limit': limit})
+    return [(invoice_id, _clean_snippet(snippet)) for invoice_id, snippet in rows]
+
+
+def build_search_index(db=None, batch_size=1000, progress=None):
+    """
+    为建立搜索索引之前已有的识别文本分批补建索引，每批单独提交，中断后再次调用会从上次的位置继续；
+    新增和修改的识别文本由触发器实时同步
+    :param db: 数据库会话，默认新建
+    :param batch_size: 每批处理的发票数
+    :param progress: 进度回调 progress(已处理到的发票ID, 需要处理到的发票ID)
+    :return: 本次补建索引的发票数
+    """
+    if db is None:
+        with session_scope() as db:
+            return build_search_index(db, batch_size, progress)
+    next_id, until_id = db.execute(text("SELECT next_id, until_id FROM search_index_state WHERE id = 1")).one()
+    indexed = 0
+    while next_id <= until_id:
+        last_id = db.execute(text("""
+            SELECT max(invoice_id) FROM (
+                SELECT invoice_id FROM invoice_texts WHERE invoice_id BETWEEN :start AND :until
+                ORDER BY invoice_id LIMIT :limit
+            )
+        """), {'start': next_id, 'until': until_id, 'limit': batch_size}).scalar()
+        if last_id is None:
+            last_id = until_id
+        else:
+            # 范围内可能已有触发器写入的索引，先删除再按当前文本重建
+            params = {'start': next_id, 'end': last_id}
+            db.execute(text("DELETE FROM invoice_search WHERE rowid BETWEEN :start AND :end"), params)
+            indexed += db.execute(text("""
+                INSERT INTO invoice_search (rowid, text)
+                SELECT invoice_id, invoice_search_text(content) FROM invoice_texts WHERE invoice_id BETWEEN :start AND :end
+            """), params).rowcount
+        next_id = last_id + 1
+        db.execute(text("UPDATE search_index_state SET next_id = :next_id WHERE id = 1"), {'next_id': next_id})
+        db.commit()
+        if progress:
+            progress(last_id, until_id)
+    return indexed
+
+
+if __name__ == "__main__":
+    import sys
+
+    init_db()
+    if len(sys.argv) > 1:
+        for invoice_id, snippet in search_invoices(' '.join(sys.argv[1:])):
+            print(f"{invoice_id}\t{snippet}")
+    else:
+        print(f"已为 {build_search_index()} 张发票补建搜索索引")
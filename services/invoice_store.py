@@ -0,0 +1,84 @@
+from sqlalchemy import insert
+
+from models.database import compress_text, mark_invoices_changed, Invoice, InvoiceText, Itinerary
+
+# 批量写入时一次INSERT的记录数
+INSERT_BATCH_SIZE = 200
+
+# 批量写入的发票列，每条记录未提供的列写入NULL，保证同一批的参数结构一致
+INVOICE_COLUMNS = (
+    'invoice_number', 'pdf_path', 'amount', 'tax_amount', 'invoice_date', 'invoice_type',
+    'category', 'category_color', 'content_hash', 'business_key',
+)
+
+
+def invoice_record(invoice, recognized_text=None, itinerary_rows=()):
+    """
+    构造 insert_invoices 使用的记录
+    :param invoice: {列名: 值}，列名见 INVOICE_COLUMNS
+    :param recognized_text: 识别文本
+    :param itinerary_rows: 行程明细列表，每项为 Itinerary 的 {列名: 值}
+    """
+    unknown = set(invoice) - set(INVOICE_COLUMNS)
+    if unknown:
+        raise ValueError(f"未知的发票列: {', '.join(sorted(unknown))}")
+    return {
+        'invoice': {column: invoice.get(column) for column in INVOICE_COLUMNS},
+        'recognized_text': recognized_text,
+        'itinerary_rows': list(itinerary_rows),
+    }
+
+
+def _insert_batch(db, records):
+    """用三条批量INSERT写入一批记录的发票、识别文本和行程明细，返回按记录顺序的发票ID"""
+    # 先准备全部参数，压缩失败等问题在写入数据库之前暴露
+    texts = [compress_text(record['recognized_text']) if record['recognized_text'] is not None else None
+             for record in records]
+    invoice_ids = db.execute(
+        insert(Invoice).returning(Invoice.id, sort_by_parameter_order=True),
+        [record['invoice'] for record in records]
+    ).scalars().all()
+    text_rows = [
+        {'invoice_id': invoice_id, 'content': content}
+        for invoice_id, content in zip(invoice_ids, texts) if content is not None
+    ]
+    if text_rows:
+        db.execute(insert(InvoiceText), text_rows)
+    itinerary_rows = [
+        {**row, 'invoice_id': invoice_id}
+        for invoice_id, record in zip(invoice_ids, records) for row in record['itinerary_rows']
+    ]
+    if itinerary_rows:
+        db.execute(insert(Itinerary), itinerary_rows)
+    return invoice_ids
+
+
+def insert_invoices(db, records, batch_size=INSERT_BATCH_SIZE):
+    """
+    在当前事务中批量写入发票及其识别文本和行程明细，由调用方提交。
+    每批先在一个SAVEPOINT中整体写入；某条记录出错时回滚这一批，再为每条记录单独建立SAVEPOINT逐条写入，
+    只有出错的记录被跳过
+    :param db: 数据库会话
+    :param records: invoice_record 构造的记录列表
+    :param batch_size: 每批的记录数
+    :return: (发票ID列表, {记录下标: 错误说明})，写入失败的记录ID为None
+    """
+    # 会话中未写入的ORM修改先写入，避免与批量INSERT的顺序交错
+    db.flush()
+    invoice_ids = [None] * len(records)
+    errors = {}
+    for start in range(0, len(records), batch_size):
+        batch = records[start:start + batch_size]
+        try:
+            with db.begin_nested():
+                invoice_ids[start:start + len(batch)] = _insert_batch(db, batch)
+        except Exception:
+            # 逐条重试，找出出错的记录
+            for index in range(start, start + len(batch)):
+                try:
+                    with db.begin_nested():
+                        invoice_ids[index], = _insert_batch(db, [records[index]])
+                except Exception as e:
+                    errors[index] = str(e)
+    mark_invoices_changed(db, [invoice_id for invoice_id in invoice_ids if invoice_id is not None])
+    return invoice_ids, errors
@@ -0,0 +1,75 @@
+from sqlalchemy import case, func, select
+
+from models.database import session_scope, InvoiceSummary
+
+
+def _yuan(cents):
+    return round((cents or 0) / 100, 2)
+
+
+def _aggregates():
+    """汇总行的合计列，报销拆分按价税合计（金额+税额）计算"""
+    reimbursed = InvoiceSummary.is_reimbursed.is_(True)
+    return (
+        func.sum(InvoiceSummary.invoice_count).label('count'),
+        func.sum(InvoiceSummary.amount_cents).label('amount_cents'),
+        func.sum(InvoiceSummary.tax_cents).label('tax_cents'),
+        func.sum(case((reimbursed, InvoiceSummary.invoice_count), else_=0)).label('reimbursed_count'),
+        func.sum(case((reimbursed, InvoiceSummary.amount_cents + InvoiceSummary.tax_cents), else_=0))
+        .label('reimbursed_cents'),
+    )
+
+
+def _totals(row):
+    count = row.count or 0
+    total_cents = (row.amount_cents or 0) + (row.tax_cents or 0)
+    return {
+        'count': count,
+        'amount': _yuan(row.amount_cents),
+        'tax_amount': _yuan(row.tax_cents),
+        'total_amount': _yuan(total_cents),
+        'reimbursed_count': row.reimbursed_count or 0,
+        'reimbursed_amount': _yuan(row.reimbursed_cents),
+        'unreimbursed_count': count - (row.reimbursed_count or 0),
+        'unreimbursed_amount': _yuan(total_cents - (row.reimbursed_cents or 0)),
+    }
+
+
+def _filtered(query, category, month):
+    if category is not None:
+        query = query.where(InvoiceSummary.category == category)
+    if month is not None:
+        query = query.where(InvoiceSummary.month == month)
+    return query
+
+
+def invoice_totals(db=None, category=None, month=None):
+    """
+    发票合计，从汇总表读取，不扫描发票表
+    :param db: 数据库会话，默认使用当前线程的会话
+    :param category: 只统计该分类，''为未分类
+    :param month: 只统计该开票月份（YYYY-MM），''为没有日期的发票
+    :return: 字典，包含 count, amount（不含税金额）, tax_amount, total_amount（价税合计），
+             以及按价税合计拆分的 reimbursed_count, reimbursed_amount, unreimbursed_count, unreimbursed_amount
+    """
+    if db is None:
+        with session_scope() as db:
+            return invoice_totals(db, category, month)
+    return _totals(db.execute(_filtered(select(*_aggregates()), category, month)).one())
+
+
+def summary_by_month(db=None, category=None, month=None):
+    """
+    按分类和开票月份分组的合计，参数同 invoice_totals
+    :return: 字典列表，每项包含 category, month 和 invoice_totals 的各项，按月份倒序、分类排列
+    """
+    if db is None:
+        with session_scope() as db:
+            return summary_by_month(db, category, month)
+    query = _filtered(
+        select(InvoiceSummary.category, InvoiceSummary.month, *_aggregates())
+        .group_by(InvoiceSummary.category, InvoiceSummary.month)
+        .order_by(InvoiceSummary.month.desc(), InvoiceSummary.category),
+        category, month
+    )
+    return [{'category': row.category, 'month': row.month, **_totals(row)} for row in db.execute(query)]
@@ -0,0 +1,201 @@
+import hashlib
+import threading
+
+from services.field_extractor import PatternTable
+
+# 模板解析的字段
+TEMPLATE_FIELDS = ('invoice_number', 'amount', 'tax_amount', 'date')
+
+# 没有匹配任何模板、使用通用规则的文本在统计报告中的名称
+GENERIC_TEMPLATE_NAME = '通用规则'
+
+# 模板字段正则没有锚点，匹配时跳过锚点扫描
+_NO_ANCHORS = frozenset()
+
+
+class InvoiceTemplate:
+    """开票方版式模板：用文本开头的指纹识别版式，再用该版式专用的少量正则提取字段"""
+    def __init__(self, name, fingerprint, fields, head_size=500):
+        """
+        :param name: 模板名称
+        :param fingerprint: 字面量列表，每项是字符串或字符串元组（任意一个出现即可），
+                            全部出现在文本前 head_size 个字符内才算匹配
+        :param fields: {字段名: 正则列表}，按顺序使用第一个能解析出值的匹配的第1组；
+                       值为None表示该版式没有这个字段；未声明或都未命中的字段使用通用规则
+        :param head_size: 指纹匹配的文本长度
+        """
+        unknown = set(fields) - set(TEMPLATE_FIELDS)
+        if unknown:
+            raise ValueError(f"未知的模板字段: {', '.join(sorted(unknown))}")
+        self.name = name
+        self.fingerprint = [(literals,) if isinstance(literals, str) else tuple(literals) for literals in fingerprint]
+        self.fields = {
+            field: PatternTable([(None, pattern) for pattern in patterns]) if patterns is not None else None
+            for field, patterns in fields.items()
+        }
+        self.head_size = head_size
+
+    def matches(self, text, head=None):
+        """
+        文本是否属于该版式
+        :param head: 已截取的文本开头，多个模板共用时避免重复截取
+        """
+        if head is None:
+            head = text[:self.head_size]
+        return all(any(literal in head for literal in literals) for literals in self.fingerprint)
+
+    def declares(self, field):
+        """模板是否声明了该字段"""
+        return field in self.fields
+
+    def field_matches(self, field, text):
+        """
+        按顺序产出字段各正则在文本中的第一个匹配
+        :return: 匹配对象生成器；字段声明为不存在时为空
+        """
+        table = self.fields[field]
+        if table is None:
+            return iter(())
+        return table.matches(text, _NO_ANCHORS)
+
+
+class TemplateRegistry:
+    """模板注册表：按注册顺序找到第一个匹配的模板，并统计各模板的命中次数和解析耗时"""
+    def __init__(self, templates=()):
+        self.templates = []
+        self._lock = threading.Lock()
+        # 模板名称 -> [命中次数, 字段回退次数, 累计耗时(秒)]
+        self.stats = {}
+        for template in templates:
+            self.register(template)
+
+    def register(self, template, before=None):
+        """
+        注册模板
+        :param before: 插入到该名称的模板之前，默认追加到末尾
+        """
+        if any(existing.name == template.name for existing in self.templates):
+            raise ValueError(f"模板已存在: {template.name}")
+        names = [existing.name for existing in self.templates]
+        position = names.index(before) if before in names else len(self.templates)
+        self.templates.insert(position, template)
+
+    def match(self, text):
+        """
+        找到文本所属的模板
+        :return: 模板，没有匹配时返回None
+        """
+        heads = {}
+        for template in self.templates:
+            head = heads.get(template.head_size)
+            if head is None:
+                head = heads[template.head_size] = text[:template.head_size]
+            if template.matches(text, head):
+                return template
+        return None
+
+    def signature(self):
+        """模板内容的摘要，模板变化后提取结果缓存需要随之失效"""
+        digest = hashlib.sha256()
+        for template in self.templates:
+            digest.update(template.name.encode('utf-8'))
+            for literals in template.fingerprint:
+                digest.update('|'.join(literals).encode('utf-8'))
+            for field, table in sorted(template.fields.items()):
+                digest.update(field.encode('utf-8'))
+                for _, regex in (table.rules if table else ()):
+                    digest.update(regex.pattern.encode('utf-8'))
+        return digest.hexdigest()[:12]
+
+    def record(self, name, seconds, fallbacks=0):
+        """记录一次解析"""
+        with self._lock:
+            stat = self.stats.setdefault(name, [0, 0, 0.0])
+            stat[0] += 1
+            stat[1] += fallbacks
+            stat[2] += seconds
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats.clear()
+
+    def report(self):
+        """
+        各模板的命中率和耗时统计，按累计耗时从高到低排列
+        :return: 字典列表，包含 name, hits, hit_rate, fallbacks, avg_us, total_ms, time_share
+        """
+        with self._lock:
+            stats = {name: list(stat) for name, stat in self.stats.items()}
+        total_hits = sum(stat[0] for stat in stats.values()) or 1
+        total_seconds = sum(stat[2] for stat in stats.values()) or 1.0
+        rows = [
+            {
+                'name': name,
+                'hits': hits,
+                'hit_rate': hits / total_hits,
+                'fallbacks': fallbacks,
+                'avg_us': seconds / hits * 1e6 if hits else 0.0,
+                'total_ms': seconds * 1e3,
+                'time_share': seconds / total_seconds,
+            }
+            for name, (hits, fallbacks, seconds) in stats.items()
+        ]
+        return sorted(rows, key=lambda row: row['total_ms'], reverse=True)
+
+    def format_report(self):
+        """把统计结果格式化为文本表格"""
+        lines = [f"{'模板':<14}{'命中':>8}{'命中率':>9}{'字段回退':>10}{'平均(us)':>11}{'累计(ms)':>11}{'耗时占比':>10}"]
+        for row in self.report():
+            lines.append(
+                f"{row['name']:<14}{row['hits']:>8}{row['hit_rate']:>9.1%}{row['fallbacks']:>10}"
+                f"{row['avg_us']:>11.1f}{row['total_ms']:>11.2f}{row['time_share']:>10.1%}"
+            )
+        return '\n'.join(lines)
+
+
+# 滴滴票据的指纹，不同提取后端和版式中滴滴字样的大小写不同
+DIDI_FINGERPRINT = ('滴滴', 'didi', 'DiDi', 'DIDI')
+
+# 内置版式模板，按注册顺序匹配
+DEFAULT_TEMPLATES = [
+    # 滴滴出行行程单：没有税额，金额为行程汇总中的合计
+    InvoiceTemplate('滴滴行程单', ['行程单', DIDI_FINGERPRINT], {
+        'invoice_number': [r'序号\s+车型\s+上车时间.*?\n1\s+.*?\s+([A-Z0-9]+)'],
+        'amount': [r'共\d+笔行程，\s*合计\s*¥?\s*([0-9,.]+)\s*元'],
+        'tax_amount': None,
+        'date': [r'申请日期[:：]\s*([\d]{4}-[\d]{2}-[\d]{2})'],
+    }),
+    # 滴滴电子发票：金额和税额在“合 计 ¥金额 ¥税额”一行
+    InvoiceTemplate('滴滴电子发票', ['发票号码', DIDI_FINGERPRINT], {
+        'invoice_number': [r'发票号码\s*[:：]\s*([A-Z0-9]+)'],
+        'amount': [r'合\s*计\s*[¥￥]\s*([0-9,.]+)'],
+        'tax_amount': [r'合\s*计\s*[¥￥]\s*[0-9,.]+\s*[¥￥]\s*([0-9,.]+)'],
+        'date': [r'开票日期\s*[:：]\s*([\d]{4}年[\d]{2}月[\d]{2}日)'],
+    }),
+    # 出租车统一发票：没有税额
+    InvoiceTemplate('出租车发票', ['出租', '发票号码'], {
+        'invoice_number': [r'发票号码[:：]\s*([A-Z0-9]+)'],
+        'amount': [r'金额[:：]\s*¥?\s*([0-9,.]+)'],
+        'tax_amount': None,
+        'date': [r'日期[:：]\s*([\d]{4}-[\d]{2}-[\d]{2})'],
+    }),
+    # 增值税专用/普通发票和全电发票
+    InvoiceTemplate('增值税发票', [('增值税', '电子发票'), '发票号码'], {
+        'invoice_number': [r'发票号码[:：]\s*([A-Z0-9]+)'],
+        'amount': [
+            r'价税合计[:：]\s*¥?\s*([0-9,.]+)',
+            r'合计金额[:：]\s*¥?\s*([0-9,.]+)',
+            r'合\s*计\s*[¥￥]\s*([0-9,.]+)',
+        ],
+        'tax_amount': [
+            r'税额[:：]\s*([0-9,.]+)\s*(?:元|¥|￥)',
+            r'增值税\s*([0-9,.]+)\s*(?:元|¥|￥)',
+            r'税额\[元?\]\s*[:：]?\s*([0-9,.]+)',
+            r'合\s*计\s*[¥￥]\s*[0-9,.]+\s*[¥￥]\s*([0-9,.]+)',
+        ],
+        'date': [r'开票日期[:：]\s*([\d]{4}年[\d]{2}月[\d]{2}日)'],
+    }),
+]
+
+# 默认模板注册表，导入时构建一次
+DEFAULT_REGISTRY = TemplateRegistry(DEFAULT_TEMPLATES)
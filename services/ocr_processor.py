@@ -1,13 +1,302 @@
 import os
-import pdfplumber
-from datetime import datetime
 import re
+import json
+import time
+import hashlib
+from datetime import datetime
+from services.field_extractor import (
+    FIELD_ANCHOR_SCANNER, INVOICE_NUMBER_TABLE, AMOUNT_TABLE, TAX_AMOUNT_TABLE, DATE_TABLE
+)
+from services.invoice_classifier import InvoiceClassifier, DEFAULT_CLASSIFIER
+from services.invoice_templates import DEFAULT_REGISTRY, GENERIC_TEMPLATE_NAME
+from services.extraction_cache import ExtractionCache, hash_file
+from services.text_backends import TEXT_BACKENDS, get_text_backends, has_quality_markers
+
+# 解析器版本，修改提取或分类规则后需要递增，旧的缓存结果随之失效
+PARSER_VERSION = '3'
+
+# 行程单中的类别，这些票据按行程单处理而不是单独的发票
+ITINERARY_TYPES = ('滴滴行程单', '出租车行程单', '行程单')
+
+# 行程明细行，如: 1 快车 07-18 09:12 周五 上海市 陆家嘴 张江 15.2 124.12
+ITINERARY_ROW_PATTERN = re.compile(
+    r'^(\d+)[ \t]+(\S+)[ \t]+(\d{1,2}-\d{1,2}[ \t]+\d{1,2}:\d{2})[ \t]+(?:周\S[ \t]+)?(\S+)[ \t]+(\S+)[ \t]+'
+    r'(.+?)[ \t]+([\d.]+)[ \t]+([\d.]+)(?:[ \t].*)?$',
+    re.MULTILINE
+)
+ITINERARY_YEAR_PATTERN = re.compile(r'(?:行程起止日期|申请日期)[:：]\s*(\d{4})-')
+
+_default_cache = None
+
+
+def get_default_cache():
+    """获取默认的提取结果缓存，首次使用时创建"""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ExtractionCache()
+    return _default_cache
+
+
+class PDFPages:
+    """按需逐页提取PDF文本，已提取的页面会保留下来，剩余页面在需要时再打开文件提取"""
+    def __init__(self, pdf_path, backend=None):
+        """
+        :param pdf_path: PDF文件路径
+        :param backend: 文本提取后端，见 services.text_backends，默认使用 pdfplumber
+        """
+        self.pdf_path = pdf_path
+        self.backend = backend or TEXT_BACKENDS['pdfplumber']
+        # 已提取的每页文本，没有文本的页面为空字符串
+        self.pages = []
+        self.page_count = None
+
+    @classmethod
+    def loaded(cls, pdf_path, text, backend=None):
+        """用已知的完整文本（如缓存结果）构造，不会再读取文件"""
+        pages = cls(pdf_path, backend)
+        pages.pages = [text]
+        pages.page_count = 1
+        return pages
+
+    @property
+    def complete(self):
+        """是否已提取全部页面"""
+        return self.page_count is not None and len(self.pages) >= self.page_count
+
+    @property
+    def text(self):
+        """已提取页面的文本，页面之间以空行分隔"""
+        return '\n\n'.join(page_text for page_text in self.pages if page_text)
+
+    def _read_pages(self, start):
+        """从第 start 页（从0开始）起逐页提取文本"""
+        with self.backend.open(self.pdf_path) as page_readers:
+            self.page_count = len(page_readers)
+            for read_page in page_readers[start:]:
+                yield read_page()
+
+    def iter_pages(self):
+        """逐页产出文本，先产出已提取的页面，再按需提取后续页面；提前停止迭代时不会读取剩余页面"""
+        yield from list(self.pages)
+        if self.complete:
+            return
+        reader = self._read_pages(len(self.pages))
+        try:
+            for page_text in reader:
+                self.pages.append(page_text)
+                yield page_text
+        finally:
+            reader.close()
+
+    def full_text(self):
+        """提取剩余页面并返回完整文本"""
+        for _ in self.iter_pages():
+            pass
+        return self.text
+
+
+class _PageTexts:
+    """逐页解析时已读取的非空页面文本，以及每页的字段锚点（需要时才扫描）"""
+    def __init__(self):
+        self.texts = []
+        self._anchors = []
+
+    def append(self, text):
+        self.texts.append(text)
+        self._anchors.append(None)
+
+    def anchors(self, index):
+        if self._anchors[index] is None:
+            self._anchors[index] = FIELD_ANCHOR_SCANNER.scan(self.texts[index])
+        return self._anchors[index]
+
+
+# 正则中限定在整段文本开头或结尾的 ^ $ \A \Z（未使用MULTILINE时），转义字符和字符集中的不算
+_TEXT_BOUNDARY = re.compile(r'\\([AZ])|\\.|\[\^?\]?(?:\\.|[^\]])*\]|([\^$])')
+
+
+def _text_position(regex):
+    """
+    规则是否只能匹配在整段文本的开头或结尾
+    :return: 'start'、'end' 或 None；同时限定开头和结尾的规则按 'end' 处理
+    """
+    position = None
+    for escaped, boundary in _TEXT_BOUNDARY.findall(regex.pattern):
+        if escaped == 'Z' or (boundary == '$' and not regex.flags & re.MULTILINE):
+            return 'end'
+        if escaped == 'A' or (boundary == '^' and not regex.flags & re.MULTILINE):
+            position = 'start'
+    return position
+
+
+class _RuleMatches:
+    """
+    一张规则表在已读页面中的匹配：每条规则记录它在已读文本中的第一个匹配，每页对每条规则最多搜索一次。
+    规则在全文中的第一个匹配就是它在最早命中的那一页中的第一个匹配，所以逐页搜索与在全文上搜索的结果相同。
+    限定在文本开头的规则只搜索第一页；限定在文本结尾的规则只搜索最后读到的一页，读到下一页时重新搜索，
+    在读完全部页面之前它的结果都不是确定的
+    """
+    def __init__(self, table, pages, anchored=True):
+        """
+        :param table: PatternTable
+        :param pages: _PageTexts
+        :param anchored: 是否按字段锚点跳过注定不匹配的页面，模板规则没有锚点
+        """
+        self.rules = table.rules
+        self.pages = pages
+        self.anchored = anchored
+        self.positions = [_text_position(regex) for _, regex in self.rules]
+        self.first = [None] * len(self.rules)
+        self.searched = [0] * len(self.rules)
+
+    def _search(self, index, page):
+        anchors, regex = self.rules[index]
+        if self.anchored and anchors and self.pages.anchors(page).isdisjoint(anchors):
+            return None
+        return regex.search(self.pages.texts[page])
+
+    def _first_match(self, index):
+        page_count = len(self.pages.texts)
+        if self.positions[index] == 'end':
+            if self.searched[index] < page_count:
+                self.searched[index] = page_count
+                self.first[index] = self._search(index, page_count - 1)
+            return self.first[index]
+        if self.positions[index] == 'start':
+            page_count = min(page_count, 1)
+        while self.first[index] is None and self.searched[index] < page_count:
+            page = self.searched[index]
+            self.searched[index] += 1
+            self.first[index] = self._search(index, page)
+        return self.first[index]
+
+    def resolve(self, convert):
+        """
+        按优先级取第一个能转换出值的匹配，只搜索到得出结果为止
+        :param convert: 从匹配中取值的函数，如 OCRProcessor._first_number
+        :return: (值, 是否已确定)；优先级更高的规则都已在已读页面中匹配过（取不出值）时，后续页面不会再改变这个值
+        """
+        final = True
+        for index in range(len(self.rules)):
+            match = self._first_match(index)
+            if self.positions[index] == 'end':
+                final = False
+            if match is None:
+                final = False
+                continue
+            value = convert(iter((match,)))
+            if value is not None:
+                return value, final
+        return None, False
+
+
+class _PageParser:
+    """
+    逐页解析发票字段，与在已读页面拼接成的全文上调用 parse_invoice_info 的结果相同，但每页只搜索一次，
+    已得出结果的规则不再搜索后续页面。跨越两页的匹配不计入（页面之间以空行分隔，字段不会跨页）
+    """
+    def __init__(self, processor):
+        self.processor = processor
+        self.pages = _PageTexts()
+        self.hits = set()
+        templates = processor.templates
+        # 模板按文本开头的指纹匹配，已读文本超过最长的指纹范围后模板不再改变
+        self.head_size = max((template.head_size for template in templates.templates), default=0) if templates else 0
+        self.head = ''
+        self.length = 0
+        self.template = None
+        self.fields = None
+
+    def add_page(self, text):
+        """加入下一页的文本，空白页面与 PDFPages.text 一样跳过"""
+        if not text:
+            return
+        separator = '\n\n' if self.pages.texts else ''
+        self.length += len(separator) + len(text)
+        if len(self.head) < self.head_size:
+            self.head = (self.head + separator + text)[:self.head_size]
+        self.pages.append(text)
+        self.processor.classifier.add_categories(self.hits, text)
+        template = self.processor.templates.match(self.head) if self.processor.templates else None
+        if template is not self.template:
+            self.template, self.fields = template, None
+
+    def _field_rules(self):
+        """{字段: (取值函数, 模板规则的匹配, 通用规则的匹配)}，模板声明该字段不存在时两者都为None"""
+        processor = self.processor
+        generic = {
+            'invoice_number': (processor._first_invoice_number, INVOICE_NUMBER_TABLE),
+            'amount': (processor._first_number, AMOUNT_TABLE),
+            'tax_amount': (processor._first_number, TAX_AMOUNT_TABLE),
+            'date': (processor._first_date, DATE_TABLE),
+        }
+        fields = {}
+        for field, (convert, table) in generic.items():
+            if self.template is not None and self.template.declares(field):
+                template_table = self.template.fields[field]
+                if template_table is None:
+                    fields[field] = (convert, None, None)
+                    continue
+                fields[field] = (convert, _RuleMatches(template_table, self.pages, anchored=False),
+                                 _RuleMatches(table, self.pages))
+            else:
+                fields[field] = (convert, None, _RuleMatches(table, self.pages))
+        return fields
+
+    def result(self):
+        """
+        按已读页面解析
+        :return: (解析信息, 是否已确定, 回退到通用规则的字段数)；已确定时后续页面不会再改变解析信息
+        """
+        if self.fields is None:
+            self.fields = self._field_rules()
+        final = not self.processor.templates or self.length >= self.head_size
+        invoice_info = {}
+        fallbacks = 0
+        for field, (convert, template_rules, generic_rules) in self.fields.items():
+            value, field_final = None, generic_rules is None
+            if template_rules is not None:
+                value, field_final = template_rules.resolve(convert)
+            if value is None and generic_rules is not None:
+                value, generic_final = generic_rules.resolve(convert)
+                # 模板规则以后仍可能命中
+                field_final = generic_final and template_rules is None
+                fallbacks += self.template is not None
+            invoice_info[field] = value
+            final = final and field_final
+        invoice_info['type'] = self.processor.classifier.classify_hits(self.hits)
+        final = final and self.processor.classifier.is_final(invoice_info['type'])
+        return invoice_info, final, fallbacks
+
+    def record(self, seconds, fallbacks):
+        """记录模板统计"""
+        if self.processor.templates:
+            self.processor.templates.record(self.template.name if self.template else GENERIC_TEMPLATE_NAME,
+                                            seconds, fallbacks)
+
 
 class OCRProcessor:
     """PDF发票处理器，用于直接读取和解析PDF发票内容（无需OCR）"""
-    def __init__(self):
+    def __init__(self, keyword_tables=None, cache=None, text_backends=None, templates=None):
+        """
+        :param keyword_tables: 自定义分类关键词表，格式见 DEFAULT_KEYWORD_TABLES，默认使用内置关键词
+        :param cache: 提取结果缓存，默认使用 extraction_cache.db；传入False时不使用缓存
+        :param text_backends: 按顺序尝试的文本提取后端名称，默认见 get_text_backends
+        :param templates: 版式模板注册表，默认使用 DEFAULT_REGISTRY；传入False时只使用通用规则
+        """
         # 不再需要Tesseract配置，因为直接读取文本
-        pass
+        self.classifier = InvoiceClassifier(keyword_tables) if keyword_tables else DEFAULT_CLASSIFIER
+        self.cache = get_default_cache() if cache is None else cache
+        self.text_backends = get_text_backends(text_backends)
+        self.templates = DEFAULT_REGISTRY if templates is None else templates
+        self.parser_version = PARSER_VERSION
+        if keyword_tables:
+            # 自定义关键词会改变分类结果，缓存需要与默认关键词的结果区分开
+            tables = json.dumps(self.classifier.keyword_tables, ensure_ascii=False, sort_keys=True)
+            self.parser_version += '-' + hashlib.sha256(tables.encode('utf-8')).hexdigest()[:12]
+        if self.templates is not DEFAULT_REGISTRY:
+            # 模板同样影响解析结果
+            self.parser_version += '-t' + (self.templates.signature() if self.templates else 'none')
 
     def extract_text_from_pdf(self, pdf_path):
         """
@@ -15,281 +304,227 @@ class OCRProcessor:
         :param pdf_path: PDF文件路径
         :return: 提取的文本内容
         """
-        text = []
+        return self.extract_text(pdf_path)[0]
+
+    def extract_text(self, pdf_path):
+        """
+        依次用各文本后端提取全部页面，使用第一个通过质量检查的结果，最后一个后端的结果总是被采用
+        :param pdf_path: PDF文件路径
+        :return: (文本, 解析信息, 后端名称)，所有后端都失败时文本为空、后端名称为None
+        """
+        fallback = None
+        for index, backend in enumerate(self.text_backends):
+            try:
+                text = self.open_pages(pdf_path, backend).full_text()
+            except Exception as e:
+                print(f"PDF文本提取失败({backend.name}): {str(e)}")
+                continue
+            invoice_info = self.parse_invoice_info(text)
+            if index == len(self.text_backends) - 1 or self._text_quality_ok(text, invoice_info):
+                return text, invoice_info, backend.name
+            if fallback is None and text:
+                fallback = (text, invoice_info, backend.name)
+        return fallback or ('', self.parse_invoice_info(''), None)
+
+    def open_pages(self, pdf_path, backend=None):
+        """
+        打开PDF但不立即提取文本，页面在迭代时逐页提取
+        :param pdf_path: PDF文件路径
+        :param backend: 文本提取后端，默认使用第一个后端
+        :return: PDFPages
+        """
+        return PDFPages(pdf_path, backend or self.text_backends[0])
+
+    def parse_pdf(self, pdf_path):
+        """
+        逐页提取并解析PDF，字段全部确定后不再提取后续页面；文本质量不合格时换下一个后端重新提取
+        :param pdf_path: PDF文件路径
+        :return: (解析信息, PDFPages)，需要完整文本时调用 PDFPages.full_text() 提取剩余页面
+        """
+        fallback = None
+        for index, backend in enumerate(self.text_backends):
+            pages = self.open_pages(pdf_path, backend)
+            try:
+                invoice_info = self._parse_pages(pages)
+            except Exception as e:
+                print(f"PDF文本提取失败({backend.name}): {str(e)}")
+                continue
+            if index == len(self.text_backends) - 1 or self._text_quality_ok(pages.text, invoice_info):
+                return invoice_info, pages
+            if fallback is None and pages.text:
+                fallback = (invoice_info, pages)
+        return fallback or (self.parse_invoice_info(''), PDFPages.loaded(pdf_path, ''))
+
+    def _parse_pages(self, pages):
+        """逐页解析，每页只解析新读取的文本；全部字段和分类都已确定、后续页面不会再改变结果时停止提取"""
+        start = time.perf_counter()
+        parser = _PageParser(self)
+        page_iter = pages.iter_pages()
         try:
-            with pdfplumber.open(pdf_path) as pdf:
-                for page in pdf.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text.append(page_text)
-            return '\n\n'.join(text)
-        except Exception as e:
-            print(f"PDF文本提取失败: {str(e)}")
-            return ''
+            for page_text in page_iter:
+                parser.add_page(page_text)
+                if parser.result()[1]:
+                    break
+        finally:
+            page_iter.close()
+        invoice_info, _, fallbacks = parser.result()
+        parser.record(time.perf_counter() - start, fallbacks)
+        return invoice_info
+
+    def _text_quality_ok(self, text, invoice_info):
+        """
+        快速后端提取的文本是否可用：含有可读的关键标记，编号、金额、日期都能解析出来，
+        行程单还要能解析出行程明细
+        """
+        if not has_quality_markers(text):
+            return False
+        if invoice_info['invoice_number'] is None or invoice_info['amount'] is None or invoice_info['date'] is None:
+            return False
+        if invoice_info['type'] in ITINERARY_TYPES and not ITINERARY_ROW_PATTERN.search(text):
+            return False
+        return True
 
     def parse_invoice_info(self, text):
         """
-        从提取的文本中解析发票信息，特别优化了滴滴发票和行程单的解析
+        从提取的文本中解析发票信息，特别优化了滴滴发票和行程单的解析。
+        文本属于已知版式时只执行该版式模板的字段正则，模板未能解析的字段再使用通用规则
         :param text: 提取的文本
         :return: 解析后的发票信息字典
         """
-        invoice_info = {
-            'invoice_number': self._extract_invoice_number(text),
-            'amount': self._extract_amount(text),
-            'tax_amount': self._extract_tax_amount(text),
-            'date': self._extract_date(text),
-            'type': self._classify_invoice(text)
-        }
+        start = time.perf_counter()
+        parser = _PageParser(self)
+        parser.add_page(text)
+        invoice_info, _, fallbacks = parser.result()
+        parser.record(time.perf_counter() - start, fallbacks)
         return invoice_info
 
-    def _extract_invoice_number(self, text):
+    def _extract_invoice_number(self, text, anchors=None):
         """提取发票编号，针对多种发票格式优化"""
-        # 多种发票常见格式
-        patterns = [
-            # 滴滴行程单/发票常见格式
-            r'订单号[:：]\s*([A-Za-z0-9]+)',
-            r'发票号码[:：]\s*([A-Z0-9]+)',
-            r'发票代码[:：]\s*([A-Z0-9]+)\s*发票号码[:：]\s*([A-Z0-9]+)',
-            r'票据号码[:：]\s*([A-Z0-9]+)',
-            # 滴滴专车/快车行程单
-            r'行程单号[:：]\s*([A-Z0-9]+)',
-            r'订单编号[:：]\s*([A-Z0-9]+)',
-            # 增加更多常见格式
-            r'发票号[:：]\s*([A-Z0-9]+)',
-            r'票号[:：]\s*([A-Z0-9]+)',
-            r'单据号[:：]\s*([A-Z0-9]+)',
-            r'编号[:：]\s*([A-Z0-9]+)',
-            # 针对行程单的增强格式
-            r'序号\s+车型\s+上车时间.*?\n1\s+.*?\s+([A-Z0-9]+)',  # 尝试从行程详情中提取
-            r'订单[\s:：]*([A-Za-z0-9]+)',  # 更宽松的订单号匹配
-            r'共\d+笔行程.*?订单[\s:：]*([A-Za-z0-9]+)'  # 从行程汇总信息中提取
-        ]
-        for pattern in patterns:
-            match = re.search(pattern, text)
-            if match:
-                if len(match.groups()) == 2:
-                    return match.group(2)
-                return match.group(1)
-        return None
+        return self._first_invoice_number(INVOICE_NUMBER_TABLE.matches(text, anchors))
 
-    def _extract_amount(self, text):
+    def _extract_amount(self, text, anchors=None):
         """提取发票金额，针对多种发票格式优化"""
-        # 按优先级排序的金额提取模式
-        patterns = [
-            # 最高优先级：总计金额相关格式
-            r'价税合计[:：]\s*¥?\s*([0-9,.]+)',
-            r'价税合计[:：]\s*([0-9,.]+)\s*元',
-            r'总\s*计[:：]\s*¥?\s*([0-9,.]+)',
-            r'总\s*计[:：]\s*([0-9,.]+)\s*元',
-            r'合计金额[:：]\s*¥?\s*([0-9,.]+)',
-            r'合计金额[:：]\s*([0-9,.]+)\s*元',
-            r'总金额[:：]\s*¥?\s*([0-9,.]+)',
-            r'总金额[:：]\s*([0-9,.]+)',
-            
-            # 第二优先级：实付金额相关格式
-            r'实付金额[:：]\s*¥?\s*([0-9,.]+)',
-            r'实付金额[:：]\s*([0-9,.]+)\s*元',
-            r'实付\s*¥?\s*([0-9,.]+)',
-            r'实付\s*([0-9,.]+)\s*元',
-            
-            # 第三优先级：滴滴行程单特有格式
-            r'共\d+笔行程，\s*合计\s*¥?\s*([0-9,.]+)\s*元',
-            r'共\d+笔行程，\s*合计\s*([0-9,.]+)\s*元',
-            r'支付金额[:：]\s*¥?\s*([0-9,.]+)',
-            r'支付金额[:：]\s*([0-9,.]+)\s*元',
-            r'费用[:：]\s*¥?\s*([0-9,.]+)',
-            r'费用[:：]\s*([0-9,.]+)\s*元',
-            
-            # 第四优先级：其他常见金额格式
-            r'金额[:：]\s*¥?\s*([0-9,.]+)',
-            r'金额[:：]\s*([0-9,.]+)',
-            r'小写金额[:：]\s*¥?\s*([0-9,.]+)',
-            r'小写金额[:：]\s*([0-9,.]+)',
-            r'合计[:：]\s*¥?\s*([0-9,.]+)',
-            r'合计[:：]\s*([0-9,.]+)\s*元',
-            r'总价款[:：]\s*¥?\s*([0-9,.]+)',
-            r'总价款[:：]\s*([0-9,.]+)\s*元',
-            r'应付[:：]\s*¥?\s*([0-9,.]+)',
-            r'应付[:：]\s*([0-9,.]+)\s*元',
-            r'结算金额[:：]\s*¥?\s*([0-9,.]+)',
-            r'结算金额[:：]\s*([0-9,.]+)\s*元',
-            r'消费金额[:：]\s*¥?\s*([0-9,.]+)',
-            r'消费金额[:：]\s*([0-9,.]+)\s*元',
-            
-            # 第五优先级：金额字段格式
-            r'金额\s*\(小写\)[:：]\s*¥?\s*([0-9,.]+)',
-            r'金额\s*\(小写\)[:：]\s*([0-9,.]+)',
-            
-            # 第六优先级：带货币符号的格式
-            r'¥\s*([0-9,.]+)',
-            r'￥\s*([0-9,.]+)',
-            r'¥([0-9,.]+)',
-            r'￥([0-9,.]+)',
-            
-            # 第七优先级：特殊格式
-            r'\s*([0-9,.]+)\s*元\s*$',
-            r'\s*([0-9,.]+)\s*元\s*\*',
-            r'\*\s*([0-9,.]+)\s*元',
-            
-            # 第八优先级：表格中的金额列
-            r'金额\[元\]\s+([0-9,.]+)'
-        ]
-        for pattern in patterns:
-            match = re.search(pattern, text)
-            if match:
-                amount_str = match.group(1).replace(',', '')
-                try:
-                    return float(amount_str)
-                except ValueError:
-                    continue
-        return None
+        return self._first_number(AMOUNT_TABLE.matches(text, anchors))
 
-    def _extract_tax_amount(self, text):
+    def _extract_tax_amount(self, text, anchors=None):
         """提取税额，增强支持多种格式"""
-        patterns = [
-            r'税额[:：]\s*([0-9,.]+)\s*(?:元|¥|￥)',
-            r'税率[:：]\s*\d+%\s*税额[:：]\s*([0-9,.]+)\s*(?:元|¥|￥)',
-            r'税额\(\d+%\):\s*([0-9,.]+)\s*(?:元|¥|￥)',
-            r'增值税额[:：]\s*([0-9,.]+)\s*(?:元|¥|￥)',
-            # 增强更多常见格式
-            r'增值税\s*([0-9,.]+)\s*(?:元|¥|￥)',
-            r'税额\s*=\s*([0-9,.]+)',
-            r'税\s*金[:：]\s*([0-9,.]+)\s*(?:元|¥|￥)',
-            r'税额\s*\(小写\)[:：]\s*([0-9,.]+)',
-            r'(?:¥|￥)\s*([0-9,.]+)\s*\(税\)',
-            r'(?:¥|￥)\s*([0-9,.]+)\s*税',
-            # 针对行程单的增强格式
-            r'税额\[元?\]\s*[:：]?\s*([0-9,.]+)',  
-            r'税费\s*(?:¥|￥)?\s*([0-9,.]+)',
-            r'含税\s*([0-9,.]+)\s*不含税',
-            r'(?:价税合计|总计)[:：]\s*(?:¥|￥)?\s*[0-9,.]+\s*[,，]\s*税额\s*[:：]?\s*(?:¥|￥)?\s*([0-9,.]+)',
-            r'(?:价税合计|总计)[:：]\s*(?:¥|￥)?\s*[0-9,.]+\s*[,，]\s*其中税额\s*[:：]?\s*(?:¥|￥)?\s*([0-9,.]+)',
-            r'税额\s*(?:¥|￥)?\s*([0-9,.]+)\s*[,，]?\s*(?:价税合计|不含税)',
-            r'(?:其中|其中税额)[:：]?\s*(?:¥|￥)?\s*([0-9,.]+)\s*(?:元|¥|￥)?\s*税',
-            r'(?:税|增值税)[:：]?\s*(?:¥|￥)?\s*([0-9,.]+)'
-        ]
-        for pattern in patterns:
-            match = re.search(pattern, text)
-            if match:
-                tax_str = match.group(1).replace(',', '')
-                try:
-                    return float(tax_str)
-                except ValueError:
-                    continue
-        return None
+        return self._first_number(TAX_AMOUNT_TABLE.matches(text, anchors))
 
-    def _extract_date(self, text):
+    def _extract_date(self, text, anchors=None):
         """提取发票日期，增强支持多种格式"""
-        # 多种发票常见日期格式
-        patterns = [
-            # 标准日期格式
-            r'开票日期[:：]\s*([\d]{4}年[\d]{2}月[\d]{2}日)',
-            r'日期[:：]\s*([\d]{4}-[\d]{2}-[\d]{2})',
-            r'([\d]{4}年[\d]{2}月[\d]{2}日)',
-            # 滴滴行程单格式
-            r'出行日期[:：]\s*([\d]{4}-[\d]{2}-[\d]{2})',
-            r'乘车日期[:：]\s*([\d]{4}-[\d]{2}-[\d]{2})',
-            r'订单时间[:：]\s*([\d]{4}-[\d]{2}-[\d]{2})',
-            # 增强更多常见格式
-            r'日期\s*\(DATE\):\s*([\d]{4}-[\d]{2}-[\d]{2})',
-            r'制单日期[:：]\s*([\d]{4}-[\d]{2}-[\d]{2})',
-            r'发生日期[:：]\s*([\d]{4}-[\d]{2}-[\d]{2})',
-            r'交易日期[:：]\s*([\d]{4}-[\d]{2}-[\d]{2})',
-            r'([\d]{8})',  # 如20250814格式
-            r'([\d]{4}/[\d]{2}/[\d]{2})',  # 如2025/08/14格式
-            r'([\d]{2}/[\d]{2}/[\d]{4})'  # 如08/14/2025格式
-        ]
-        for pattern in patterns:
-            match = re.search(pattern, text)
-            if match:
-                date_str = match.group(1)
-                # 转换为标准日期格式
-                try:
-                    if '年' in date_str and '月' in date_str and '日' in date_str:
-                        return datetime.strptime(date_str, '%Y年%m月%d日').date()
-                    elif '-' in date_str:
-                        return datetime.strptime(date_str, '%Y-%m-%d').date()
-                    elif '/' in date_str:
-                        # 尝试不同的斜杠分隔格式
+        return self._first_date(DATE_TABLE.matches(text, anchors))
+
+    @staticmethod
+    def _first_invoice_number(matches):
+        """取第一个匹配中的发票编号，“发票代码+发票号码”格式取号码"""
+        for match in matches:
+            if len(match.groups()) == 2:
+                return match.group(2)
+            return match.group(1)
+        return None
+
+    @staticmethod
+    def _first_number(matches):
+        """取第一个能转换为数字的金额"""
+        for match in matches:
+            amount_str = match.group(1).replace(',', '')
+            try:
+                return float(amount_str)
+            except ValueError:
+                continue
+        return None
+
+    @staticmethod
+    def _first_date(matches):
+        """取第一个能转换为日期的匹配"""
+        for match in matches:
+            date_str = match.group(1)
+            # 转换为标准日期格式
+            try:
+                if '年' in date_str and '月' in date_str and '日' in date_str:
+                    return datetime.strptime(date_str, '%Y年%m月%d日').date()
+                elif '-' in date_str:
+                    return datetime.strptime(date_str, '%Y-%m-%d').date()
+                elif '/' in date_str:
+                    # 尝试不同的斜杠分隔格式
+                    try:
+                        return datetime.strptime(date_str, '%Y/%m/%d').date()
+                    except ValueError:
                         try:
-                            return datetime.strptime(date_str, '%Y/%m/%d').date()
+                            return datetime.strptime(date_str, '%m/%d/%Y').date()
                         except ValueError:
-                            try:
-                                return datetime.strptime(date_str, '%m/%d/%Y').date()
-                            except ValueError:
-                                continue
-                    elif len(date_str) == 8 and date_str.isdigit():
-                        # 处理纯数字格式，如20250814
-                        return datetime.strptime(date_str, '%Y%m%d').date()
-                except ValueError:
-                    continue
+                            continue
+                elif len(date_str) == 8 and date_str.isdigit():
+                    # 处理纯数字格式，如20250814
+                    return datetime.strptime(date_str, '%Y%m%d').date()
+            except ValueError:
+                continue
         return None
 
     def _classify_invoice(self, text):
-        """根据文本内容对发票进行分类，增强分类逻辑"""
-        # 行程单关键词
-        itinerary_keywords = ['行程单', '乘车记录', '出行明细', '行程详情', '乘车凭证', '行程信息']
-        # 电子发票关键词
-        invoice_keywords = ['电子发票', '发票', '增值税电子普通发票', '增值税专用发票', '普通发票']
-        # 滴滴发票关键词
-        didi_keywords = ['滴滴', 'DiDi', 'didi']
-        # 其他常见发票类型关键词
-        taxi_keywords = ['出租车', 'Taxi', 'TAXI']
-        food_keywords = ['餐饮', '餐费', '美食', '饭店', '餐厅', '快餐']
-        transport_keywords = ['交通', '公交', '地铁', '高铁', '火车', '飞机', '机票', '动车']
-        hotel_keywords = ['酒店', '宾馆', '住宿', '旅店']
-        office_keywords = ['办公用品', '办公', '文具', '打印', '复印']
-        travel_keywords = ['差旅费', '差旅', '出差']
-        entertainment_keywords = ['娱乐', 'KTV', '电影', '演出']
-
-        # 检查是否包含关键词
-        for keyword in didi_keywords:
-            if keyword.lower() in text.lower():
-                if any(ik in text for ik in itinerary_keywords):
-                    return '滴滴行程单'
-                elif any(ik in text for ik in invoice_keywords):
-                    return '滴滴电子发票'
-                return '滴滴票据'
-
-        # 出租车发票
-        if any(tk in text for tk in taxi_keywords):
-            if any(ik in text for ik in invoice_keywords):
-                return '出租车发票'
-            elif any(ik in text for ik in itinerary_keywords):
-                return '出租车行程单'
-
-        # 其他类型发票
-        if any(fk in text for fk in food_keywords):
-            return '餐饮发票'
-        elif any(tk in text for tk in transport_keywords):
-            return '交通发票'
-        elif any(hk in text for hk in hotel_keywords):
-            return '住宿发票'
-        elif any(ok in text for ok in office_keywords):
-            return '办公发票'
-        elif any(rk in text for rk in travel_keywords):
-            return '差旅发票'
-        elif any(ek in text for ek in entertainment_keywords):
-            return '娱乐发票'
-        elif any(ik in text for ik in itinerary_keywords):
-            return '行程单'
-        elif any(ik in text for ik in invoice_keywords):
-            return '电子发票'
-        return '其他票据'
-
-    def process_invoice(self, pdf_path):
+        """根据文本内容对发票进行分类，关键词匹配和优先级规则见 InvoiceClassifier"""
+        return self.classifier.classify(text)
+
+    def parse_itinerary_rows(self, text):
         """
-        完整处理发票流程
+        从行程单文本中解析每一笔行程
+        :param text: 行程单文本
+        :return: 行程字典列表，包含序号、车型、上车时间、起点、终点和金额
+        """
+        year_match = ITINERARY_YEAR_PATTERN.search(text)
+        year = int(year_match.group(1)) if year_match else datetime.now().year
+        rows = []
+        for match in ITINERARY_ROW_PATTERN.finditer(text):
+            sequence, vehicle_type, start_time, _city, start_location, end_location, _mileage, amount = match.groups()
+            try:
+                start_time = datetime.strptime(f"{year}-{' '.join(start_time.split())}", '%Y-%m-%d %H:%M')
+                amount = float(amount)
+            except ValueError:
+                continue
+            rows.append({
+                'sequence': int(sequence),
+                'vehicle_type': vehicle_type,
+                'start_time': start_time,
+                'start_location': start_location,
+                'end_location': end_location,
+                'amount': amount
+            })
+        return rows
+
+    def process_invoice(self, pdf_path, full_text=True, content_hash=None):
+        """
+        完整处理发票流程，相同内容的PDF直接使用缓存结果，不再重新解析
         :param pdf_path: PDF发票路径
-        :return: 包含原始文本和解析信息的字典
+        :param full_text: 是否提取全部页面；为False时字段确定后即停止提取，raw_text 只包含已提取的页面，
+                          需要完整文本时调用返回结果中 pages 的 full_text()
+        :param content_hash: 已计算好的文件内容哈希，默认读取文件计算
+        :return: 包含原始文本、解析信息、PDFPages 和提取文本所用后端名称的字典
         """
-        text = self.extract_text_from_pdf(pdf_path)
-        if not text:
-            return None
+        content_hash = content_hash or hash_file(pdf_path)
+        cached = self.cache.get(content_hash, self.parser_version) if self.cache else None
+        if cached:
+            text, invoice_info, backend_name = cached
+            pages = PDFPages.loaded(pdf_path, text, TEXT_BACKENDS.get(backend_name))
+        elif full_text:
+            text, invoice_info, backend_name = self.extract_text(pdf_path)
+            if not text:
+                return None
+            pages = PDFPages.loaded(pdf_path, text, TEXT_BACKENDS[backend_name])
+        else:
+            invoice_info, pages = self.parse_pdf(pdf_path)
+            text = pages.text
+            if not text:
+                return None
+            backend_name = pages.backend.name
+        # 只缓存读取了全部页面的结果，此时解析信息与按完整文本解析的结果相同
+        if not cached and pages.complete and self.cache:
+            self.cache.put(content_hash, self.parser_version, text, invoice_info, backend_name)
 
-        invoice_info = self.parse_invoice_info(text)
         return {
             'raw_text': text,
             'parsed_info': invoice_info,
+            'content_hash': content_hash,
+            'pages': pages,
+            'text_backend': backend_name,
             'processing_date': datetime.now()
         }
\ No newline at end of file
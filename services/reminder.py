@@ -1,10 +1,14 @@
 import schedule
 import time
-from datetime import datetime
+from datetime import datetime, timedelta
+from sqlalchemy import false
 from plyer import notification
-from models.database import get_db, Invoice
+from models.database import session_scope, Invoice
 import threading
 
+# 截止日期前多少天开始提醒
+REMIND_DAYS = 3
+
 class ReminderService:
     """提醒服务，用于定时检查并发送报销提醒"""
     def __init__(self):
@@ -35,22 +39,26 @@ class ReminderService:
             schedule.run_pending()
             time.sleep(60)
 
+    @staticmethod
+    def due_invoice_query(db, today):
+        """今天到期或即将到期的未报销发票"""
+        # 用 false() 生成字面量条件 is_reimbursed = 0，与部分索引 ix_invoices_reminder 的条件一致，
+        # 写成绑定参数时SQLite不会使用该索引
+        return db.query(Invoice).filter(
+            Invoice.is_reimbursed == false(),
+            Invoice.due_date >= today,
+            Invoice.due_date <= today + timedelta(days=REMIND_DAYS)
+        )
+
     def check_reminders(self):
         """检查并发送提醒"""
         try:
-            db = next(get_db())
-            today = datetime.now().date()
-            # 获取今天或即将到期的未报销发票
-            invoices = db.query(Invoice).filter(
-                Invoice.is_reimbursed == False,
-                Invoice.due_date != None,
-                Invoice.due_date >= today
-            ).all()
-
+            # 提醒线程使用自己的会话，WAL模式下不会与界面的读写互相阻塞
+            with session_scope() as db:
+                today = datetime.now().date()
+                invoices = self.due_invoice_query(db, today).all()
             for invoice in invoices:
-                days_until_due = (invoice.due_date - today).days
-                if days_until_due <= 3:
-                    self.send_notification(invoice, days_until_due)
+                self.send_notification(invoice, (invoice.due_date - today).days)
 
         except Exception as e:
             print(f"提醒检查失败: {str(e)}")
@@ -0,0 +1,99 @@
+import os
+import re
+from contextlib import contextmanager
+
+import pdfplumber
+
+# 默认的文本提取后端顺序：先用快速后端，文本质量不合格时回退到 pdfplumber
+DEFAULT_TEXT_BACKENDS = ('pypdfium2', 'pdfplumber')
+
+# 质量检查用的关键标记，提取出的文本（忽略空白）至少要包含其中之一
+QUALITY_MARKERS = ('价税合计', '发票号码', '行程单', '票据号码', '发票代码')
+
+# 字体缺少字符映射时提取出的乱码
+GARBLED_PATTERN = re.compile(r'\(cid:\d+\)|\ufffd')
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def _normalize(text):
+    """统一换行和不换行空格，使各后端的输出与 pdfplumber 一致"""
+    return text.replace('\r\n', '\n').replace('\r', '\n').replace('\xa0', ' ')
+
+
+def has_quality_markers(text):
+    """文本中是否有可读的关键标记，且没有乱码"""
+    if not text or GARBLED_PATTERN.search(text):
+        return False
+    compact = _WHITESPACE.sub('', text)
+    return any(marker in compact for marker in QUALITY_MARKERS)
+
+
+class PdfPlumberBackend:
+    """pdfplumber：逐字符做版面分析，最慢但文本顺序最可靠"""
+    name = 'pdfplumber'
+
+    @contextmanager
+    def open(self, pdf_path):
+        """
+        打开PDF
+        :return: 每页一个的文本读取函数列表，调用时才提取该页文本
+        """
+        with pdfplumber.open(pdf_path) as pdf:
+            yield [lambda page=page: page.extract_text() or '' for page in pdf.pages]
+
+
+class PyPDF2Backend:
+    """PyPDF2：纯Python实现，速度比 pdfplumber 快，但部分发票的文本顺序会被打乱"""
+    name = 'pypdf2'
+
+    @contextmanager
+    def open(self, pdf_path):
+        from PyPDF2 import PdfReader
+        with open(pdf_path, 'rb') as f:
+            reader = PdfReader(f)
+            yield [lambda page=page: _normalize(page.extract_text() or '') for page in reader.pages]
+
+
+class PdfiumBackend:
+    """pypdfium2（pdfplumber 的依赖）：基于PDFium的C实现，速度最快"""
+    name = 'pypdfium2'
+
+    @contextmanager
+    def open(self, pdf_path):
+        import pypdfium2
+
+        pdf = pypdfium2.PdfDocument(pdf_path)
+
+        def read(index):
+            page = pdf[index]
+            text_page = page.get_textpage()
+            try:
+                return _normalize(text_page.get_text_range())
+            finally:
+                text_page.close()
+                page.close()
+
+        try:
+            yield [lambda index=index: read(index) for index in range(len(pdf))]
+        finally:
+            pdf.close()
+
+
+# 可用的文本提取后端，按名称注册
+TEXT_BACKENDS = {backend.name: backend for backend in (PdfiumBackend(), PyPDF2Backend(), PdfPlumberBackend())}
+
+
+def get_text_backends(names=None):
+    """
+    按名称获取文本提取后端列表
+    :param names: 后端名称列表，默认读取环境变量 PDF_TEXT_BACKENDS（逗号分隔），未设置时使用 DEFAULT_TEXT_BACKENDS
+    :return: 后端对象列表，按尝试顺序排列
+    """
+    if names is None:
+        names = [name.strip() for name in os.getenv('PDF_TEXT_BACKENDS', '').split(',') if name.strip()]
+        names = names or DEFAULT_TEXT_BACKENDS
+    unknown = [name for name in names if name not in TEXT_BACKENDS]
+    if unknown:
+        raise ValueError(f"未知的文本提取后端: {', '.join(unknown)}")
+    return [TEXT_BACKENDS[name] for name in names]
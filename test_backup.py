@@ -0,0 +1,179 @@
+import gzip
+import os
+import shutil
+import sqlite3
+import tempfile
+
+from sqlalchemy.orm import sessionmaker
+
+from models.database import Base, Invoice, InvoiceSummary, create_sqlite_engine
+from services.backup import BackupError, BackupService, backup_database, restore_database, verify_database
+from services.invoice_search import build_search_index, search_invoices
+
+
+def _database(tmp_dir, rows=2000):
+    db_path = os.path.join(tmp_dir, 'live.db')
+    engine = create_sqlite_engine(db_path)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    db.add_all([Invoice(invoice_number=str(i), amount=i, recognized_text=f"发票{i}" * 20) for i in range(rows)])
+    db.commit()
+    return db_path, engine, db
+
+
+def _count(db_path, compressed):
+    if compressed:
+        plain_path = db_path + '.plain'
+        with gzip.open(db_path, 'rb') as src, open(plain_path, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        db_path = plain_path
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT count(*) FROM invoices").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_stepped_backup_during_writes():
+    """测试分步备份期间其他连接继续写入，备份得到一致的副本并通过完整性检查，只在WAL文件中的提交也包含在内"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path, engine, db = _database(tmp_dir)
+        steps = []
+
+        def write_during_backup(done, total):
+            steps.append(done)
+            if len(steps) == 2:
+                db.add(Invoice(invoice_number='备份中写入', amount=1))
+                db.commit()
+
+        target = os.path.join(tmp_dir, 'backups', 'a.db.gz')
+        assert backup_database(target, db_path, pages=4, sleep=0, progress=write_during_backup) == target
+        assert len(steps) > 2
+        assert os.listdir(os.path.dirname(target)) == ['a.db.gz']
+        assert _count(target, compressed=True) == 2001
+
+        plain = backup_database(os.path.join(tmp_dir, 'b.db'), db_path)
+        verify_database(plain)
+        assert _count(plain, compressed=False) == 2001
+        db.close()
+        engine.dispose()
+
+
+def test_invalid_backup_rejected():
+    """测试无效的数据库文件校验失败，备份失败时不留下临时文件"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        garbage = os.path.join(tmp_dir, 'garbage.db')
+        with open(garbage, 'wb') as f:
+            f.write(b'not a database' * 100)
+        for path in (garbage, os.path.join(tmp_dir, 'missing.db')):
+            try:
+                verify_database(path)
+            except BackupError:
+                pass
+            else:
+                raise AssertionError("无效的数据库应当校验失败")
+        try:
+            backup_database(os.path.join(tmp_dir, 'out.db.gz'), garbage)
+        except BackupError:
+            pass
+        else:
+            raise AssertionError("备份无效的数据库应当失败")
+        assert sorted(os.listdir(tmp_dir)) == ['garbage.db']
+
+
+def test_scheduled_backup_skips_unchanged_and_rotates():
+    """测试自动备份在数据库没有变化时跳过（包括重新启动程序后），并只保留最新的几个备份"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path, engine, db = _database(tmp_dir, rows=10)
+        backup_dir = os.path.join(tmp_dir, 'backups')
+        service = BackupService(db_path, backup_dir, interval_hours=24, keep=2)
+        paths = [service.backup_if_changed()]
+        assert service.backup_if_changed() is None
+        for i in range(3):
+            db.add(Invoice(invoice_number=f'new{i}'))
+            db.commit()
+            paths.append(service.backup_if_changed())
+        assert all(paths) and len(set(paths)) == 4
+        assert sorted(os.listdir(backup_dir)) == sorted(os.path.basename(path) for path in paths[-2:])
+        assert _count(paths[-1], compressed=True) == 13
+        service.stop()
+
+        # 重新启动程序时数据没有变化，不会多出备份，也不会轮换掉已有的备份
+        for _ in range(3):
+            restarted = BackupService(db_path, backup_dir, interval_hours=24, keep=2)
+            assert restarted.backup_if_changed() is None
+            restarted.stop()
+        assert sorted(name for name in os.listdir(backup_dir) if name.endswith('.gz')) == sorted(
+            os.path.basename(path) for path in paths[-2:]
+        )
+        db.add(Invoice(invoice_number='after_restart'))
+        db.commit()
+        restarted = BackupService(db_path, backup_dir, interval_hours=24, keep=2)
+        path = restarted.backup_if_changed()
+        assert path and _count(path, compressed=True) == 14
+        restarted.stop()
+        db.close()
+        engine.dispose()
+
+
+def test_restore_in_process():
+    """测试在程序运行中恢复备份：打开的会话在下一个事务中读到备份的数据，旧版本的备份升级到当前版本，无效的备份不改动数据库"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path, engine, db = _database(tmp_dir, rows=10)
+        backup = backup_database(os.path.join(tmp_dir, 'a.db.gz'), db_path)
+        db.add(Invoice(invoice_number='备份后写入', amount=1))
+        db.commit()
+        assert db.query(Invoice).count() == 11
+
+        safety_path = restore_database(backup, db_path, engine)
+        # 会话结束恢复前开始的读事务后读到恢复的数据
+        db.close()
+        assert db.query(Invoice).count() == 10
+        assert _count(safety_path, compressed=False) == 11
+        assert sorted(os.listdir(tmp_dir)) == ['a.db.gz', 'live.db', 'live.db-shm', 'live.db-wal', 'live.db.bak']
+        with engine.connect() as connection:
+            assert connection.exec_driver_sql("PRAGMA journal_mode").scalar() == 'wal'
+
+        # 版本号出现之前的数据库
+        legacy = os.path.join(tmp_dir, 'legacy.db')
+        conn = sqlite3.connect(legacy)
+        conn.execute("CREATE TABLE invoices (id INTEGER PRIMARY KEY, invoice_number VARCHAR, pdf_path VARCHAR, "
+                     "amount FLOAT, invoice_date DATE, recognized_text VARCHAR, is_reimbursed BOOLEAN, "
+                     "reimbursement_date DATE, due_date DATE, reminder_date DATETIME, category VARCHAR, "
+                     "category_color VARCHAR, created_at DATETIME, updated_at DATETIME)")
+        conn.execute("INSERT INTO invoices (invoice_number, amount, recognized_text, is_reimbursed) "
+                     "VALUES ('旧版', 5, '旧版 锦江之星', 0)")
+        conn.commit()
+        conn.close()
+        restore_database(legacy, db_path, engine)
+        db.close()
+        assert [invoice.invoice_number for invoice in db.query(Invoice)] == ['旧版']
+        # 迁移前已有的识别文本由 build_search_index 补建索引
+        assert build_search_index(db) == 1
+        assert [invoice_id for invoice_id, _ in search_invoices('锦江', db)] == [1]
+        assert db.query(InvoiceSummary.invoice_count).scalar() == 1
+
+        garbage = os.path.join(tmp_dir, 'garbage.db.gz')
+        with gzip.open(garbage, 'wb') as f:
+            f.write(b'not a database' * 100)
+        other = os.path.join(tmp_dir, 'other.db')
+        sqlite3.connect(other).execute("CREATE TABLE t (x)").connection.close()
+        for path in (garbage, other, os.path.join(tmp_dir, 'missing.db')):
+            try:
+                restore_database(path, db_path, engine)
+            except BackupError:
+                pass
+            else:
+                raise AssertionError("无效的备份应当恢复失败")
+            assert db.query(Invoice).count() == 1
+        assert not any(name.endswith(('.restore', '.restore-journal')) for name in os.listdir(tmp_dir))
+        db.close()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    test_stepped_backup_during_writes()
+    test_invalid_backup_rejected()
+    test_scheduled_backup_skips_unchanged_and_rotates()
+    test_restore_in_process()
+    print("数据库备份测试通过!")
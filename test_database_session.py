@@ -0,0 +1,162 @@
+import os
+import sqlite3
+import tempfile
+import threading
+
+from sqlalchemy import text, update
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+import models.database as database
+from models.database import (
+    Base, Invoice, Itinerary, SessionLocal, create_sqlite_engine, mark_invoices_changed, on_invoices_changed,
+    remove_invoices_listener, session_scope
+)
+
+
+def test_pragmas_applied_on_connect():
+    """测试每个连接都启用WAL并设置同步级别、页缓存和内存映射，环境变量可覆盖默认值"""
+    names = ('SQLITE_SYNCHRONOUS', 'SQLITE_CACHE_SIZE_MB', 'SQLITE_MMAP_SIZE_MB')
+    saved = {name: os.environ.get(name) for name in names}
+    os.environ.pop('SQLITE_SYNCHRONOUS', None)
+    os.environ['SQLITE_CACHE_SIZE_MB'] = '8'
+    os.environ['SQLITE_MMAP_SIZE_MB'] = '0'
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            engine = create_sqlite_engine(os.path.join(tmp_dir, 'test.db'))
+            with engine.connect() as connection:
+                pragma = lambda name: connection.exec_driver_sql(f"PRAGMA {name}").scalar()
+                assert pragma('journal_mode') == 'wal'
+                assert pragma('synchronous') == 1
+                assert pragma('cache_size') == -8192
+                assert pragma('mmap_size') == 0
+            engine.dispose()
+
+            os.environ['SQLITE_SYNCHRONOUS'] = 'FULL'
+            engine = create_sqlite_engine(os.path.join(tmp_dir, 'test.db'))
+            with engine.connect() as connection:
+                assert connection.exec_driver_sql("PRAGMA synchronous").scalar() == 2
+            engine.dispose()
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def test_reader_does_not_block_writer():
+    """测试读事务进行中写入可以立即提交，读事务看到的仍是开始时的数据"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, 'test.db')
+        engine = create_sqlite_engine(db_path)
+        Base.metadata.create_all(bind=engine)
+        # 连接自动开启事务，第一次读取后固定读到的数据版本
+        reader = engine.connect()
+        assert reader.exec_driver_sql("SELECT count(*) FROM invoices").scalar() == 0
+
+        # 超时设为0：写入需要等待读事务时立即失败
+        writer = sqlite3.connect(db_path, timeout=0)
+        writer.execute("INSERT INTO invoices (invoice_number) VALUES ('1')")
+        writer.commit()
+        writer.close()
+
+        assert reader.exec_driver_sql("SELECT count(*) FROM invoices").scalar() == 0
+        reader.rollback()
+        assert reader.exec_driver_sql("SELECT count(*) FROM invoices").scalar() == 1
+        reader.close()
+        engine.dispose()
+
+
+def test_session_scope_per_thread():
+    """测试会话按线程隔离，嵌套时共用外层会话，最外层退出时提交或回滚并关闭会话"""
+    scoped = database.ScopedSession
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            engine = create_sqlite_engine(os.path.join(tmp_dir, 'test.db'))
+            Base.metadata.create_all(bind=engine)
+            database.ScopedSession = scoped_session(sessionmaker(autoflush=False, expire_on_commit=False, bind=engine))
+
+            sessions = {}
+
+            def worker():
+                with session_scope() as db:
+                    sessions['worker'] = db
+                    db.add(Invoice(invoice_number='worker'))
+
+            with session_scope() as db:
+                sessions['main'] = db
+                with session_scope() as inner:
+                    assert inner is db
+                    invoice = Invoice(invoice_number='main')
+                    db.add(invoice)
+                # 内层退出时不提交
+                with engine.connect() as connection:
+                    assert connection.execute(text("SELECT count(*) FROM invoices")).scalar() == 0
+                thread = threading.Thread(target=worker)
+                thread.start()
+                thread.join()
+                assert sessions['worker'] is not db
+
+            try:
+                with session_scope() as db:
+                    assert db is not sessions['main']
+                    db.add(Invoice(invoice_number='failed'))
+                    db.flush()
+                    raise ValueError
+            except ValueError:
+                pass
+
+            with engine.connect() as connection:
+                numbers = {number for number, in connection.execute(text("SELECT invoice_number FROM invoices"))}
+            assert numbers == {'main', 'worker'}
+            # 提交后已加载的属性在会话关闭后仍可读取
+            assert invoice.invoice_number == 'main'
+            engine.dispose()
+    finally:
+        database.ScopedSession = scoped
+
+
+def test_changed_invoices_notified_after_commit():
+    """测试提交后通知这次提交中新增、修改和删除的发票ID，包括行程变化和Core语句登记的发票；回滚时不通知"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine = create_sqlite_engine(os.path.join(tmp_dir, 'test.db'))
+        Base.metadata.create_all(bind=engine)
+        db = SessionLocal(bind=engine)
+        db.add_all([Invoice(invoice_number=str(i)) for i in range(4)])
+        db.commit()
+
+        notified = []
+        listener = on_invoices_changed(notified.append)
+        try:
+            db.get(Invoice, 1).is_reimbursed = True
+            db.delete(db.get(Invoice, 2))
+            db.add(Itinerary(invoice_id=3, sequence=1))
+            db.flush()
+            assert notified == []
+            db.commit()
+            assert notified == [{1, 2, 3}]
+
+            db.execute(update(Invoice).where(Invoice.id == 4).values(category='交通费'))
+            mark_invoices_changed(db, [4])
+            db.get(Invoice, 1).category = '餐饮费'
+            db.flush()
+            db.rollback()
+            db.commit()
+            assert len(notified) == 1
+
+            db.execute(update(Invoice).where(Invoice.id == 4).values(category='交通费'))
+            mark_invoices_changed(db, [4])
+            db.commit()
+            assert notified[1:] == [{4}]
+        finally:
+            remove_invoices_listener(listener)
+        db.close()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    test_pragmas_applied_on_connect()
+    test_reader_does_not_block_writer()
+    test_session_scope_per_thread()
+    test_changed_invoices_notified_after_commit()
+    print("数据库会话测试通过!")
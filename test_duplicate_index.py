@@ -0,0 +1,129 @@
+import os
+import tempfile
+from datetime import date
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from models.database import Base, Invoice, Itinerary
+from services.duplicate_index import backfill_fingerprints, business_key
+from services.invoice_importer import InvoiceImporter, ITINERARY_MARKER
+from services.ocr_processor import OCRProcessor, ITINERARY_TYPES
+
+INVOICE_TEXT = '电子发票 发票号码：12345678 开票日期：2025年08月14日 价税合计（小写）¥15.68'
+ITINERARY_TEXT = (
+    '滴滴出行-行程单\n申请日期：2025-08-14\n'
+    '1 快车 08-13 09:15 周三 上海市 人民广场 虹桥火车站 18.2 15.68\n'
+)
+
+# 实际被解析的文件名，用于确认重复文件没有再次解析
+extracted = []
+
+
+def _text_extract(file_path, content_hash):
+    """把文件内容当作识别文本解析，代替读取PDF"""
+    extracted.append(os.path.basename(file_path))
+    with open(file_path, encoding='utf-8') as f:
+        text = f.read().split('\n#', 1)[0]
+    ocr = OCRProcessor(cache=False)
+    parsed_info = ocr.parse_invoice_info(text)
+    rows = ocr.parse_itinerary_rows(text) if parsed_info['type'] in ITINERARY_TYPES else []
+    return {'raw_text': text, 'parsed_info': parsed_info, 'content_hash': content_hash, 'itinerary_rows': rows}
+
+
+class TextImporter(InvoiceImporter):
+    extract = staticmethod(_text_extract)
+
+
+def _write(tmp_dir, name, text):
+    file_path = os.path.join(tmp_dir, name)
+    with open(file_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    return file_path
+
+
+def _setup(tmp_dir, duplicates='skip'):
+    engine = create_engine(f"sqlite:///{os.path.join(tmp_dir, 'test.db')}")
+    Base.metadata.create_all(bind=engine)
+    importer = TextImporter(workers=1, timeout=0, memory_limit_mb=0, cache=False, duplicates=duplicates,
+                            invoice_dir=os.path.join(tmp_dir, 'invoices'))
+    return sessionmaker(bind=engine)(), importer
+
+
+def test_business_key():
+    """测试业务指纹统一金额格式，缺少字段时不参与判重"""
+    assert business_key('123', 15.6, date(2025, 8, 14)) == '123|15.60|2025-08-14'
+    assert business_key(None, 15.6, date(2025, 8, 14)) is None
+    assert business_key('123', None, date(2025, 8, 14)) is None
+
+
+def test_duplicates_skipped_before_parsing_and_copying():
+    """测试内容相同的文件不再解析，同一张发票换了文件或分类也不会导入第二次"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db, importer = _setup(tmp_dir)
+        first = _write(tmp_dir, 'a.pdf', INVOICE_TEXT)
+        assert importer.batch_import([first], category='交通费', db=db)[:2] == (1, 0)
+        invoice = db.query(Invoice).one()
+        assert invoice.business_key == '12345678|15.68|2025-08-14' and invoice.content_hash
+
+        # 同一文件、另存的相同内容、内容不同但业务指纹相同的文件，以及本次选择中内容相同的两个新文件
+        extracted.clear()
+        copy = _write(tmp_dir, 'copy.pdf', INVOICE_TEXT)
+        renamed = _write(tmp_dir, 'renamed.pdf', INVOICE_TEXT + '\n# 重新下载')
+        other_text = INVOICE_TEXT.replace('12345678', '87654321')
+        other, other_copy = _write(tmp_dir, 'b.pdf', other_text), _write(tmp_dir, 'b2.pdf', other_text)
+        success_count, failed_count, failed_files = importer.batch_import(
+            [first, copy, renamed, other, other_copy], category='差旅', db=db
+        )
+        assert (success_count, failed_count) == (1, 4)
+        assert extracted == ['renamed.pdf', 'b.pdf']
+        assert failed_files[0] == 'b2.pdf: 与 b.pdf 内容相同'
+        assert failed_files[1:] == [f"{name}: 已导入（发票ID {invoice.id}），已跳过"
+                                    for name in ('a.pdf', 'copy.pdf', 'renamed.pdf')]
+        assert db.query(Invoice).count() == 2
+        assert len(os.listdir(os.path.join(tmp_dir, 'invoices', '未报销'))) == 2
+        db.close()
+
+
+def test_merge_updates_category_and_attaches_itinerary():
+    """测试合并模式更新已有发票的分类，并把本次配对的行程单合并到已有发票"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db, importer = _setup(tmp_dir, duplicates='merge')
+        invoice_path = _write(tmp_dir, 'a.pdf', INVOICE_TEXT)
+        importer.batch_import([invoice_path], category='交通费', db=db)
+
+        itinerary_path = _write(tmp_dir, 'a_行程单.pdf', ITINERARY_TEXT)
+        success_count, failed_count, _ = importer.batch_import([invoice_path, itinerary_path], category='差旅', db=db)
+        assert (success_count, failed_count) == (2, 0)
+        invoice = db.query(Invoice).one()
+        assert invoice.category == '差旅'
+        assert ITINERARY_MARKER in invoice.recognized_text
+        assert [row.invoice_id for row in db.query(Itinerary)] == [invoice.id]
+        assert os.path.exists(os.path.splitext(invoice.pdf_path)[0] + '_行程单.pdf')
+        db.close()
+
+
+def test_backfill_fingerprints():
+    """测试为升级前导入的发票补算指纹，文件不存在时只补业务指纹"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db, _ = _setup(tmp_dir)
+        pdf_path = _write(tmp_dir, 'old.pdf', INVOICE_TEXT)
+        db.add_all([
+            Invoice(invoice_number='1', amount=10.0, invoice_date=date(2025, 1, 2), pdf_path=pdf_path),
+            Invoice(invoice_number='2', amount=20.0, invoice_date=date(2025, 1, 3), pdf_path='missing.pdf'),
+        ])
+        db.commit()
+        assert backfill_fingerprints(db, chunk_size=1) == 2
+        first, second = db.query(Invoice).order_by(Invoice.id).all()
+        assert (first.business_key, second.business_key) == ('1|10.00|2025-01-02', '2|20.00|2025-01-03')
+        assert first.content_hash and second.content_hash is None
+        assert backfill_fingerprints(db) == 0
+        db.close()
+
+
+if __name__ == "__main__":
+    test_business_key()
+    test_duplicates_skipped_before_parsing_and_copying()
+    test_merge_updates_category_and_attaches_itinerary()
+    test_backfill_fingerprints()
+    print("重复导入检测测试通过!")
@@ -0,0 +1,92 @@
+import glob
+import os
+import tempfile
+from datetime import date
+
+from services.extraction_cache import ExtractionCache
+from services.ocr_processor import OCRProcessor, PARSER_VERSION
+
+INVOICE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'invoices')
+
+
+def test_cache_round_trip_and_version():
+    """测试缓存读写，解析器版本不同时不命中"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache = ExtractionCache(os.path.join(tmp_dir, 'cache.db'))
+        parsed_info = {'invoice_number': '123', 'amount': 1.5, 'tax_amount': None, 'date': date(2025, 8, 14), 'type': '电子发票'}
+        cache.put('abc', '1', '发票文本', parsed_info)
+        assert cache.get('abc', '1') == ('发票文本', parsed_info, None)
+        cache.put('abc', '1', '发票文本', parsed_info, 'pypdfium2')
+        assert cache.get('abc', '1')[2] == 'pypdfium2'
+        assert cache.get('abc', '2') is None
+        assert cache.get('missing', '1') is None
+        cache.close()
+
+
+def test_cache_evicts_least_recently_used():
+    """测试超出容量后淘汰最久未使用的条目"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache = ExtractionCache(os.path.join(tmp_dir, 'cache.db'), max_entries=10, touch_seconds=0)
+        for index in range(10):
+            cache.put(f'hash{index}', '1', f'文本{index}', {})
+        # 访问最早写入的条目，使它成为最近使用
+        assert cache.get('hash0', '1') is not None
+        cache.put('hash10', '1', '文本10', {})
+        assert cache.get('hash0', '1') is not None
+        assert cache.get('hash1', '1') is None
+        assert cache.get('hash10', '1') is not None
+        cache.close()
+
+        cache = ExtractionCache(os.path.join(tmp_dir, 'bytes.db'), max_bytes=100)
+        cache.put('big', '1', 'x' * 200, {})
+        assert cache.get('big', '1') is None
+        cache.close()
+
+
+def test_cache_hit_touches_rarely():
+    """测试命中时只在距上次记录的使用时间足够久时才写入，其余命中不写数据库"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache = ExtractionCache(os.path.join(tmp_dir, 'cache.db'))
+        cache.put('abc', '1', '发票文本', {})
+        changes = cache._conn.total_changes
+        for _ in range(5):
+            assert cache.get('abc', '1') is not None
+        assert cache._conn.total_changes == changes
+
+        cache.touch_seconds = 0
+        assert cache.get('abc', '1') is not None
+        assert cache._conn.total_changes == changes + 1
+        cache.close()
+
+
+def test_process_invoice_uses_cache():
+    """测试相同内容的PDF第二次处理时不再读取PDF"""
+    pdf_paths = glob.glob(os.path.join(INVOICE_DIR, '*', '*.pdf'))
+    if not pdf_paths:
+        return
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache = ExtractionCache(os.path.join(tmp_dir, 'cache.db'))
+        ocr = OCRProcessor(cache=cache)
+        first = ocr.process_invoice(pdf_paths[0])
+
+        def fail(pdf_path):
+            raise AssertionError("命中缓存时不应读取PDF")
+        ocr.extract_text = fail
+        second = ocr.process_invoice(pdf_paths[0])
+        assert second['raw_text'] == first['raw_text']
+        assert second['parsed_info'] == first['parsed_info']
+        assert cache.get(first['content_hash'], PARSER_VERSION) is not None
+
+        # 自定义关键词表使用独立的缓存版本
+        custom = OCRProcessor(keyword_tables={'food': ['客运服务']}, cache=cache)
+        assert custom.parser_version != PARSER_VERSION
+        assert custom.process_invoice(pdf_paths[0])['parsed_info']['type'] == '滴滴电子发票'
+        cache.close()
+
+
+if __name__ == "__main__":
+    test_cache_round_trip_and_version()
+    test_cache_evicts_least_recently_used()
+    test_cache_hit_touches_rarely()
+    test_process_invoice_uses_cache()
+    print("提取缓存测试通过!")
@@ -0,0 +1,56 @@
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+
+from corpus import load_corpus
+from legacy_ocr import LegacyOCRProcessor
+from services.field_extractor import LiteralScanner, FIELD_ANCHOR_SCANNER
+from services.ocr_processor import OCRProcessor
+
+FIELDS = ('_extract_invoice_number', '_extract_amount', '_extract_tax_amount', '_extract_date')
+
+
+def _mutated_texts(corpus, count=300, seed=20250814):
+    """把语料按行打散重组，覆盖各种规则先后命中的组合"""
+    rng = random.Random(seed)
+    lines = [line for text in corpus.values() for line in text.split('\n')]
+    for _ in range(count):
+        picked = rng.sample(lines, rng.randint(1, 12))
+        yield '\n'.join(picked)
+
+
+def test_scanner_finds_overlapping_literals():
+    """测试扫描器能找到相互包含和首尾交叉的字面量"""
+    scanner = LiteralScanner(['价税合计', '合计金额', '合计', '金额', '税'])
+    assert scanner.scan('价税合计金额') == {'价税合计', '合计金额', '合计', '金额', '税'}
+    assert scanner.scan('合计') == {'合计'}
+    assert scanner.scan('') == set()
+
+
+def test_scanner_matches_substring_checks():
+    """测试一次扫描的结果与逐个 in 判断一致"""
+    corpus = load_corpus(include_pdfs=False)
+    for text in list(corpus.values()) + list(_mutated_texts(corpus)):
+        expected = {literal for literal in FIELD_ANCHOR_SCANNER.literals if literal in text}
+        assert FIELD_ANCHOR_SCANNER.scan(text) == expected
+
+
+def test_fields_match_legacy_extraction():
+    """测试新的字段提取结果与优化前完全一致"""
+    legacy = LegacyOCRProcessor()
+    # 只比较通用规则，版式模板的结果见 test_invoice_templates.py
+    ocr = OCRProcessor(templates=False)
+    corpus = load_corpus()
+    for text in list(corpus.values()) + list(_mutated_texts(corpus)):
+        for name in FIELDS:
+            assert getattr(ocr, name)(text) == getattr(legacy, name)(text), name
+        assert ocr.parse_invoice_info(text) == legacy.parse_invoice_info(text)
+
+
+if __name__ == "__main__":
+    test_scanner_finds_overlapping_literals()
+    test_scanner_matches_substring_checks()
+    test_fields_match_legacy_extraction()
+    print("字段提取测试通过!")
@@ -0,0 +1,88 @@
+import os
+import tempfile
+from datetime import date
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+import services.invoice_actions as invoice_actions
+from models.database import compress_text, Invoice, InvoiceText, Itinerary
+from models.migrations import migrate
+from services.invoice_actions import delete_invoices, set_category, set_due_date, set_reimbursed
+from services.invoice_summary import invoice_totals
+
+
+def _write(path, content):
+    with open(path, 'wb') as f:
+        f.write(content)
+    return path
+
+
+def test_bulk_actions_by_id():
+    """测试按发票ID批量修改和删除：发票编号重复或未识别也不会改错发票，文件在提交后移动和删除"""
+    # 分多条语句执行
+    id_chunk = invoice_actions.ID_CHUNK
+    invoice_actions.ID_CHUNK = 2
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            _check_bulk_actions(tmp_dir)
+    finally:
+        invoice_actions.ID_CHUNK = id_chunk
+
+
+def _check_bulk_actions(tmp_dir):
+    engine = create_engine(f"sqlite:///{os.path.join(tmp_dir, 'test.db')}")
+    migrate(engine)
+    db = sessionmaker(bind=engine)()
+    pending_dir = os.path.join(tmp_dir, '未报销')
+    os.makedirs(pending_dir)
+    pdf = _write(os.path.join(pending_dir, 'a.pdf'), b'invoice a')
+    itinerary = _write(os.path.join(pending_dir, 'a_行程单.pdf'), b'itinerary a')
+    db.execute(insert(Invoice), [
+        {'invoice_number': 'SAME', 'amount': 10.0, 'invoice_date': date(2025, 8, 1), 'invoice_type': '滴滴电子发票',
+         'category': '交通', 'is_reimbursed': False, 'pdf_path': pdf},
+        {'invoice_number': 'SAME', 'amount': 20.0, 'is_reimbursed': False},
+        {'invoice_number': None, 'amount': 30.0, 'is_reimbursed': True},
+        {'invoice_number': None, 'amount': 40.0, 'is_reimbursed': False},
+        {'invoice_number': 'N5', 'amount': 50.0, 'is_reimbursed': False},
+    ])
+    db.execute(insert(Itinerary), [{'invoice_id': 1, 'sequence': 1}, {'invoice_id': 4, 'sequence': 1}])
+    db.add(InvoiceText(invoice_id=4, content=compress_text('行程')))
+    db.commit()
+
+    # 只修改状态改变的发票，文件和行程单移动到指定文件夹
+    done_dir = os.path.join(tmp_dir, '已报销')
+    changed, errors = set_reimbursed(db, [1, 3, 4], True, date(2025, 9, 1), done_dir, tmp_dir)
+    assert (changed, errors) == (2, [])
+    reimbursed = {invoice.id: invoice for invoice in db.query(Invoice).filter(Invoice.is_reimbursed)}
+    assert sorted(reimbursed) == [1, 3, 4]
+    assert reimbursed[4].reimbursement_date == date(2025, 9, 1)
+    new_pdf = reimbursed[1].pdf_path
+    assert os.path.dirname(new_pdf) == done_dir and not os.path.exists(pdf) and not os.path.exists(itinerary)
+    assert sorted(os.listdir(done_dir)) == sorted([os.path.basename(new_pdf),
+                                                   os.path.splitext(os.path.basename(new_pdf))[0] + '_行程单.pdf'])
+    assert invoice_totals(db)['reimbursed_count'] == 3
+
+    assert set_category(db, [2, 5], '餐饮', '#FF9999') == 2
+    assert set_due_date(db, [2, 4, 5], date(2025, 10, 1)) == 3
+    rows = {invoice.id: invoice for invoice in db.query(Invoice)}
+    assert [rows[i].category for i in (1, 2, 5)] == ['交通', '餐饮', '餐饮']
+    assert [rows[i].due_date for i in (1, 2, 5)] == [None, date(2025, 10, 1), date(2025, 10, 1)]
+
+    assert set_reimbursed(db, [1], False, target_dir=pending_dir, base_dir=tmp_dir) == (1, [])
+    assert db.get(Invoice, 1).reimbursement_date is None and os.listdir(done_dir) == []
+
+    # 删除发票时一并删除行程、识别文本和文件
+    deleted, errors = delete_invoices(db, [1, 4, 99])
+    assert (deleted, errors) == (2, [])
+    assert sorted(invoice.id for invoice in db.query(Invoice)) == [2, 3, 5]
+    assert db.query(Itinerary).count() == 0 and db.query(InvoiceText).count() == 0
+    assert os.listdir(pending_dir) == []
+    assert invoice_totals(db)['count'] == 3
+    db.close()
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    test_bulk_actions_by_id()
+    print("批量操作测试通过!")
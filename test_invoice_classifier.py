@@ -0,0 +1,62 @@
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+
+from corpus import load_corpus, make_itinerary_text
+from legacy_ocr import LegacyOCRProcessor
+from services.invoice_classifier import DEFAULT_KEYWORD_TABLES, InvoiceClassifier
+from services.ocr_processor import OCRProcessor
+
+
+def _keyword_texts(seed=20250814, count=500):
+    """随机拼接各类关键词和干扰字符，覆盖各条优先级规则"""
+    rng = random.Random(seed)
+    keywords = [keyword for keywords in DEFAULT_KEYWORD_TABLES.values() for keyword in keywords]
+    noise = ['上海市', '金额', ' ', '\n', 'DIDI', 'Didi', 'dıdı', 'didİ', 'taxi', 'ktv', '行程', '票']
+    for _ in range(count):
+        parts = rng.sample(keywords + noise, rng.randint(0, 6))
+        yield ''.join(parts)
+
+
+def test_classify_matches_legacy():
+    """测试自动机分类结果与优化前完全一致"""
+    legacy = LegacyOCRProcessor()
+    ocr = OCRProcessor()
+    corpus = load_corpus()
+    texts = list(corpus.values()) + list(_keyword_texts())
+    texts.append(make_itinerary_text(trips=300))
+    for text in texts:
+        assert ocr._classify_invoice(text) == legacy._classify_invoice(text), text[:50]
+
+
+def test_ignore_case_only_for_didi():
+    """测试滴滴关键词不区分大小写，出租车关键词区分大小写"""
+    classifier = InvoiceClassifier()
+    assert classifier.classify('DIDI 行程单') == '滴滴行程单'
+    assert classifier.classify('dıdı 行程单') == '行程单'
+    assert classifier.classify('taxi 发票') == '电子发票'
+    assert classifier.classify('Taxi 发票') == '出租车发票'
+
+
+def test_custom_keyword_tables():
+    """测试自定义关键词表"""
+    classifier = InvoiceClassifier({'food': ['咖啡'], 'didi': ['Uber']})
+    assert classifier.classify('星巴克咖啡') == '餐饮发票'
+    assert classifier.classify('饭店') == '其他票据'
+    assert classifier.classify('UBER 发票') == '滴滴电子发票'
+    assert OCRProcessor(keyword_tables={'hotel': ['民宿']}).parse_invoice_info('民宿')['type'] == '住宿发票'
+    try:
+        InvoiceClassifier({'unknown': ['x']})
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("未知类别应当报错")
+
+
+if __name__ == "__main__":
+    test_classify_matches_legacy()
+    test_ignore_case_only_for_didi()
+    test_custom_keyword_tables()
+    print("发票分类测试通过!")
@@ -0,0 +1,285 @@
+import glob
+import os
+import shutil
+import tempfile
+import time
+from datetime import date
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+import models.database as database
+from models.database import Base, Invoice, Itinerary
+from services.duplicate_index import business_key
+from services.extraction_cache import ExtractionCache, hash_file
+from services.invoice_importer import InvoiceImporter, ITINERARY_MARKER, CANCELLED
+from services.ocr_processor import OCRProcessor, ITINERARY_TYPES
+
+INVOICE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'invoices')
+
+
+def _temp_session(tmp_dir):
+    engine = create_engine(f"sqlite:///{os.path.join(tmp_dir, 'test.db')}")
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)()
+
+
+def _fake_result(text):
+    """构造与 extract_file 相同结构的解析结果"""
+    ocr = OCRProcessor(cache=False)
+    parsed_info = ocr.parse_invoice_info(text)
+    rows = ocr.parse_itinerary_rows(text) if parsed_info['type'] in ITINERARY_TYPES else []
+    return {'raw_text': text, 'parsed_info': parsed_info, 'content_hash': None, 'itinerary_rows': rows}
+
+
+def _pathological_extract(file_path, content_hash):
+    """按文件名模拟卡死、内存暴涨和进程崩溃的PDF"""
+    name = os.path.basename(file_path)
+    if name.startswith('hang'):
+        time.sleep(60)
+    elif name.startswith('memory'):
+        bytearray(4 * 1024 * 1024 * 1024)
+    elif name.startswith('crash'):
+        os._exit(3)
+    return {'raw_text': name, 'parsed_info': {}, 'content_hash': content_hash, 'itinerary_rows': []}
+
+
+class PathologicalImporter(InvoiceImporter):
+    extract = staticmethod(_pathological_extract)
+
+
+def _slow_extract(file_path, content_hash):
+    """以 hang 开头的文件解析很久，其余文件解析为发票号码为文件名数字的发票"""
+    name = os.path.basename(file_path)
+    if name.startswith('hang'):
+        time.sleep(60)
+    return _fake_result(f"电子发票 发票号码：1234567{name[2]} 价税合计（小写）¥1{name[2]}.00")
+
+
+class SlowImporter(InvoiceImporter):
+    extract = staticmethod(_slow_extract)
+
+
+def test_extract_files_keeps_order_and_reports_failures():
+    """测试并行解析结果与输入顺序一致，并与逐个解析结果相同"""
+    pdf_paths = glob.glob(os.path.join(INVOICE_DIR, '*', '*.pdf'))
+    if not pdf_paths:
+        return
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_paths = []
+        for index in range(3):
+            file_path = os.path.join(tmp_dir, f'发票{index}.pdf')
+            shutil.copy2(pdf_paths[0], file_path)
+            file_paths.append(file_path)
+        file_paths.insert(1, os.path.join(tmp_dir, '不存在.pdf'))
+
+        progress = []
+        # 解析进程使用临时目录中的提取缓存，不读写项目中的 extraction_cache.db
+        cache = ExtractionCache(os.path.join(tmp_dir, 'cache.db'))
+        pooled = InvoiceImporter(workers=2, cache=cache).extract_files(file_paths, lambda *args: progress.append(args))
+        inline = InvoiceImporter(workers=1, cache=False).extract_files(file_paths)
+        cache.close()
+
+        assert [done for done, _, _, _ in progress] == [1, 2, 3, 4]
+        assert 'error' in pooled[1] and 'error' in inline[1]
+        for index in (0, 2, 3):
+            assert pooled[index] == inline[index]
+            assert pooled[index]['parsed_info']['invoice_number'] == '25317000001901626709'
+
+
+def test_batch_import_single_commit():
+    """测试批量导入在一个事务中写入发票和行程明细，并合并行程单文本"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = _temp_session(tmp_dir)
+        importer = InvoiceImporter(workers=1, invoice_dir=os.path.join(tmp_dir, 'invoices'))
+        invoice_text = '电子发票 发票号码：12345678 价税合计（小写）¥15.68'
+        itinerary_text = (
+            '滴滴出行-行程单\n申请日期：2025-08-14\n'
+            '1 快车 08-13 09:15 周三 上海市 人民广场 虹桥火车站 18.2 15.68\n'
+        )
+        results = {'a.pdf': _fake_result(invoice_text), 'a_行程单.pdf': _fake_result(itinerary_text)}
+        file_paths = []
+        for name, result in results.items():
+            file_path = os.path.join(tmp_dir, name)
+            with open(file_path, 'wb') as f:
+                f.write(name.encode('utf-8'))
+            file_paths.append(file_path)
+        importer.extract_files = lambda paths, progress=None, known=None, cancelled=None: [results[os.path.basename(p)] for p in paths]
+
+        success_count, failed_count, failed_files = importer.batch_import(file_paths, category='交通费', db=db)
+        assert (success_count, failed_count, failed_files) == (2, 0, [])
+        invoices = db.query(Invoice).all()
+        assert len(invoices) == 1
+        assert ITINERARY_MARKER in invoices[0].recognized_text
+        assert os.path.exists(invoices[0].pdf_path)
+        rows = db.query(Itinerary).all()
+        assert [(row.invoice_id, row.amount, row.start_location) for row in rows] == [(invoices[0].id, 15.68, '人民广场')]
+        db.close()
+
+
+def test_batch_import_isolates_failed_file():
+    """测试某个文件写入数据库失败时只跳过该文件并删除它的归档副本，其余发票正常提交"""
+    import services.invoice_store as invoice_store
+
+    def compress_text(text):
+        if '损坏' in text:
+            raise ValueError('无法压缩')
+        return compress(text)
+
+    compress = invoice_store.compress_text
+    invoice_store.compress_text = compress_text
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db = _temp_session(tmp_dir)
+            importer = InvoiceImporter(workers=1, invoice_dir=os.path.join(tmp_dir, 'invoices'))
+            texts = {
+                f'{index}.pdf': f"电子发票 发票号码：1234567{index} 价税合计（小写）¥1{index}.00{' 损坏' if index == 1 else ''}"
+                for index in range(3)
+            }
+            file_paths = []
+            for name in texts:
+                file_path = os.path.join(tmp_dir, name)
+                with open(file_path, 'wb') as f:
+                    f.write(name.encode('utf-8'))
+                file_paths.append(file_path)
+            results = {name: _fake_result(text) for name, text in texts.items()}
+            importer.extract_files = lambda paths, progress=None, known=None, cancelled=None: [results[os.path.basename(p)] for p in paths]
+
+            success_count, failed_count, failed_files = importer.batch_import(file_paths, db=db)
+            assert (success_count, failed_count) == (2, 1)
+            assert failed_files[0].startswith('1.pdf: 保存失败')
+            db.close()
+            db = _temp_session(tmp_dir)
+            assert sorted(invoice.invoice_number for invoice in db.query(Invoice)) == ['12345670', '12345672']
+            archived = glob.glob(os.path.join(tmp_dir, 'invoices', '*', '*.pdf'))
+            assert sorted(path.endswith(('12345670.pdf', '12345672.pdf')) for path in archived) == [True, True]
+            db.close()
+    finally:
+        invoice_store.compress_text = compress
+
+
+def test_batch_import_after_commit_during_parse():
+    """测试解析期间其他会话提交了修改（界面标记报销、删除发票等）时，导入的发票仍能写入，并按提交后的数据判断重复"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp_dir, 'test.db')}")
+        Base.metadata.create_all(bind=engine)
+        Session = sessionmaker(bind=engine)
+        other = Session()
+        other.add_all([
+            Invoice(invoice_number='12345670', amount=10.0, invoice_date=date(2025, 8, 14), is_reimbursed=False,
+                    business_key=business_key('12345670', 10.0, date(2025, 8, 14))),
+            Invoice(invoice_number='99999999', amount=99.0, is_reimbursed=False),
+        ])
+        other.commit()
+        texts = {
+            '0.pdf': '电子发票 发票号码：12345670 开票日期：2025年08月14日 价税合计（小写）¥10.00',
+            '1.pdf': '电子发票 发票号码：12345671 开票日期：2025年08月14日 价税合计（小写）¥11.00',
+        }
+        file_paths = []
+        for name in texts:
+            file_path = os.path.join(tmp_dir, name)
+            with open(file_path, 'wb') as f:
+                f.write(name.encode('utf-8'))
+            file_paths.append(file_path)
+
+        def extract(file_path, content_hash):
+            # 解析第一个文件时另一个会话修改并提交
+            if file_path == file_paths[0]:
+                other.query(Invoice).filter(Invoice.invoice_number == '99999999').update({'is_reimbursed': True})
+                other.commit()
+            result = _fake_result(texts[os.path.basename(file_path)])
+            result['content_hash'] = content_hash
+            return result
+
+        importer = InvoiceImporter(workers=1, timeout=0, memory_limit_mb=0, cache=False,
+                                   invoice_dir=os.path.join(tmp_dir, 'invoices'))
+        importer.extract = extract
+        db = Session()
+        success_count, failed_count, failed_files = importer.batch_import(file_paths, db=db)
+        assert (success_count, failed_count) == (1, 1), failed_files
+        assert failed_files[0].startswith('0.pdf: 已导入')
+        db.close()
+        assert sorted(invoice.invoice_number for invoice in other.query(Invoice)) == ['12345670', '12345671', '99999999']
+        other.close()
+        engine.dispose()
+
+
+def test_pathological_files_are_killed_and_quarantined():
+    """测试超时、内存超限和崩溃的文件被结束、记为失败并隔离，其余文件正常解析"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        names = ['ok1.pdf', 'hang.pdf', 'memory.pdf', 'crash.pdf', 'ok2.pdf']
+        file_paths = []
+        for name in names:
+            file_path = os.path.join(tmp_dir, name)
+            with open(file_path, 'wb') as f:
+                f.write(name.encode('utf-8'))
+            file_paths.append(file_path)
+        cache = ExtractionCache(os.path.join(tmp_dir, 'cache.db'))
+        importer = PathologicalImporter(workers=2, timeout=3, memory_limit_mb=512, cache=cache)
+
+        start = time.monotonic()
+        results = importer.extract_files(file_paths)
+        assert time.monotonic() - start < 30
+        assert [results[0]['raw_text'], results[4]['raw_text']] == ['ok1.pdf', 'ok2.pdf']
+        assert '超时' in results[1]['error']
+        assert '退出码 3' in results[3]['error']
+        if os.name == 'posix':
+            assert '内存' in results[2]['error']
+
+        # 再次导入时直接跳过已隔离的文件
+        start = time.monotonic()
+        again = importer.extract_files(file_paths[1:2])
+        assert time.monotonic() - start < 2
+        assert again[0]['error'].startswith('已隔离')
+        assert '超时' in cache.quarantine_reason(hash_file(file_paths[1]))
+        cache.release_quarantine()
+        assert cache.quarantine_reason(hash_file(file_paths[1])) is None
+        cache.close()
+
+
+def test_cancel_import_commits_finished_files():
+    """测试取消导入时结束正在解析的进程、跳过剩余的文件，已解析的文件写入并提交，被取消的文件不会被隔离"""
+    scoped = database.ScopedSession
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            engine = create_engine(f"sqlite:///{os.path.join(tmp_dir, 'test.db')}")
+            Base.metadata.create_all(bind=engine)
+            database.ScopedSession = scoped_session(sessionmaker(bind=engine))
+            file_paths = []
+            for name in ['ok1.pdf', 'ok2.pdf', 'hang.pdf', 'hang2.pdf', 'ok3.pdf']:
+                file_path = os.path.join(tmp_dir, name)
+                with open(file_path, 'wb') as f:
+                    f.write(name.encode('utf-8'))
+                file_paths.append(file_path)
+            cache = ExtractionCache(os.path.join(tmp_dir, 'cache.db'))
+            importer = SlowImporter(workers=2, timeout=120, memory_limit_mb=0, cache=cache,
+                                    invoice_dir=os.path.join(tmp_dir, 'invoices'))
+            progress = []
+
+            start = time.monotonic()
+            success_count, failed_count, failed_files = importer.import_files(
+                file_paths, pair_itineraries=False, batch_files=3,
+                progress=lambda *args: progress.append(args), cancelled=lambda: len(progress) >= 2
+            )
+            assert time.monotonic() - start < 20
+            assert (success_count, failed_count) == (2, 3)
+            assert sorted(failed_files) == sorted(f"{name}: {CANCELLED}" for name in ['hang.pdf', 'hang2.pdf', 'ok3.pdf'])
+            assert {total for _, total, _, _ in progress} == {5}
+            db = database.ScopedSession()
+            assert sorted(invoice.invoice_number for invoice in db.query(Invoice)) == ['12345671', '12345672']
+            database.ScopedSession.remove()
+            assert cache.quarantine_reason(hash_file(file_paths[2])) is None
+            cache.close()
+            engine.dispose()
+    finally:
+        database.ScopedSession = scoped
+
+
+if __name__ == "__main__":
+    test_extract_files_keeps_order_and_reports_failures()
+    test_pathological_files_are_killed_and_quarantined()
+    test_batch_import_single_commit()
+    test_batch_import_after_commit_during_parse()
+    test_batch_import_isolates_failed_file()
+    test_cancel_import_commits_finished_files()
+    print("批量导入测试通过!")
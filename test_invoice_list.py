@@ -0,0 +1,88 @@
+import os
+import random
+import tempfile
+from datetime import date, timedelta
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from models.database import Invoice, Itinerary
+from models.migrations import migrate
+from services.invoice_list import SORT_COLUMNS, filter_choices, invoice_filters, list_page, list_rows, sort_key
+
+
+def test_pages_follow_ids():
+    """测试按页读取的列表依次覆盖全部发票，删除的发票不会让后面的页重复或漏掉行"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp_dir, 'test.db')}")
+        migrate(engine)
+        db = sessionmaker(bind=engine)()
+        db.execute(insert(Invoice), [{'invoice_number': f'N{i}', 'amount': float(i)} for i in range(1, 26)])
+        db.execute(insert(Itinerary), [{'invoice_id': 3, 'sequence': 1}, {'invoice_id': 3, 'sequence': 2}])
+        db.commit()
+
+        first = list_page(db, limit=10)
+        assert [row.id for row in first] == list(range(1, 11))
+        assert first[2].itinerary_count == 2 and first[0].itinerary_count == 0
+        # 读取下一页之前删除已读取的行
+        db.query(Invoice).filter(Invoice.id.in_([10, 11])).delete()
+        db.commit()
+        second = list_page(db, after=first[-1], limit=10)
+        assert [row.id for row in second] == list(range(12, 22))
+        third = list_page(db, after=second[-1], limit=10)
+        assert [row.id for row in third] == [22, 23, 24, 25]
+        assert list_page(db, after=third[-1], limit=10) == []
+
+        # 搜索结果按给定顺序返回，已删除的发票跳过
+        assert [row.invoice_number for row in list_rows(db, [7, 11, 2])] == ['N7', 'N2']
+        db.close()
+        engine.dispose()
+
+
+def test_sorted_pages_match_order_by():
+    """测试各排序字段升序、降序按页读取的结果与一次性排序相同，含NULL和重复值的行不重复也不遗漏"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp_dir, 'test.db')}")
+        migrate(engine)
+        db = sessionmaker(bind=engine)()
+        rng = random.Random(1)
+        db.execute(insert(Invoice), [{
+            'invoice_number': rng.choice([None, 'A', 'B', f'N{i:03d}']),
+            'amount': rng.choice([None, 10.0, 20.0, float(i)]),
+            'tax_amount': rng.choice([None, 0.6, 1.2]),
+            'invoice_date': rng.choice([None, date(2025, 1, 1) + timedelta(days=i % 7)]),
+            'invoice_type': rng.choice([None, '增值税专用发票', '滴滴电子发票']),
+            'category': rng.choice([None, '交通', '餐饮']),
+            'is_reimbursed': rng.random() < 0.5,
+            'due_date': rng.choice([None, date(2025, 3, 1)]),
+        } for i in range(120)])
+        db.commit()
+
+        for conditions in ({}, {'reimbursed': False, 'amount_min': 10, 'amount_max': 21},
+                           {'category': '交通', 'date_from': date(2025, 1, 2), 'date_to': date(2025, 1, 5)}):
+            filters = invoice_filters(**conditions)
+            for sort in SORT_COLUMNS:
+                for descending in (False, True):
+                    expected = sorted(list_rows(db, range(1, 121), filters),
+                                      key=lambda row: sort_key(row, sort), reverse=descending)
+                    rows, after = [], None
+                    while True:
+                        page = list_page(db, filters, sort, descending, after, limit=7)
+                        rows += page
+                        if len(page) < 7:
+                            break
+                        after = page[-1]
+                    assert [row.id for row in rows] == [row.id for row in expected], (conditions, sort, descending)
+
+        total = list_page(db, invoice_filters(amount_min=20.5), 'total_amount', limit=200)
+        assert total and all(row.total_amount >= 20.5 for row in total)
+        categories, types = filter_choices(db)
+        assert categories == ['交通', '餐饮'] and types == ['增值税专用发票', '滴滴电子发票']
+        db.close()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    test_pages_follow_ids()
+    test_sorted_pages_match_order_by()
+    print("发票列表分页测试通过!")
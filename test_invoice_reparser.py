@@ -0,0 +1,96 @@
+import csv
+import os
+import sys
+import tempfile
+from datetime import date
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+
+from corpus import HOTEL_TEXT, TAXI_RECEIPT_TEXT, make_itinerary_text
+from models.database import Base, Invoice, ReparseCheckpoint
+from services.invoice_importer import ITINERARY_MARKER
+from services.invoice_reparser import InvoiceReparser
+
+
+def _temp_session(tmp_dir, rows):
+    engine = create_engine(f"sqlite:///{os.path.join(tmp_dir, 'test.db')}")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    db.add_all(Invoice(**row) for row in rows)
+    db.commit()
+    return db
+
+
+def _stale_rows(count):
+    """构造识别文本正确、但字段是旧规则结果的发票行，每3行中有1行字段已是最新"""
+    rows = []
+    for index in range(count):
+        if index % 3 == 0:
+            rows.append({'invoice_number': '04823310', 'recognized_text': TAXI_RECEIPT_TEXT, 'amount': 46.0,
+                         'invoice_date': date(2025, 7, 21), 'invoice_type': '出租车发票'})
+        elif index % 3 == 1:
+            rows.append({'invoice_number': 'H1', 'recognized_text': HOTEL_TEXT, 'amount': 1.0,
+                         'tax_amount': None, 'invoice_date': None, 'invoice_type': '其他票据'})
+        else:
+            # 合并了行程单的发票只解析分隔标记之前的发票文本
+            text = f"{TAXI_RECEIPT_TEXT}\n\n{ITINERARY_MARKER}\n{make_itinerary_text(trips=3)}"
+            rows.append({'invoice_number': '04823310', 'recognized_text': text, 'amount': 0.0,
+                         'invoice_date': date(2025, 7, 21), 'invoice_type': '滴滴行程单'})
+    return rows
+
+
+def test_reparse_updates_changed_rows_and_reports():
+    """测试只更新字段有变化的行，并输出差异报告"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = _temp_session(tmp_dir, _stale_rows(30))
+        report_path = os.path.join(tmp_dir, 'report.csv')
+        summary = InvoiceReparser(workers=2, chunk_size=7).run(db=db, report_path=report_path)
+
+        assert (summary['scanned'], summary['changed'], summary['finished']) == (30, 20, True)
+        assert summary['field_changes'] == {'amount': 20, 'tax_amount': 10, 'invoice_date': 10, 'invoice_type': 20}
+        hotel = db.get(Invoice, 2)
+        assert (hotel.amount, hotel.tax_amount, hotel.invoice_date, hotel.invoice_type) == (
+            916.98, 55.02, date(2025, 5, 12), '住宿发票')
+        assert db.get(Invoice, 3).invoice_type == '出租车发票'
+        with open(report_path, encoding='utf-8-sig') as f:
+            lines = list(csv.reader(f))
+        assert lines[0] == ['发票ID', '发票编号', '字段', '原值', '新值']
+        assert len(lines) == 1 + 60
+
+        # 已完成的版本再次运行不会重复处理
+        assert InvoiceReparser(workers=1).run(db=db)['field_changes'] == {}
+        db.close()
+
+
+def test_reparse_resumes_after_interruption():
+    """测试中断后从已提交的批次继续，结果与一次完成相同"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = _temp_session(tmp_dir, _stale_rows(30))
+        report_path = os.path.join(tmp_dir, 'report.csv')
+
+        def interrupt(scanned, changed):
+            if scanned >= 10:
+                raise KeyboardInterrupt
+
+        try:
+            InvoiceReparser(workers=1, chunk_size=5).run(db=db, report_path=report_path, progress=interrupt)
+        except KeyboardInterrupt:
+            pass
+        checkpoint = db.query(ReparseCheckpoint).one()
+        assert (checkpoint.last_invoice_id, checkpoint.finished_at) == (10, None)
+
+        summary = InvoiceReparser(workers=1, chunk_size=5).run(db=db, report_path=report_path)
+        assert (summary['resumed_from'], summary['scanned'], summary['changed']) == (10, 30, 20)
+        with open(report_path, encoding='utf-8-sig') as f:
+            assert len(list(csv.reader(f))) == 1 + 60
+        assert db.query(Invoice).filter(Invoice.invoice_type == '其他票据').count() == 0
+        db.close()
+
+
+if __name__ == "__main__":
+    test_reparse_updates_changed_rows_and_reports()
+    test_reparse_resumes_after_interruption()
+    print("批量重新解析测试通过!")
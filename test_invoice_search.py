@@ -0,0 +1,118 @@
+import os
+import sqlite3
+import tempfile
+
+from sqlalchemy import create_engine, delete, text
+from sqlalchemy.orm import sessionmaker
+
+from models.database import Base, Invoice, compress_text, search_text
+from models.migrations import migrate
+from services.invoice_search import build_search_index, match_query, search_invoices
+
+DIDI_TEXT = '电子发票（普通发票）\n销售方名称：北京小桔科技有限公司\n项目名称：*运输服务*客运服务费\n价税合计（小写）¥45.20'
+HOTEL_TEXT = '电子发票（增值税专用发票）\n销售方名称：上海锦江酒店管理有限公司\n项目名称：*住宿服务*住宿费\n发票号码：25312000000123456789'
+
+
+def _session(tmp_dir):
+    engine = create_engine(f"sqlite:///{os.path.join(tmp_dir, 'test.db')}")
+    Base.metadata.create_all(bind=engine)
+    return engine, sessionmaker(bind=engine)()
+
+
+def test_match_query():
+    """测试搜索词转换为逐字短语，多个词同时匹配，引号被转义"""
+    assert search_text('住宿费 A1') == ' 住  宿  费  A1'
+    assert match_query('住宿 滴滴') == '"住 宿" * AND "滴 滴" *'
+    assert match_query('"锦江') == '""" 锦 江" *'
+    assert match_query('  ') is None
+
+
+def test_search_ranked_with_snippets():
+    """测试触发器随识别文本的新增、修改和删除同步索引，结果按相关度排列并带摘要"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine, db = _session(tmp_dir)
+        didi = Invoice(invoice_number='1', recognized_text=DIDI_TEXT)
+        hotel = Invoice(invoice_number='2', recognized_text=HOTEL_TEXT)
+        other = Invoice(invoice_number='3', recognized_text=HOTEL_TEXT.replace('住宿费', '会议费'))
+        db.add_all([didi, hotel, other])
+        db.commit()
+
+        # 两个字的中文词、多个词和数字前缀
+        assert [invoice_id for invoice_id, _ in search_invoices('服务', db)][0] == didi.id
+        results = search_invoices('住宿', db)
+        assert [invoice_id for invoice_id, _ in results] == [hotel.id, other.id]
+        assert results[0][1].startswith('…') and '项目名称：*【住宿】服务*【住宿】费' in results[0][1]
+        assert [invoice_id for invoice_id, _ in search_invoices('锦江 会议', db)] == [other.id]
+        assert [invoice_id for invoice_id, _ in search_invoices('2531200', db)] == [hotel.id, other.id]
+        assert search_invoices('桔子', db) == []
+
+        # 修改文本后旧内容不再命中
+        didi.recognized_text = DIDI_TEXT.replace('小桔', '橙子')
+        db.commit()
+        assert search_invoices('小桔', db) == []
+        assert [invoice_id for invoice_id, _ in search_invoices('橙子', db)] == [didi.id]
+
+        # 经过ORM和批量删除发票都会删除索引
+        db.delete(hotel)
+        db.execute(delete(Invoice).where(Invoice.id == other.id))
+        db.commit()
+        assert search_invoices('锦江', db) == []
+        assert db.execute(text("SELECT count(*) FROM invoice_search")).scalar() == 1
+        db.close()
+        engine.dispose()
+
+
+def test_build_index_for_existing_texts():
+    """测试迁移前已有的识别文本分批补建索引，中断后从上次的位置继续，迁移后新增的文本已由触发器索引"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, 'test.db')
+        engine, db = _session(tmp_dir)
+        db.add_all([Invoice(invoice_number=str(i), recognized_text=HOTEL_TEXT) for i in range(5)])
+        db.commit()
+        db.close()
+        engine.dispose()
+        # 退回到没有全文索引的版本
+        conn = sqlite3.connect(db_path)
+        conn.executescript("""
+            DROP TABLE invoice_search; DROP TABLE search_index_state;
+            DROP TRIGGER invoice_texts_search_insert; DROP TRIGGER invoice_texts_search_update;
+            DROP TRIGGER invoice_texts_search_delete; DROP TRIGGER invoices_delete_text;
+            PRAGMA user_version = 7;
+        """)
+        conn.close()
+
+        engine = create_engine(f"sqlite:///{db_path}")
+        assert migrate(engine)[0] == '创建全文搜索索引'
+        db = sessionmaker(bind=engine)()
+        db.add(Invoice(invoice_number='new', recognized_text=DIDI_TEXT))
+        db.commit()
+        assert [invoice_id for invoice_id, _ in search_invoices('滴滴 小桔', db)] == []
+        assert [invoice_id for invoice_id, _ in search_invoices('小桔', db)] == [6]
+        assert search_invoices('锦江', db) == []
+
+        class Interrupted(Exception):
+            pass
+
+        def interrupt(done, until):
+            raise Interrupted
+
+        try:
+            build_search_index(db, batch_size=2, progress=interrupt)
+        except Interrupted:
+            pass
+        assert len(search_invoices('锦江', db)) == 2
+        progress = []
+        assert build_search_index(db, batch_size=2, progress=lambda done, until: progress.append(done)) == 3
+        assert progress == [4, 5]
+        assert len(search_invoices('锦江', db, limit=10)) == 5
+        assert len(search_invoices('小桔', db)) == 1
+        assert build_search_index(db) == 0
+        db.close()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    test_match_query()
+    test_search_ranked_with_snippets()
+    test_build_index_for_existing_texts()
+    print("全文搜索测试通过!")
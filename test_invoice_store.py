@@ -0,0 +1,66 @@
+import os
+import tempfile
+from datetime import date, datetime
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from models.database import Base, Invoice, InvoiceText, Itinerary, LIST_COLUMNS
+from services.invoice_store import insert_invoices, invoice_record
+
+
+def _itinerary(sequence):
+    return {'sequence': sequence, 'vehicle_type': '快车', 'start_time': datetime(2025, 8, 13, 9, 15),
+            'start_location': '人民广场', 'end_location': '虹桥火车站', 'amount': 15.68}
+
+
+def test_insert_invoices_isolates_failures():
+    """测试批量写入时出错的记录只回滚自己，其余记录留在同一个未提交的事务中"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp_dir, 'test.db')}")
+        Base.metadata.create_all(bind=engine)
+        db = sessionmaker(bind=engine)()
+
+        def records():
+            result = [
+                invoice_record({'invoice_number': str(i), 'amount': 10.0 + i, 'invoice_date': date(2025, 8, i + 1)},
+                               f"发票{i}", [_itinerary(2), _itinerary(1)] if i == 0 else [])
+                for i in range(6)
+            ]
+            # 识别文本无法压缩、日期不是date对象
+            result[2]['recognized_text'] = b'not text'
+            result[4]['invoice']['invoice_date'] = '2025-08-05'
+            return result
+
+        invoice_ids, errors = insert_invoices(db, records(), batch_size=4)
+        assert sorted(errors) == [2, 4]
+        assert [invoice_id is None for invoice_id in invoice_ids] == [False, False, True, False, True, False]
+        assert [invoice.invoice_number for invoice in db.query(Invoice).order_by(Invoice.id)] == ['0', '1', '3', '5']
+        assert db.query(InvoiceText).count() == 4
+        assert [row.invoice_id for row in db.query(Itinerary)] == [invoice_ids[0], invoice_ids[0]]
+        assert db.get(Invoice, invoice_ids[5]).recognized_text == '发票5'
+
+        # SAVEPOINT不会提前提交外层事务，由调用方决定提交或回滚
+        db.rollback()
+        assert db.query(Invoice).count() == 0
+
+        insert_invoices(db, records())
+        db.commit()
+        db.close()
+        db = sessionmaker(bind=engine)()
+        assert db.query(Invoice).count() == 4
+        invoice = db.get(Invoice, 1)
+        assert invoice.is_reimbursed is False
+        # 行程按序号排列，列表查询直接得到行程数，删除发票时一并删除行程
+        assert [itinerary.sequence for itinerary in invoice.itineraries] == [1, 2]
+        assert [row.itinerary_count for row in db.query(*LIST_COLUMNS).order_by(Invoice.id)] == [2, 0, 0, 0]
+        db.delete(invoice)
+        db.commit()
+        assert db.query(Itinerary).count() == 0
+        db.close()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    test_insert_invoices_isolates_failures()
+    print("批量写入测试通过!")
@@ -0,0 +1,123 @@
+import os
+import sqlite3
+import tempfile
+from collections import defaultdict
+from datetime import date
+
+from sqlalchemy import create_engine, delete, event, update
+from sqlalchemy.orm import sessionmaker
+
+from models.database import Base, Invoice
+from models.migrations import migrate
+from services.invoice_store import insert_invoices, invoice_record
+from services.invoice_summary import invoice_totals, summary_by_month
+
+
+def _expected(db):
+    """直接扫描发票表计算的分类/月份合计，与汇总表对照"""
+    groups = defaultdict(lambda: [0, 0, 0, 0, 0])
+    for invoice in db.query(Invoice):
+        group = groups[(invoice.category or '', invoice.invoice_date.strftime('%Y-%m') if invoice.invoice_date else '')]
+        total = round((invoice.amount or 0) * 100) + round((invoice.tax_amount or 0) * 100)
+        group[0] += 1
+        group[1] += round((invoice.amount or 0) * 100)
+        group[2] += round((invoice.tax_amount or 0) * 100)
+        if invoice.is_reimbursed:
+            group[3] += 1
+            group[4] += total
+    return {key: (count, amount / 100, tax / 100, reimbursed, reimbursed_amount / 100)
+            for key, (count, amount, tax, reimbursed, reimbursed_amount) in groups.items()}
+
+
+def _summary(db):
+    return {
+        (row['category'], row['month']):
+            (row['count'], row['amount'], row['tax_amount'], row['reimbursed_count'], row['reimbursed_amount'])
+        for row in summary_by_month(db)
+    }
+
+
+def test_summary_follows_every_write_path():
+    """测试导入、报销、改分类、重新解析和删除后汇总表都与发票表一致，金额反复增减没有误差"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp_dir, 'test.db')}")
+        Base.metadata.create_all(bind=engine)
+        db = sessionmaker(bind=engine)()
+
+        db.add_all([
+            Invoice(invoice_number='1', amount=0.1, tax_amount=0.01, invoice_date=date(2025, 7, 3), category='交通'),
+            Invoice(invoice_number='2', amount=0.2, invoice_date=date(2025, 7, 20), category='交通'),
+            Invoice(invoice_number='3', amount=None),
+        ])
+        insert_invoices(db, [
+            invoice_record({'invoice_number': str(i), 'amount': 12.34, 'tax_amount': 0.74,
+                            'invoice_date': date(2025, 8, i), 'category': '餐饮'})
+            for i in range(4, 9)
+        ])
+        db.commit()
+        assert _summary(db) == _expected(db)
+        assert _summary(db)[('交通', '2025-07')] == (2, 0.3, 0.01, 0, 0.0)
+
+        invoice = db.query(Invoice).filter(Invoice.invoice_number == '1').one()
+        invoice.is_reimbursed = True
+        invoice.category = '差旅'
+        db.query(Invoice).filter(Invoice.invoice_number == '3').one().invoice_date = date(2025, 9, 1)
+        db.commit()
+        # 重新解析使用批量UPDATE
+        db.execute(update(Invoice), [{'id': 2, 'amount': 0.3}, {'id': 5, 'tax_amount': 1.0}])
+        db.commit()
+        assert _summary(db) == _expected(db)
+
+        db.delete(db.get(Invoice, 1))
+        db.execute(delete(Invoice).where(Invoice.category == '餐饮', Invoice.invoice_number != '4'))
+        db.commit()
+        assert _summary(db) == _expected(db)
+        assert ('差旅', '2025-07') not in _summary(db)
+
+        totals = invoice_totals(db)
+        assert (totals['count'], totals['total_amount'], totals['unreimbursed_count']) == (3, 13.38, 3)
+        assert invoice_totals(db, category='餐饮', month='2025-08')['amount'] == 12.34
+        assert invoice_totals(db, category='无此分类')['count'] == 0
+        db.close()
+        engine.dispose()
+
+
+def test_totals_do_not_scan_invoices_and_backfilled_by_migration():
+    """测试迁移为已有发票计算汇总，合计查询只读取汇总表"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, 'test.db')
+        engine = create_engine(f"sqlite:///{db_path}")
+        Base.metadata.create_all(bind=engine)
+        db = sessionmaker(bind=engine)()
+        db.add_all([Invoice(invoice_number=str(i), amount=i, is_reimbursed=i % 2 == 0, invoice_date=date(2025, i, 1))
+                    for i in range(1, 13)])
+        db.commit()
+        db.close()
+        engine.dispose()
+        # 退回到没有汇总表的版本
+        conn = sqlite3.connect(db_path)
+        conn.executescript("""
+            DROP TABLE invoice_summary; DROP TRIGGER invoices_summary_insert;
+            DROP TRIGGER invoices_summary_update; DROP TRIGGER invoices_summary_delete;
+            PRAGMA user_version = 8;
+        """)
+        conn.close()
+
+        engine = create_engine(f"sqlite:///{db_path}")
+        assert migrate(engine)[0] == '创建分类和月份汇总表'
+        db = sessionmaker(bind=engine)()
+        assert _summary(db) == _expected(db)
+
+        statements = []
+        event.listen(engine, 'before_cursor_execute', lambda conn, cursor, statement, *args: statements.append(statement))
+        totals = invoice_totals(db)
+        assert (totals['count'], totals['reimbursed_count'], totals['reimbursed_amount']) == (12, 6, 42.0)
+        assert statements and all('invoices' not in statement for statement in statements)
+        db.close()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    test_summary_follows_every_write_path()
+    test_totals_do_not_scan_invoices_and_backfilled_by_migration()
+    print("汇总表测试通过!")
@@ -0,0 +1,68 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+
+from corpus import load_corpus, make_itinerary_text
+from services.invoice_templates import DEFAULT_TEMPLATES, InvoiceTemplate, TemplateRegistry
+from services.ocr_processor import OCRProcessor
+
+
+def test_templates_match_generic_rules():
+    """测试各版式模板在语料上的结果与通用规则一致，滴滴电子发票额外解析出税额"""
+    registry = TemplateRegistry(DEFAULT_TEMPLATES)
+    ocr = OCRProcessor(cache=False, templates=registry)
+    generic = OCRProcessor(cache=False, templates=False)
+    corpus = load_corpus()
+    corpus['滴滴行程单(30页)'] = make_itinerary_text(trips=600)
+    for name, text in corpus.items():
+        expected = generic.parse_invoice_info(text)
+        if registry.match(text) is registry.templates[1]:
+            assert expected['tax_amount'] is None
+            expected['tax_amount'] = 3.62
+        assert ocr.parse_invoice_info(text) == expected, name
+
+    hits = {row['name']: row['hits'] for row in registry.report()}
+    assert hits['滴滴行程单'] == 3
+    assert hits['增值税发票'] == 3
+    assert hits['通用规则'] == 1
+    assert sum(row['hit_rate'] for row in registry.report()) == 1
+
+
+def test_template_field_fallback():
+    """测试模板未能解析的字段回退到通用规则，声明为不存在的字段直接为空"""
+    template = InvoiceTemplate('测试', ['测试票据'], {
+        'invoice_number': [r'票号=(\d+)'],
+        'tax_amount': None,
+    })
+    registry = TemplateRegistry([template])
+    ocr = OCRProcessor(cache=False, templates=registry)
+
+    info = ocr.parse_invoice_info('测试票据 票号=123 发票号码：999 金额：10.00 税额：1.00元')
+    assert (info['invoice_number'], info['amount'], info['tax_amount']) == ('123', 10.0, None)
+    info = ocr.parse_invoice_info('测试票据 发票号码：999')
+    assert info['invoice_number'] == '999'
+    assert registry.report()[0]['fallbacks'] == 5
+    assert ocr.parser_version != OCRProcessor(cache=False).parser_version
+
+
+def test_registry_order_and_validation():
+    """测试注册顺序和参数校验"""
+    registry = TemplateRegistry(DEFAULT_TEMPLATES)
+    registry.register(InvoiceTemplate('特殊滴滴', ['滴滴'], {}), before='滴滴行程单')
+    assert registry.match('滴滴出行 行程单').name == '特殊滴滴'
+    for bad in (lambda: registry.register(InvoiceTemplate('特殊滴滴', [], {})),
+                lambda: InvoiceTemplate('错误', [], {'unknown': []})):
+        try:
+            bad()
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("应当报错")
+
+
+if __name__ == "__main__":
+    test_templates_match_generic_rules()
+    test_template_field_fallback()
+    test_registry_order_and_validation()
+    print("版式模板测试通过!")
@@ -0,0 +1,46 @@
+import os
+import tempfile
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from models.database import Base, Invoice, InvoiceText, decompress_text
+
+
+def test_recognized_text_stored_compressed_and_lazy():
+    """测试识别文本压缩存放在 invoice_texts，查询发票列表时不加载，访问时才读取"""
+    text = '电子发票 发票号码：12345678 价税合计（小写）¥15.68\n' * 50
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp_dir, 'test.db')}")
+        Base.metadata.create_all(bind=engine)
+        Session = sessionmaker(bind=engine)
+        db = Session()
+        db.add_all([Invoice(invoice_number='1', recognized_text=text), Invoice(invoice_number='2')])
+        db.commit()
+        db.close()
+
+        db = Session()
+        content = db.query(InvoiceText.content).scalar()
+        assert len(content) < len(text.encode('utf-8')) / 10
+        assert decompress_text(content) == text
+
+        first, second = db.query(Invoice).order_by(Invoice.id).all()
+        assert 'text_record' not in first.__dict__
+        assert first.recognized_text == text
+        assert second.recognized_text is None
+
+        # 修改和清空识别文本，删除发票时一并删除文本
+        first.recognized_text += '备注'
+        second.recognized_text = '手动添加发票'
+        db.commit()
+        assert db.get(Invoice, 1).recognized_text.endswith('备注')
+        db.delete(db.get(Invoice, 1))
+        db.commit()
+        assert db.query(InvoiceText.invoice_id).all() == [(2,)]
+        db.close()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    test_recognized_text_stored_compressed_and_lazy()
+    print("识别文本存储测试通过!")
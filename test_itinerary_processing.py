@@ -1,17 +1,19 @@
 import os
 import shutil
+import tempfile
 from datetime import datetime
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
 from services.invoice_importer import InvoiceImporter
-from models.database import get_db, Invoice, Itinerary
+from models.database import Invoice, Itinerary
+from models.migrations import migrate
 
-def setup_test_environment():
-    """设置测试环境"""
-    # 清理旧的测试数据
-    db = next(get_db())
-    db.query(Itinerary).delete()
-    db.query(Invoice).delete()
-    db.commit()
-    print("已清理数据库中的旧测试数据")
+def setup_test_environment(tmp_dir):
+    """设置测试环境：在临时目录中新建数据库，不改动项目中的 invoice_manager.db"""
+    engine = create_engine(f"sqlite:///{os.path.join(tmp_dir, 'test.db')}")
+    migrate(engine)
+    db = sessionmaker(bind=engine)()
+    print("已创建临时测试数据库")
 
     # 准备测试文件路径
     sample_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sample')
@@ -20,69 +22,49 @@ def setup_test_environment():
         os.path.join(sample_dir, '379员滴滴出行行程报销单.pdf')
     ]
     print(f"测试文件: {[os.path.basename(f) for f in test_files]}")
-    return test_files
+    return engine, db, test_files
 
 def test_itinerary_processing():
     """测试行程单处理功能"""
-    try:
-        # 设置测试环境
-        test_files = setup_test_environment()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine, db, test_files = setup_test_environment(tmp_dir)
+        try:
+            if not all(os.path.exists(file_path) for file_path in test_files):
+                print("测试文件不存在，跳过")
+                return
+            _check_itinerary_processing(db, test_files, os.path.join(tmp_dir, 'invoices'))
+        finally:
+            db.close()
+            engine.dispose()
 
-        # 执行批量导入
-        importer = InvoiceImporter()
-        print("开始批量导入...")
-        success_count, failed_count, failed_files = importer.batch_import(test_files)
-        print(f"导入结果: 成功 {success_count} 个, 失败 {failed_count} 个")
-        if failed_files:
-            print("失败文件列表:")
-            for file in failed_files:
-                print(f"  - {file}")
+def _check_itinerary_processing(db, test_files, invoice_dir):
+    # 执行批量导入，文件归档到临时目录；导入器和解析进程都不使用项目中的提取缓存
+    importer = InvoiceImporter(invoice_dir=invoice_dir, cache=False)
+    print("开始批量导入...")
+    success_count, failed_count, failed_files = importer.batch_import(test_files, db=db)
+    print(f"导入结果: 成功 {success_count} 个, 失败 {failed_count} 个")
+    assert (success_count, failed_count) == (2, 0), failed_files
 
-        # 验证行程单是否被正确处理
-        db = next(get_db())
-        invoices = db.query(Invoice).all()
-        print(f"导入的发票数量: {len(invoices)}")
+    # 验证行程单是否被正确处理：行程单合并到发票中
+    invoices = db.query(Invoice).all()
+    assert len(invoices) == 1
+    invoice = invoices[0]
+    print(f"发票 {invoice.invoice_number} 信息:")
+    print(f"  - 文件路径: {invoice.pdf_path}")
+    print(f"  - 金额: {invoice.amount}")
+    assert '--- 行程单信息 ---' in invoice.recognized_text
 
-        for invoice in invoices:
-            print(f"\n发票 {invoice.invoice_number} 信息:")
-            print(f"  - 文件路径: {invoice.pdf_path}")
-            print(f"  - 金额: {invoice.amount}")
-            print(f"  - 是否包含行程单信息: {'是' if '--- 行程单信息 ---' in invoice.recognized_text else '否'}")
+    # 检查关联的行程
+    itineraries = db.query(Itinerary).filter(Itinerary.invoice_id == invoice.id).all()
+    print(f"  - 关联的行程数量: {len(itineraries)}")
+    for idx, itinerary in enumerate(itineraries, 1):
+        print(f"    {idx}. 车型: {itinerary.vehicle_type}, 时间: {itinerary.start_time}, 起点: {itinerary.start_location}, 终点: {itinerary.end_location}, 金额: {itinerary.amount}")
+    assert itineraries
 
-            # 检查关联的行程
-            itineraries = db.query(Itinerary).filter(Itinerary.invoice_id == invoice.id).all()
-            print(f"  - 关联的行程数量: {len(itineraries)}")
-            if itineraries:
-                print("    行程详情:")
-                for idx, itinerary in enumerate(itineraries, 1):
-                    print(f"    {idx}. 车型: {itinerary.vehicle_type}, 时间: {itinerary.start_time}, 起点: {itinerary.start_location}, 终点: {itinerary.end_location}, 金额: {itinerary.amount}")
-
-        # 检查行程单文件是否存在
-        for invoice in invoices:
-            invoice_dir = os.path.dirname(invoice.pdf_path)
-            invoice_filename = os.path.basename(invoice.pdf_path)
-            invoice_name_without_ext = os.path.splitext(invoice_filename)[0]
-            itinerary_filename = f"{invoice_name_without_ext}_行程单.pdf"
-            itinerary_path = os.path.join(invoice_dir, itinerary_filename)
-            print(f"\n检查行程单文件: {itinerary_path}")
-            if os.path.exists(itinerary_path):
-                print(f"  - 行程单文件存在")
-            else:
-                # 可能添加了时间戳
-                found = False
-                for file in os.listdir(invoice_dir):
-                    if f"{invoice_name_without_ext}_行程单" in file:
-                        print(f"  - 行程单文件存在 (带时间戳): {file}")
-                        found = True
-                        break
-                if not found:
-                    print(f"  - 行程单文件不存在")
-
-        print("\n测试完成!")
-        return True
-    except Exception as e:
-        print(f"测试失败: {str(e)}")
-        return False
+    # 检查行程单文件是否存在，可能添加了时间戳
+    invoice_name_without_ext = os.path.splitext(os.path.basename(invoice.pdf_path))[0]
+    assert any(f"{invoice_name_without_ext}_行程单" in file for file in os.listdir(os.path.dirname(invoice.pdf_path)))
+    print("\n测试完成!")
 
 if __name__ == "__main__":
-    test_itinerary_processing()
\ No newline at end of file
+    test_itinerary_processing()
@@ -0,0 +1,138 @@
+import os
+import sqlite3
+import sys
+import tempfile
+
+import pytest
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+
+import models.migrations as migrations
+from corpus import make_itinerary_text
+from models.database import Base, Invoice, Itinerary
+from models.migrations import SCHEMA_VERSION, migrate
+from services.invoice_importer import ITINERARY_MARKER
+
+# 版本号出现之前的发票表（最初的 create_all 建出的表结构）
+LEGACY_SCHEMA = """
+CREATE TABLE invoices (
+    id INTEGER NOT NULL, invoice_number VARCHAR, pdf_path VARCHAR, amount FLOAT, invoice_date DATE,
+    recognized_text VARCHAR, is_reimbursed BOOLEAN, reimbursement_date DATE, due_date DATE, reminder_date DATETIME,
+    category VARCHAR, category_color VARCHAR, created_at DATETIME, updated_at DATETIME, PRIMARY KEY (id)
+);
+CREATE INDEX ix_invoices_id ON invoices (id);
+CREATE INDEX ix_invoices_invoice_number ON invoices (invoice_number);
+"""
+
+
+def _schema(engine):
+    """{表名: (列名集合, 索引名集合)}"""
+    inspector = inspect(engine)
+    return {
+        table: ({column['name'] for column in inspector.get_columns(table)},
+                {index['name'] for index in inspector.get_indexes(table)})
+        for table in inspector.get_table_names()
+    }
+
+
+def test_migrated_schema_matches_models():
+    """测试从空数据库迁移得到的表结构与模型一致，再次运行不做任何操作"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        migrated = create_engine(f"sqlite:///{os.path.join(tmp_dir, 'migrated.db')}")
+        created = create_engine(f"sqlite:///{os.path.join(tmp_dir, 'created.db')}")
+        assert len(migrate(migrated)) == SCHEMA_VERSION
+        Base.metadata.create_all(bind=created)
+        assert _schema(migrated) == _schema(created)
+        assert migrate(migrated) == []
+        migrated.dispose()
+        created.dispose()
+
+
+def test_legacy_database_upgraded_in_place():
+    """测试旧数据库补齐列和表，保留原有数据并补算指纹"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, 'legacy.db')
+        pdf_path = os.path.join(tmp_dir, 'a.pdf')
+        with open(pdf_path, 'wb') as f:
+            f.write(b'pdf')
+        conn = sqlite3.connect(db_path)
+        conn.executescript(LEGACY_SCHEMA)
+        conn.execute(
+            "INSERT INTO invoices (invoice_number, amount, invoice_date, pdf_path, recognized_text) "
+            "VALUES ('1', 10, '2025-01-02', ?, ?)",
+            (pdf_path, f"发票\n\n{ITINERARY_MARKER}\n{make_itinerary_text(trips=3)}")
+        )
+        # 旧的 migrate_db.py 已经加过的列
+        conn.execute("ALTER TABLE invoices ADD COLUMN tax_amount FLOAT")
+        conn.commit()
+        conn.close()
+
+        engine = create_engine(f"sqlite:///{db_path}")
+        migrate(engine)
+        db = sessionmaker(bind=engine)()
+        invoice = db.query(Invoice).one()
+        assert invoice.recognized_text.startswith(f"发票\n\n{ITINERARY_MARKER}\n")
+        # 合并了行程单文本的旧发票补建了行程记录
+        assert [row.sequence for row in db.query(Itinerary).order_by(Itinerary.sequence)] == [1, 2, 3]
+        db.close()
+        with engine.connect() as connection:
+            row = connection.exec_driver_sql(
+                "SELECT invoice_number, business_key, content_hash, invoice_type FROM invoices"
+            ).one()
+            assert row[:2] == ('1', '1|10.00|2025-01-02')
+            assert row.content_hash and row.invoice_type is None
+            assert connection.exec_driver_sql("PRAGMA user_version").scalar() == SCHEMA_VERSION
+        assert {'itineraries', 'reparse_checkpoints'} <= set(_schema(engine))
+        engine.dispose()
+
+
+def test_failed_step_rolls_back():
+    """测试任一步骤失败时已执行的步骤全部回滚，版本号不变"""
+    def broken(conn):
+        raise RuntimeError('迁移失败')
+
+    saved = migrations.MIGRATIONS, migrations.SCHEMA_VERSION
+    migrations.MIGRATIONS = migrations.MIGRATIONS + [('失败的步骤', broken)]
+    migrations.SCHEMA_VERSION = SCHEMA_VERSION + 1
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            engine = create_engine(f"sqlite:///{os.path.join(tmp_dir, 'test.db')}")
+            with pytest.raises(RuntimeError, match='迁移失败'):
+                migrations.migrate(engine)
+            assert _schema(engine) == {}
+            with engine.connect() as connection:
+                assert connection.exec_driver_sql("PRAGMA user_version").scalar() == 0
+            engine.dispose()
+    finally:
+        migrations.MIGRATIONS, migrations.SCHEMA_VERSION = saved
+
+
+def test_current_version_reads_only_pragma():
+    """测试版本已是最新时启动只执行一条 PRAGMA user_version"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, 'test.db')
+        migrate(create_engine(f"sqlite:///{db_path}"))
+        statements = []
+
+        def connect():
+            conn = sqlite3.connect(db_path)
+            conn.set_trace_callback(statements.append)
+            return conn
+
+        engine = create_engine("sqlite://", creator=connect)
+        # 排除引擎首次连接时 SQLAlchemy 自身执行的语句
+        engine.connect().close()
+        statements.clear()
+        assert migrate(engine) == []
+        assert statements == ['PRAGMA user_version']
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    test_migrated_schema_matches_models()
+    test_legacy_database_upgraded_in_place()
+    test_failed_step_rolls_back()
+    test_current_version_reads_only_pragma()
+    print("数据库迁移测试通过!")
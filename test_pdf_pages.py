@@ -0,0 +1,113 @@
+import glob
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+
+from corpus import HOTEL_TEXT, make_itinerary_text
+from services.ocr_processor import OCRProcessor, PDFPages
+
+INVOICE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'invoices')
+
+
+class FakePages(PDFPages):
+    """用现成的每页文本代替PDF，并记录实际提取了哪些页面"""
+    def __init__(self, page_texts):
+        super().__init__('fake.pdf')
+        self.page_texts = page_texts
+        self.extracted = []
+
+    def _read_pages(self, start):
+        self.page_count = len(self.page_texts)
+        for index in range(start, len(self.page_texts)):
+            self.extracted.append(index)
+            yield self.page_texts[index]
+
+
+def _processor_with_pages(page_texts):
+    ocr = OCRProcessor(cache=False)
+    pages = FakePages(page_texts)
+    ocr.open_pages = lambda pdf_path, backend=None: pages
+    return ocr, pages
+
+
+def test_parse_pdf_stops_after_resolved_page():
+    """测试滴滴行程单第一页即可确定全部字段，剩余页面在需要完整文本时才提取"""
+    text = make_itinerary_text(trips=200, trips_per_page=20)
+    page_texts = text.split('\n\n')
+    ocr, pages = _processor_with_pages(page_texts)
+
+    invoice_info, returned = ocr.parse_pdf('fake.pdf')
+    assert returned is pages
+    assert pages.extracted == [0]
+    assert not pages.complete
+    assert invoice_info == ocr.parse_invoice_info(text)
+
+    assert pages.full_text() == text
+    assert pages.extracted == list(range(len(page_texts)))
+    assert pages.complete
+    assert ocr.parse_itinerary_rows(pages.full_text())[-1]['sequence'] == 200
+
+
+def test_parse_pdf_reads_all_pages_when_unresolved():
+    """测试分类可能被后续页面改变时读取全部页面，结果与完整文本解析相同"""
+    page_texts = [HOTEL_TEXT, '', '备注：滴滴企业版']
+    ocr, pages = _processor_with_pages(page_texts)
+    invoice_info, _ = ocr.parse_pdf('fake.pdf')
+    assert pages.extracted == [0, 1, 2]
+    assert invoice_info == ocr.parse_invoice_info(pages.text)
+    assert invoice_info['type'] == '滴滴电子发票'
+
+
+def test_parse_pdf_waits_for_higher_priority_rules():
+    """测试字段来自低优先级规则时继续读取后续页面，后续页面中优先级更高的规则与完整文本解析一样胜出"""
+    first_page = '滴滴 行程单\n编号：AAA111\n价税合计：10.00\n税额：0.60元\n开票日期：2025年08月01日'
+    ocr, pages = _processor_with_pages([first_page, '其他说明', '订单号：ORDER999'])
+    ocr.templates = False
+    invoice_info, _ = ocr.parse_pdf('fake.pdf')
+    assert pages.extracted == [0, 1, 2]
+    assert invoice_info['invoice_number'] == 'ORDER999'
+    assert invoice_info == ocr.parse_invoice_info(pages.text)
+
+    # 各字段都来自优先级最高的规则时，后续页面不会改变结果
+    ocr, pages = _processor_with_pages([first_page.replace('编号', '订单号'), '订单号：ORDER999'])
+    ocr.templates = False
+    invoice_info, _ = ocr.parse_pdf('fake.pdf')
+    assert pages.extracted == [0]
+    assert invoice_info['invoice_number'] == 'AAA111'
+    assert invoice_info == ocr.parse_invoice_info(pages.full_text())
+
+
+def test_parse_pdf_end_anchored_rule_uses_last_page():
+    """测试限定在文本结尾的规则只在最后一页匹配，与完整文本解析结果相同"""
+    page_texts = ["开票日期：2025年08月14日 发票号码：123\n合计 50.00 元", "说明 100 元 *"]
+    ocr, pages = _processor_with_pages(page_texts)
+    invoice_info, _ = ocr.parse_pdf('fake.pdf')
+    assert pages.extracted == [0, 1]
+    assert invoice_info['amount'] == 100.0
+    assert invoice_info == ocr.parse_invoice_info(pages.text)
+
+    ocr, pages = _processor_with_pages(page_texts)
+    lazy = ocr.process_invoice('fake.pdf', full_text=False, content_hash='fake')
+    assert lazy['parsed_info'] == invoice_info
+
+
+def test_process_invoice_lazy_matches_full():
+    """测试真实PDF按需提取与完整提取的结果相同"""
+    pdf_paths = glob.glob(os.path.join(INVOICE_DIR, '*', '*.pdf'))
+    if not pdf_paths:
+        return
+    ocr = OCRProcessor(cache=False)
+    lazy = ocr.process_invoice(pdf_paths[0], full_text=False)
+    full = ocr.process_invoice(pdf_paths[0])
+    assert lazy['parsed_info'] == full['parsed_info']
+    assert lazy['pages'].full_text() == full['raw_text']
+
+
+if __name__ == "__main__":
+    test_parse_pdf_stops_after_resolved_page()
+    test_parse_pdf_reads_all_pages_when_unresolved()
+    test_parse_pdf_waits_for_higher_priority_rules()
+    test_parse_pdf_end_anchored_rule_uses_last_page()
+    test_process_invoice_lazy_matches_full()
+    print("按页提取测试通过!")
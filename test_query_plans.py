@@ -0,0 +1,99 @@
+import os
+import tempfile
+from datetime import date, timedelta
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from models.database import Invoice, Itinerary, LIST_COLUMNS, TOTAL_AMOUNT
+from models.migrations import migrate
+from services.excel_generator import ExcelGenerator
+from services.invoice_list import invoice_filters
+from services.reminder import ReminderService
+
+ROWS = 100000
+# 提醒查询的当天，第780天有发票到期
+TODAY = date(2020, 1, 1) + timedelta(days=779)
+
+
+def _populate(db):
+    """生成10万张发票，其中约2%未报销且设置了截止日期，每张发票一条行程"""
+    start = date(2020, 1, 1)
+    categories = ['交通费', '餐饮费', '住宿费', '办公费', '其他']
+    invoices = []
+    for index in range(ROWS):
+        pending = index % 50 == 0
+        invoices.append({
+            'invoice_number': f'N{index}',
+            'amount': float(index % 500),
+            'invoice_date': start + timedelta(days=index % 1500),
+            'category': categories[index % len(categories)],
+            'is_reimbursed': not pending,
+            'due_date': start + timedelta(days=index % 1500 + 30) if pending else None,
+        })
+    db.execute(insert(Invoice), invoices)
+    db.execute(insert(Itinerary), [{'invoice_id': index + 1, 'sequence': 1, 'amount': 1.0} for index in range(ROWS)])
+    db.commit()
+
+
+def _plan(db, statement):
+    """EXPLAIN QUERY PLAN 的每一步说明"""
+    compiled = statement.compile(db.get_bind())
+    params = tuple(compiled.params[name] for name in compiled.positiontup)
+    connection = db.connection()
+    return [row[-1] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params)]
+
+
+def test_queries_use_indexes():
+    """测试提醒、分类报表和删除发票的查询在10万行时都通过索引查找，没有全表扫描和临时排序"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp_dir, 'test.db')}")
+        migrate(engine)
+        db = sessionmaker(bind=engine)()
+        _populate(db)
+
+        plans = {
+            'reminder': _plan(db, ReminderService.due_invoice_query(db, TODAY).statement),
+            'category': _plan(db, ExcelGenerator.category_invoice_query(db, '交通费').statement),
+            'itineraries': _plan(db, db.query(Itinerary).filter(Itinerary.invoice_id == 5).statement),
+            'delete': _plan(db, Invoice.__table__.delete().where(Invoice.id == 5)),
+        }
+        for name, steps in plans.items():
+            assert steps, name
+            for step in steps:
+                assert not step.startswith('SCAN'), (name, steps)
+                assert 'TEMP B-TREE' not in step, (name, steps)
+        assert 'ix_invoices_reminder' in plans['reminder'][0]
+        assert 'COVERING INDEX ix_invoices_category_date' in plans['category'][0]
+        assert 'ix_itineraries_invoice_id' in plans['itineraries'][0]
+
+        # 列表查询逐行读取发票，行程数的关联子查询只查索引
+        listing = _plan(db, db.query(*LIST_COLUMNS).statement)
+        assert any('COVERING INDEX ix_itineraries_invoice_id' in step for step in listing), listing
+        assert db.query(*LIST_COLUMNS).filter(Invoice.id == 5).one().itinerary_count == 1
+
+        # 按价税合计、日期排序的列表页沿索引顺序读取，不在临时B树中排序；金额范围筛选在表达式索引中查找
+        sorted_pages = {
+            'total_amount': db.query(*LIST_COLUMNS).order_by(TOTAL_AMOUNT.desc(), Invoice.id.desc()).limit(200),
+            'invoice_date': db.query(*LIST_COLUMNS).filter(*invoice_filters(reimbursed=False))
+            .order_by(Invoice.invoice_date, Invoice.id).limit(200),
+        }
+        for name, query in sorted_pages.items():
+            steps = _plan(db, query.statement)
+            assert f'ix_invoices_{name}' in steps[0], steps
+            assert not any('TEMP B-TREE' in step for step in steps), steps
+        amount_range = _plan(db, db.query(*LIST_COLUMNS).filter(*invoice_filters(amount_min=100, amount_max=101))
+                             .order_by(Invoice.id).limit(200).statement)
+        assert amount_range[0].startswith('SEARCH invoices USING INDEX ix_invoices_total_amount'), amount_range
+
+        # 查询结果符合提醒条件
+        due = ReminderService.due_invoice_query(db, TODAY).all()
+        assert due and all(not invoice.is_reimbursed and 0 <= (invoice.due_date - TODAY).days <= 3
+                           for invoice in due)
+        db.close()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    test_queries_use_indexes()
+    print("查询计划测试通过!")
@@ -0,0 +1,86 @@
+import glob
+import os
+from contextlib import contextmanager
+
+from services.ocr_processor import OCRProcessor
+from services.text_backends import TEXT_BACKENDS, get_text_backends, has_quality_markers
+
+INVOICE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'invoices')
+
+
+class FakeBackend:
+    """返回固定文本的后端，记录被调用的次数"""
+    def __init__(self, name, page_texts):
+        self.name = name
+        self.page_texts = page_texts
+        self.calls = 0
+
+    @contextmanager
+    def open(self, pdf_path):
+        self.calls += 1
+        yield [lambda text=text: text for text in self.page_texts]
+
+
+def test_quality_markers():
+    """测试关键标记检查忽略空白，并识别乱码"""
+    assert has_quality_markers('价 税 合 计 （ 小 写 ）¥124.12')
+    assert not has_quality_markers('合计 124.12')
+    assert not has_quality_markers('发票号码 (cid:12)(cid:34)')
+    assert not has_quality_markers('')
+
+
+def test_fallback_when_fast_text_fails_quality():
+    """测试快速后端的文本缺少字段时回退到下一个后端，并记录实际使用的后端"""
+    good_text = '电子发票\n发票号码：12345678\n开票日期：2025年08月14日\n价税合计（小写）¥15.68'
+    fast = FakeBackend('fast', ['发票号码 :12345678 15.68¥'])
+    slow = FakeBackend('slow', [good_text])
+    ocr = OCRProcessor(cache=False)
+    ocr.text_backends = [fast, slow]
+
+    text, invoice_info, backend_name = ocr.extract_text('fake.pdf')
+    assert (text, backend_name) == (good_text, 'slow')
+    assert invoice_info['invoice_number'] == '12345678'
+
+    invoice_info, pages = ocr.parse_pdf('fake.pdf')
+    assert pages.backend is slow
+    assert invoice_info == ocr.parse_invoice_info(good_text)
+
+    # 快速后端的文本合格时不再调用慢速后端
+    fast.page_texts = [good_text]
+    slow.calls = 0
+    assert ocr.extract_text('fake.pdf')[2] == 'fast'
+    assert slow.calls == 0
+
+
+def test_get_text_backends(monkeypatch):
+    """测试按名称和环境变量选择后端"""
+    monkeypatch.delenv('PDF_TEXT_BACKENDS', raising=False)
+    assert [backend.name for backend in get_text_backends()] == ['pypdfium2', 'pdfplumber']
+    monkeypatch.setenv('PDF_TEXT_BACKENDS', 'pypdf2, pdfplumber')
+    assert [backend.name for backend in get_text_backends()] == ['pypdf2', 'pdfplumber']
+    try:
+        get_text_backends(['unknown'])
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("未知后端应当报错")
+
+
+def test_real_pdf_backends_agree():
+    """测试真实发票用快速后端和 pdfplumber 解析出的字段相同"""
+    pdf_paths = glob.glob(os.path.join(INVOICE_DIR, '*', '*.pdf'))
+    if not pdf_paths:
+        return
+    plumber = OCRProcessor(cache=False, text_backends=['pdfplumber'])
+    default = OCRProcessor(cache=False)
+    result = default.process_invoice(pdf_paths[0])
+    assert result['text_backend'] == 'pypdfium2'
+    assert result['parsed_info'] == plumber.process_invoice(pdf_paths[0])['parsed_info']
+    assert set(TEXT_BACKENDS) == {'pypdfium2', 'pypdf2', 'pdfplumber'}
+
+
+if __name__ == "__main__":
+    test_quality_markers()
+    test_fallback_when_fast_text_fails_quality()
+    test_real_pdf_backends_agree()
+    print("文本提取后端测试通过!")